@@ -0,0 +1,80 @@
+"""
+Benchmark for the entity extraction step of enrich_dataframe.
+
+Compares the row-by-row extract_all path with the column-wise engine
+(extract_entity_columns + classify_defect_column) on data/prod_data.csv
+replicated to the requested size, and checks both give the same output.
+
+Usage:
+    python -m benchmarks.bench_extraction [n_rows ...]
+"""
+
+import sys
+import time
+from typing import Callable, Tuple
+
+import pandas as pd
+
+from src.extraction import (
+    classify_defect_column,
+    clean_dataframe,
+    combine_text_columns,
+    extract_all,
+    extract_entity_columns,
+    load_prod_data,
+)
+
+TEXT_COLS = ['NC description', 'FDefectDesc_EN', 'Fqccomments_EN', 'Root cause of occurrence']
+
+
+def rowwise_extract(texts: pd.Series) -> pd.DataFrame:
+    """The original per-row path: extract_all on every row, then unpack the dicts."""
+    extractions = texts.apply(extract_all)
+    return pd.DataFrame({
+        'machines': extractions.apply(lambda x: ', '.join(x['machines']) if x['machines'] else ''),
+        'nc_codes': extractions.apply(lambda x: ', '.join(x['nc_codes']) if x['nc_codes'] else ''),
+        'operations': extractions.apply(lambda x: ', '.join(x['operations']) if x['operations'] else ''),
+        'defect_type': extractions.apply(lambda x: x['defect_type']),
+    })
+
+
+def columnar_extract(texts: pd.Series) -> pd.DataFrame:
+    result = extract_entity_columns(texts)
+    result['defect_type'] = classify_defect_column(texts)
+    return result
+
+
+def as_sets(frame: pd.DataFrame) -> pd.DataFrame:
+    """Entity lists come from set() in the per-row path, so compare them order-free."""
+    normalized = frame.astype(object)
+    for col in ['machines', 'nc_codes', 'operations']:
+        normalized[col] = normalized[col].map(lambda v: frozenset(filter(None, v.split(', '))))
+    return normalized
+
+
+def timed(fn: Callable, texts: pd.Series) -> Tuple[pd.DataFrame, float]:
+    start = time.perf_counter()
+    result = fn(texts)
+    return result, time.perf_counter() - start
+
+
+def build_texts(n_rows: int) -> pd.Series:
+    df = clean_dataframe(load_prod_data())
+    repeats = -(-n_rows // len(df))
+    df = pd.concat([df] * repeats, ignore_index=True).iloc[:n_rows]
+    return combine_text_columns(df, [c for c in TEXT_COLS if c in df.columns])
+
+
+def run(n_rows: int) -> None:
+    texts = build_texts(n_rows)
+    rowwise, rowwise_s = timed(rowwise_extract, texts)
+    columnar, columnar_s = timed(columnar_extract, texts)
+    same = as_sets(rowwise).equals(as_sets(columnar))
+    print(f"{n_rows:>10,} rows | row-wise {rowwise_s:8.3f}s | column-wise {columnar_s:8.3f}s | "
+          f"speedup {rowwise_s / columnar_s:6.1f}x | identical: {same}")
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,251 @@
+"""
+Benchmark suite for the hot paths, on synthetic NCR exports (benchmarks/synthetic.py).
+
+Cases:
+    enrich_dataframe            clean + entity extraction + categories (serial)
+    enrich_dataframe_parallel   the same, sharded over one process per core
+    categorize_<field>          each CategoryRules.categorize_column
+    dashboard_aggregates        compute_aggregates (all Dashboard charts)
+    cooccurrence_index          CooccurrenceIndex over CORRELATION_FIELDS
+    timeseries_index            TimeSeriesIndex day/week/month rollups
+    early_warning               EarlyWarningDetector fed every NCR in detection order
+    entity_index                EntityIndex build over all entity columns
+    entity_query                100 EntityIndex queries (AND of two kinds, with a date range)
+    entity_matrix               EntityMatrix build from the EntityIndex postings (interned IDs, CSR incidence)
+    entity_cooccurrence         machine x NC code co-occurrence as one sparse product
+    build_context_prompt        full-history context (history capped at PROMPT_HISTORY_ROWS)
+    context_selection           ContextSelector build + select_batch for a 50-row batch
+    build_batch_prediction_prompt
+                                plan_batches + one prompt per micro-batch (PROMPT_ROWS rows)
+    predict_batch_stub          predict_batch end to end with StubGeneration (no API call)
+    clustering_batch            predict_defect_root_action_batch (three sklearn stages)
+
+Each case runs `repeat` times; the best and median times are appended to a JSON-lines
+file with the commit, Python version and host, one line per case and size. With
+--check, each case is compared with the last earlier record of the same case, size
+and host, and the run fails if one is slower by more than --tolerance.
+
+The 10m size keeps the whole synthetic export in memory (tens of GB).
+
+Usage:
+    python -m benchmarks.bench_suite 10k 1m [--repeat 3] [--only enrich,clustering] [--check]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from benchmarks.synthetic import generate_ncrs, parse_size
+from src.clustering import predict_defect_root_action_batch
+from src.cooccurrence import CooccurrenceIndex
+from src.dashboard_data import CORRELATION_FIELDS, compute_aggregates
+from src.early_warning import detect
+from src.entity_index import EntityIndex
+from src.entity_matrix import EntityMatrix
+from src.extraction import available_cpus, clean_dataframe, enrich_dataframe
+from src.generation_stub import StubGeneration
+from src.prediction import (
+    build_batch_prediction_prompt,
+    build_context_prompt,
+    build_context_selector,
+    plan_batches,
+    predict_batch,
+)
+from src.rules import CORRECTIVE_RULES, DEFECT_RULES, FQC_RULES, ROOT_CAUSE_RULES
+from src.schema import apply_schema, read_dtypes
+from src.timeseries import TimeSeriesIndex
+
+DEFAULT_RESULTS_PATH = 'benchmarks/results.jsonl'
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.2
+
+# Row-by-row prompt building is capped so large sizes stay practical
+PROMPT_HISTORY_ROWS = 100_000
+PROMPT_ROWS = 10_000
+STUB_ROWS = 5_000
+BATCH_ROWS = 50
+
+CATEGORIZERS = {
+    'root_cause': (ROOT_CAUSE_RULES, 'Root cause of occurrence'),
+    'corrective': (CORRECTIVE_RULES, 'Corrective actions'),
+    'fqc': (FQC_RULES, 'Fqccomments_EN'),
+    'defect': (DEFECT_RULES, 'FDefectDesc_EN'),
+}
+
+Case = Tuple[int, Callable[[], object]]
+
+
+def build_cases(raw: pd.DataFrame) -> Dict[str, Case]:
+    """{name: (rows processed, fn)} on one synthetic export."""
+    loaded = apply_schema(raw.astype(read_dtypes()))
+    cleaned = clean_dataframe(loaded)
+    enriched = enrich_dataframe(loaded)
+    history = enriched.head(PROMPT_HISTORY_ROWS)
+    selector = build_context_selector(history)
+    batch = raw.head(BATCH_ROWS)
+    to_prompt = raw.head(PROMPT_ROWS)
+    context = selector.select_batch(batch).text
+    entities = EntityIndex.from_dataframe(enriched)
+    machines = entities.values('machine').index[:10].tolist()
+    nc_codes = entities.values('nc_code').index[:10].tolist()
+    first_date = enriched['Date of detection'].min()
+    entity_matrix = EntityMatrix.from_index(entities)
+
+    def entity_queries():
+        for i in range(100):
+            entities.query(
+                {'machine': machines[i % len(machines)], 'nc_code': nc_codes[i % len(nc_codes)]},
+                start=first_date + pd.Timedelta(days=i), end=first_date + pd.Timedelta(days=i + 90),
+            )
+
+    def batch_prompts():
+        for indices in plan_batches(to_prompt, selector.token_budget):
+            build_batch_prediction_prompt(to_prompt.loc[indices], context)
+
+    cases: Dict[str, Case] = {
+        'enrich_dataframe': (len(raw), lambda: enrich_dataframe(loaded, workers=1)),
+        'enrich_dataframe_parallel': (len(raw), lambda: enrich_dataframe(loaded, workers=available_cpus())),
+    }
+    for name, (rules, col) in CATEGORIZERS.items():
+        cases[f'categorize_{name}'] = (len(raw), lambda rules=rules, col=col: rules.categorize_column(cleaned[col]))
+    cases.update({
+        'dashboard_aggregates': (len(raw), lambda: compute_aggregates(enriched)),
+        'cooccurrence_index': (len(raw), lambda: CooccurrenceIndex.from_dataframe(enriched, CORRELATION_FIELDS)),
+        'timeseries_index': (len(raw), lambda: TimeSeriesIndex.from_dataframe(enriched)),
+        'early_warning': (len(raw), lambda: detect(enriched)),
+        'entity_index': (len(raw), lambda: EntityIndex.from_dataframe(enriched)),
+        'entity_query': (100, entity_queries),
+        'entity_matrix': (len(raw), lambda: EntityMatrix.from_index(entities)),
+        'entity_cooccurrence': (len(raw), lambda: entity_matrix.cooccurrence('machine', 'nc_code')),
+        'build_context_prompt': (len(history), lambda: build_context_prompt(history)),
+        'context_selection': (len(history), lambda: build_context_selector(history).select_batch(batch)),
+        'build_batch_prediction_prompt': (len(to_prompt), batch_prompts),
+        'predict_batch_stub': (
+            min(len(raw), STUB_ROWS),
+            lambda: predict_batch(raw.head(STUB_ROWS), context, generation=StubGeneration(), requests_per_second=None),
+        ),
+        'clustering_batch': (len(raw), lambda: predict_defect_root_action_batch(raw)),
+    })
+    return cases
+
+
+def time_case(fn: Callable[[], object], repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def environment() -> Dict[str, str]:
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'host': platform.node(),
+    }
+
+
+def load_results(filepath: str) -> List[Dict]:
+    if not os.path.exists(filepath):
+        return []
+    with open(filepath, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_regressions(records: List[Dict], history: List[Dict], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Cases of records slower than their last record in history (same case, rows, host) by more than tolerance."""
+    baseline = {}
+    for record in history:
+        baseline[(record['case'], record['rows'], record['host'])] = record
+    regressions = []
+    for record in records:
+        previous = baseline.get((record['case'], record['rows'], record['host']))
+        if previous is None:
+            continue
+        ratio = record['seconds'] / previous['seconds'] if previous['seconds'] else 1.0
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{record['case']} ({record['rows']:,} rows): {previous['seconds']:.3f}s -> "
+                f"{record['seconds']:.3f}s ({ratio:.2f}x, baseline {previous['commit']})"
+            )
+    return regressions
+
+
+def run(
+    sizes: List[int],
+    repeat: int = DEFAULT_REPEAT,
+    only: Optional[List[str]] = None,
+    seed: int = 0,
+) -> List[Dict]:
+    """Run the cases on each size; returns one record per case and size."""
+    env = environment()
+    timestamp = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    records = []
+    for size in sizes:
+        raw = generate_ncrs(size, seed)
+        for name, (rows, fn) in build_cases(raw).items():
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            timings = time_case(fn, repeat)
+            record = {
+                'timestamp': timestamp,
+                **env,
+                'case': name,
+                'size': size,
+                'rows': rows,
+                'repeat': repeat,
+                'seconds': min(timings),
+                'median_seconds': statistics.median(timings),
+                'rows_per_second': rows / min(timings) if min(timings) else None,
+            }
+            records.append(record)
+            print(f"{size:>10,} | {name:<30} | {rows:>10,} rows | best {record['seconds']:8.3f}s | "
+                  f"median {record['median_seconds']:8.3f}s | {record['rows_per_second'] or 0:>12,.0f} rows/s")
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths on synthetic NCR exports.')
+    parser.add_argument('sizes', nargs='*', default=['10k'], help='row counts or 10k / 100k / 1m / 10m')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--only', help='comma-separated case name prefixes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=DEFAULT_RESULTS_PATH, help='JSON-lines file the results are appended to')
+    parser.add_argument('--check', action='store_true', help='fail on a regression against the previous results')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='allowed slowdown (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    history = load_results(args.output)
+    records = run([parse_size(s) for s in args.sizes], args.repeat, args.only.split(',') if args.only else None, args.seed)
+    with open(args.output, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    print(f"{len(records)} results appended to {args.output}")
+
+    if args.check:
+        regressions = find_regressions(records, history, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regression")
@@ -0,0 +1,243 @@
+"""
+Synthetic NCR exports with the schema and value distributions of data/prod_data.csv.
+
+Every synthetic row starts from a randomly drawn row of the source export, which
+keeps the joint distribution of part type, NC code, operations, tolerances, root
+cause and corrective action. The identifiers are then redrawn so their cardinality
+grows with the size like a real stream: job orders are numbered, NC codes, machines
+and operators come from pools that mix the observed values with new ones in the same
+format (CO2910, AAAA-02-09, EM1187). Dates of detection are spread over
+DATE_SPAN_DAYS and dates of machining precede them by an observed lag. The free-text
+fields (defect description, QC comments, root cause) are variants of the observed
+texts with their machine IDs, OPxxxx, DA numbers and dates redrawn, about
+`distinct_texts` of them per column, so texts repeat as in the real export.
+
+The output is a raw export: ';'-separated strings with decimal commas and m/d/yy
+dates, ready for load_prod_data / enrich_file.
+
+Usage:
+    python -m benchmarks.synthetic 10k --output data/synthetic_10k.csv
+    python -m benchmarks.synthetic 10m --output data/synthetic_10m.csv --seed 1
+"""
+
+import argparse
+import re
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+SOURCE_PATH = 'data/prod_data.csv'
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+DEFAULT_CHUNK_SIZE = 500_000
+DEFAULT_DISTINCT_TEXTS = 50_000
+DATE_SPAN_DAYS = 3 * 365
+DATE_FORMAT = '%m/%d/%y'
+
+MACHINE_COLUMNS = ['MachineNum of detection', 'MachineNum of occurrence']
+TEXT_COLUMNS = ['FDefectDesc_EN', 'Fqccomments_EN', 'Root cause of occurrence']
+
+_MACHINE_RE = re.compile(r'\b[A-Z]{4}-\d{2}-\d{2}\b')
+_NC_CODE_RE = re.compile(r'\b([A-Z]{2})(\d{4})\b')
+_OPERATION_RE = re.compile(r'\bOP(\d{4})\b')
+_DA_RE = re.compile(r'DA\d{10}')
+_DOT_DATE_RE = re.compile(r'\b20\d{2}\.\d{2}\.\d{2}\b')
+
+
+def parse_size(value: str) -> int:
+    """'10k', '1m', '10m' (see SIZES) or a row count."""
+    return SIZES.get(value.lower()) or int(value.replace('_', ''))
+
+
+def _is_value(value) -> bool:
+    return isinstance(value, str) and value.strip() not in ('', '/', '\\', ',')
+
+
+def _observed(values: pd.Series, keep) -> List[str]:
+    """Distinct values accepted by keep, most frequent first."""
+    return [value for value in values.value_counts().index if keep(value)]
+
+
+def _zipf_weights(n: int, exponent: float = 1.1) -> np.ndarray:
+    """Popularity of the n values of a pool: a few frequent ones and a long tail."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+class NCRProfile:
+    """Value pools and distributions drawn from a source export, sized for n_rows."""
+
+    def __init__(
+        self,
+        source: pd.DataFrame,
+        n_rows: int,
+        seed: int = 0,
+        distinct_texts: int = DEFAULT_DISTINCT_TEXTS,
+    ):
+        rng = np.random.default_rng(seed)
+        self.source = source.reset_index(drop=True)
+        self.columns = list(source.columns)
+
+        # Pools start with the observed values, most frequent first, so they stay the most frequent
+        codes = _observed(source['NC Code'], lambda c: bool(_NC_CODE_RE.fullmatch(c)))
+        self.nc_codes = self._grow_pool(codes, max(len(codes), int(np.sqrt(n_rows) / 2)), rng, self._new_nc_code)
+        # Detection and occurrence machines are different fleets (CCCC-04-xx vs AAAA-02-xx)
+        self.machine_pools = {}
+        for col in MACHINE_COLUMNS:
+            machines = _observed(source[col], lambda m: bool(_MACHINE_RE.fullmatch(m)))
+            if machines:
+                size = max(len(machines), int(np.sqrt(n_rows) / 8))
+                self.machine_pools[col] = self._grow_pool(machines, size, rng, self._new_machine)
+        self.machines = sorted({m for pool in self.machine_pools.values() for m in pool})
+        operators = _observed(source['Operator of detection'], _is_value)
+        self.operators = self._grow_pool(operators, max(len(operators), int(np.sqrt(n_rows))), rng, self._new_operator)
+        self.operations = sorted(set(source['Operation number of detection'].dropna()) | set(source['Operation number of occurrence'].dropna()))
+
+        detected = pd.to_datetime(source['Date of detection'], format=DATE_FORMAT, errors='coerce')
+        machined = pd.to_datetime(source['Date of machining'], format=DATE_FORMAT, errors='coerce')
+        lags = (detected - machined).dt.days.dropna()
+        self.lags = lags[lags >= 0].to_numpy(dtype=np.int64) if (lags >= 0).any() else np.zeros(1, dtype=np.int64)
+        self.last_date = detected.max() if detected.notna().any() else pd.Timestamp('2025-12-31')
+
+        # Free-text variants: about distinct_texts per column, spread over the observed texts
+        distinct_texts = min(distinct_texts, n_rows)
+        self.texts: Dict[str, List[List[str]]] = {}
+        self.text_codes: Dict[str, np.ndarray] = {}
+        for col in TEXT_COLUMNS:
+            codes_, uniques = pd.factorize(source[col])
+            per_text = max(1, distinct_texts // max(len(uniques), 1))
+            self.text_codes[col] = codes_
+            self.texts[col] = [
+                [text] + [self._perturb(text, rng) for _ in range(per_text - 1)] if _is_value(text) else [text]
+                for text in uniques
+            ]
+
+    @staticmethod
+    def _grow_pool(observed: List[str], size: int, rng: np.random.Generator, new_value) -> List[str]:
+        pool = list(observed)
+        seen = set(pool)
+        while len(pool) < size:
+            value = new_value(rng, observed)
+            if value not in seen:
+                seen.add(value)
+                pool.append(value)
+        return pool
+
+    @staticmethod
+    def _new_nc_code(rng: np.random.Generator, observed: List[str]) -> str:
+        prefix = _NC_CODE_RE.fullmatch(observed[rng.integers(len(observed))]).group(1) if observed else 'CO'
+        return f"{prefix}{rng.integers(10000):04d}"
+
+    @staticmethod
+    def _new_machine(rng: np.random.Generator, observed: List[str]) -> str:
+        prefix = observed[rng.integers(len(observed))][:7] if observed else 'AAAA-02'
+        return f"{prefix}-{rng.integers(1, 100):02d}"
+
+    @staticmethod
+    def _new_operator(rng: np.random.Generator, observed: List[str]) -> str:
+        return f"EM{rng.integers(10, 10000)}"
+
+    def _perturb(self, text: str, rng: np.random.Generator) -> str:
+        """text with its identifiers, numbers and dates redrawn."""
+        text = _MACHINE_RE.sub(lambda m: self.machines[rng.integers(len(self.machines))], text)
+        text = _OPERATION_RE.sub(lambda m: f"OP{self.operations[rng.integers(len(self.operations))]}", text)
+        text = _DA_RE.sub(lambda m: f"DA{rng.integers(10**10):010d}", text)
+        day = self.last_date - pd.Timedelta(days=int(rng.integers(DATE_SPAN_DAYS)))
+        return _DOT_DATE_RE.sub(day.strftime('%Y.%m.%d'), text)
+
+    def _pick(self, pool: List[str], n: int, rng: np.random.Generator) -> np.ndarray:
+        return np.asarray(pool, dtype=object)[rng.choice(len(pool), size=n, p=_zipf_weights(len(pool)))]
+
+    def generate(self, start: int, n: int, rng: np.random.Generator) -> pd.DataFrame:
+        """Rows start .. start + n - 1 of the synthetic export."""
+        template = rng.integers(len(self.source), size=n)
+        df = self.source.iloc[template].reset_index(drop=True).astype(object)
+        df.index = pd.RangeIndex(start, start + n)
+
+        # Job orders numbered in row order
+        df['Job order'] = [f"{part}_{number:06d}" for part, number in zip(df['Part type'], range(start + 1, start + n + 1))]
+
+        # NC codes: keep the template's code 80% of the time, otherwise a pool code
+        new_code = rng.random(n) < 0.2
+        codes = df['NC Code'].to_numpy(dtype=object, copy=True)
+        replacement = self._pick(self.nc_codes, n, rng)
+        old_codes = codes.copy()
+        codes[new_code] = replacement[new_code]
+        df['NC Code'] = codes
+        descriptions = df['NC description'].to_numpy(dtype=object, copy=True)
+        df['NC description'] = [
+            d.replace(old, new) if isinstance(d, str) and isinstance(old, str) else d
+            for d, old, new in zip(descriptions, old_codes, codes)
+        ]
+
+        for col, pool in self.machine_pools.items():
+            present = df[col].map(lambda v: isinstance(v, str) and bool(_MACHINE_RE.fullmatch(v))).to_numpy()
+            values = df[col].to_numpy(dtype=object, copy=True)
+            values[present] = self._pick(pool, int(present.sum()), rng)
+            df[col] = values
+        operators = df['Operator of detection'].map(_is_value).to_numpy()
+        values = df['Operator of detection'].to_numpy(dtype=object, copy=True)
+        values[operators] = self._pick(self.operators, int(operators.sum()), rng)
+        df['Operator of detection'] = values
+
+        detected = self.last_date - pd.to_timedelta(rng.integers(DATE_SPAN_DAYS, size=n), unit='D')
+        machined = detected - pd.to_timedelta(self.lags[rng.integers(len(self.lags), size=n)], unit='D')
+        df['Date of detection'] = detected.strftime(DATE_FORMAT)
+        has_machining = df['Date of machining'].notna().to_numpy()
+        df['Date of machining'] = np.where(has_machining, machined.strftime(DATE_FORMAT), None)
+
+        for col in TEXT_COLUMNS:
+            variants = self.texts[col]
+            codes_ = self.text_codes[col][template]
+            choice = rng.random(n)
+            df[col] = [
+                variants[c][int(r * len(variants[c]))] if c >= 0 else None
+                for c, r in zip(codes_, choice)
+            ]
+        return df[self.columns]
+
+
+def load_source(filepath: str = SOURCE_PATH) -> pd.DataFrame:
+    """The source export as raw strings."""
+    return pd.read_csv(filepath, sep=';', dtype=str)
+
+
+def iter_synthetic_ncrs(
+    n_rows: int,
+    seed: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    source: Optional[pd.DataFrame] = None,
+    distinct_texts: int = DEFAULT_DISTINCT_TEXTS,
+) -> Iterator[pd.DataFrame]:
+    """n_rows synthetic NCRs in chunks of chunk_size rows (same seed, same rows)."""
+    profile = NCRProfile(load_source() if source is None else source, n_rows, seed, distinct_texts)
+    for number, start in enumerate(range(0, n_rows, chunk_size)):
+        rng = np.random.default_rng([seed, number])
+        yield profile.generate(start, min(chunk_size, n_rows - start), rng)
+
+
+def generate_ncrs(n_rows: int, seed: int = 0, **kwargs) -> pd.DataFrame:
+    """n_rows synthetic NCRs in one frame, with the columns of the raw export."""
+    return pd.concat(iter_synthetic_ncrs(n_rows, seed, **kwargs))
+
+
+def write_synthetic_ncrs(filepath: str, n_rows: int, seed: int = 0, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Write a synthetic export as ';'-separated CSV, chunk by chunk. Returns the number of rows."""
+    rows = 0
+    for chunk in iter_synthetic_ncrs(n_rows, seed, chunk_size):
+        chunk.to_csv(filepath, sep=';', index=False, mode='w' if rows == 0 else 'a', header=rows == 0)
+        rows += len(chunk)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic NCR export shaped like data/prod_data.csv.')
+    parser.add_argument('size', help="number of rows, or one of " + ', '.join(SIZES))
+    parser.add_argument('--output', help='CSV file to write (default: data/synthetic_<size>.csv)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNK_SIZE, help='rows generated at a time (bounds memory)')
+    args = parser.parse_args()
+
+    output = args.output or f"data/synthetic_{args.size.lower()}.csv"
+    rows = write_synthetic_ncrs(output, parse_size(args.size), args.seed, args.chunksize)
+    print(f"{rows} rows written to {output}")
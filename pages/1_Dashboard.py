@@ -1,30 +1,42 @@
 import streamlit as st
-import pandas as pd
-from src.extraction import load_prod_data, enrich_dataframe
+from src.dashboard_data import get_dashboard_data
 
 st.set_page_config(page_title="📊 Dashboard", page_icon="📊", layout="wide")
 
 st.title("📊 Dashboard")
 st.subheader("NCR Charts, may help you find patterns the AI cannot find")
 
-df = load_prod_data()
-enriched_df = enrich_dataframe(df)
-
-st.success(f"Total NCRs: {len(enriched_df)}")
+data = get_dashboard_data()
+aggregates = data.aggregates
+
+st.success(f"Total NCRs: {len(data)}")
+
+alerts = data.alerts()
+if not alerts.empty:
+    st.subheader("🚨 Early Warnings")
+    st.caption("NC Code / machine / operation combinations that spike above their usual rate or keep coming back.")
+    kinds = st.multiselect("Alert types", ["spike", "recurrence"], default=["spike", "recurrence"])
+    latest = alerts[alerts['kind'].isin(kinds)].head(50)
+    counts = data.alert_counts()
+    total = sum(counts.values())
+    listed = f" (latest {len(alerts)} listed)" if len(alerts) < total else ""
+    st.warning(
+        f"{total} alerts: {counts['spike']} spikes, {counts['recurrence']} recurrences{listed}. "
+        f"Latest on {alerts['date'].max():%Y-%m-%d}"
+    )
+    st.dataframe(latest, use_container_width=True, hide_index=True)
 
 col1, col2 = st.columns(2)
 with col1:
     st.subheader("🏭 Top Defective Machines")
     st.caption("Which machines produce the most defects? Focus maintenance efforts here.")
-    machine_counts = enriched_df['MachineNum of detection'].dropna().value_counts().head(10).reset_index()
-    machine_counts.columns = ['Machine', 'NCR Count']
+    machine_counts = aggregates['machines']
     st.bar_chart(machine_counts.set_index('Machine'))
 
 with col2:
     st.subheader("🔧 Top NC Codes")
     st.caption("Most frequent non-conformance codes. Reveals recurring defect types.")
-    nc_counts = enriched_df['NC Code'].value_counts().head(10).reset_index()
-    nc_counts.columns = ['NC Code', 'Count']
+    nc_counts = aggregates['nc_codes']
     st.bar_chart(nc_counts.set_index('NC Code'))
 
 col3, col4 = st.columns(2)
@@ -32,56 +44,106 @@ col3, col4 = st.columns(2)
 with col3:
     st.subheader("📦 Defects by Part Type")
     st.caption("Which parts fail most often? May indicate design or supplier issues.")
-    part_counts = enriched_df['Part type'].value_counts().reset_index()
-    part_counts.columns = ['Part Type', 'NCR Count']
+    part_counts = aggregates['part_types']
     st.bar_chart(part_counts.set_index('Part Type'))
 
 with col4:
     st.subheader("📅 NCR Trend Over Time")
     st.caption("Track defect volume over time. Spikes may indicate process changes.")
-    dates = pd.to_datetime(df['Date of detection'], format='%m/%d/%y', errors='coerce')
-    trend = dates.dropna().dt.date.value_counts().sort_index().reset_index()
-    trend.columns = ['Date', 'Count']
-    st.line_chart(trend.set_index('Date'))
+    trend_col1, trend_col2 = st.columns(2)
+    with trend_col1:
+        granularity = st.radio("Granularity", ["Day", "Week", "Month"], horizontal=True)
+    with trend_col2:
+        breakdown = st.selectbox("Break down by", ["(none)"] + data.trend_dimensions)
+    by = breakdown if breakdown != "(none)" else None
+    st.line_chart(data.trend(granularity.lower(), by, top=5))
+
+st.subheader("⏳ Machining-to-Detection Lag")
+st.caption("Days between machining and detection. A growing lag means defects escape further down the line.")
+lag_col1, lag_col2 = st.columns(2)
+with lag_col1:
+    st.line_chart(data.lag_trend(granularity.lower())['Mean lag (days)'])
+with lag_col2:
+    lag_by = st.selectbox("Mean lag by", data.trend_dimensions) if data.trend_dimensions else None
+    if lag_by:
+        st.dataframe(data.timeseries.lag_by(lag_by).head(15), use_container_width=True, hide_index=True)
 
 col5, col6 = st.columns(2)
 
 with col5:
     st.subheader("🔍 Root Cause Categories")
     st.caption("AI-extracted root cause themes. Shows systemic issues.")
-    root_cause_cats = enriched_df['root_cause_category'].value_counts().reset_index()
-    root_cause_cats.columns = ['Category', 'Count']
+    root_cause_cats = aggregates['root_cause_categories']
     st.bar_chart(root_cause_cats.set_index('Category'))
 
 with col6:
     st.subheader("🛠️ Corrective Action Categories")
     st.caption("Types of fixes applied. Helps standardize responses.")
-    corrective_cats = enriched_df['corrective_category'].value_counts().reset_index()
-    corrective_cats.columns = ['Category', 'Count']
+    corrective_cats = aggregates['corrective_categories']
     st.bar_chart(corrective_cats.set_index('Category'))
 
 st.subheader("📋 QA Comment Categories")
 st.caption("Themes from QA comments. Reveals inspector concerns.")
-fqc_cats = enriched_df['fqc_category'].value_counts().reset_index()
-fqc_cats.columns = ['Category', 'Count']
-fqc_cats = fqc_cats[~fqc_cats['Category'].str.lower().isin(['undefined'])]
+fqc_cats = aggregates['fqc_categories']
 st.dataframe(fqc_cats, use_container_width=True, hide_index=True)
 
+st.subheader("🔎 NCRs Involving...")
+st.caption("Find NCRs by machine, NC code, operation, operator or part type, from the ID columns and the NCR texts.")
+ENTITY_LABELS = {
+    'machine': "Machines",
+    'nc_code': "NC Codes",
+    'operation': "Operations",
+    'operator': "Operators",
+    'part_type': "Part Types",
+}
+entity_cols = st.columns(len(ENTITY_LABELS))
+terms = {}
+for col, (kind, label) in zip(entity_cols, ENTITY_LABELS.items()):
+    with col:
+        selected = st.multiselect(label, data.entities.values(kind).index.tolist(), key=f"entity_{kind}")
+    if selected:
+        terms[kind] = selected
+first_date, last_date = data.timeseries.date_range()
+search_col1, search_col2 = st.columns(2)
+with search_col1:
+    match = st.radio(
+        "Match", ["all", "any"], horizontal=True,
+        format_func=lambda m: "All selected kinds (AND)" if m == "all" else "Any selected kind (OR)",
+    )
+with search_col2:
+    date_range = st.date_input("Detected between", value=(first_date, last_date)) if first_date is not None else ()
+if terms:
+    # While the range is being picked, date_input returns a single date
+    start = date_range[0] if len(date_range) > 0 else None
+    end = date_range[1] if len(date_range) > 1 else None
+    matches = data.involving(terms, match, start, end)
+    st.info(f"{len(matches)} matching NCRs")
+    st.dataframe(matches.head(200), use_container_width=True)
+
+st.subheader("🧩 Entities That Occur Together")
+st.caption("Machines, NC codes, operations and operators found in the same NCRs, including those mentioned in the texts.")
+pair_col1, pair_col2 = st.columns(2)
+with pair_col1:
+    kind_a = st.selectbox("First entity", list(ENTITY_LABELS), format_func=ENTITY_LABELS.get, index=0)
+with pair_col2:
+    kind_b = st.selectbox("Second entity", list(ENTITY_LABELS), format_func=ENTITY_LABELS.get, index=1)
+st.dataframe(data.entity_matrix.cooccurrence(kind_a, kind_b), use_container_width=True, hide_index=True)
+
 st.subheader("🔗 Attribute Correlations")
 st.caption("Explore relationships between attributes. Find hidden patterns like 'Machine X + Part Y = high defects'.")
-correlation_fields = ['MachineNum of detection', 'NC Code', 'Part type', 'root_cause_category', 'corrective_category', 'defect_type']
-available_fields = [f for f in correlation_fields if f in enriched_df.columns]
+available_fields = data.correlation_fields
 
-col_a, col_b = st.columns(2)
+col_a, col_b, col_c = st.columns(3)
 with col_a:
     field1 = st.selectbox("Select first attribute", available_fields, index=0)
 with col_b:
     field2 = st.selectbox("Select second attribute", available_fields, index=1)
+with col_c:
+    field3 = st.selectbox("Select third attribute (optional)", ["(none)"] + available_fields, index=0)
 
-if field1 and field2 and field1 != field2:
-    pair_counts = enriched_df.groupby([field1, field2]).size().reset_index(name='Count')
-    pair_counts = pair_counts.sort_values('Count', ascending=False).head(15)
-    pair_counts.columns = [field1, field2, 'Count']
+selected_fields = [field1, field2] + ([field3] if field3 != "(none)" else [])
+if field1 and field2 and len(set(selected_fields)) == len(selected_fields):
+    pair_counts = data.combination_counts(selected_fields)
     st.dataframe(pair_counts, use_container_width=True, hide_index=True)
 else:
-    st.info("Select two different attributes to see their correlation.")
+    st.info("Select different attributes to see their correlation.")
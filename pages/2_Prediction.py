@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
-from src.prediction import load_context_data, build_context_prompt, predict_batch
+from src.cascade import CATEGORY_COLUMNS, TARGET_ACCURACY, calibrate, iter_predict_cascade
+from src.prediction import load_context_data, build_context_selector
+from src.prediction_cache import PredictionCache
 
 st.set_page_config(page_title="🔮 Prediction", page_icon="🔮", layout="wide")
 
@@ -11,48 +13,148 @@ st.text("Upload NCR Data with empty Root Cause and/or Corrective actions fields"
 st.image("pages/assets/prediction.png")
 uploaded_file = st.file_uploader("Upload a CSV file", type=["csv"])
 
+PREDICTED_COLUMNS = {
+    'Root cause of occurrence': 'predicted_root_cause',
+    'Corrective actions': 'predicted_corrective_action',
+}
+
+
+def fill_predictions(df, predictions):
+    """
+    df with its empty root cause / corrective action fields filled with the LLM answers so
+    far; rows answered locally get their categories in separate columns instead.
+    """
+    result = df.copy()
+    for col, predicted_col in PREDICTED_COLUMNS.items():
+        current = result[col].astype(object) if col in result.columns else pd.Series(None, index=result.index, dtype=object)
+        needs_prediction = current.isna() | (current == '')
+        predicted = predictions[predicted_col].reindex(result.index)
+        predicted = predicted.where(predicted != '')
+        result[col] = current.where(~needs_prediction | predicted.isna(), predicted)
+    for col in CATEGORY_COLUMNS:
+        result[col] = predictions[col].reindex(result.index)
+    result['prediction_source'] = predictions['prediction_source'].reindex(result.index)
+    result['local_confidence'] = predictions['local_confidence'].reindex(result.index)
+    result['prediction_error'] = predictions['prediction_error'].reindex(result.index)
+    return result
+
+
+def highlight_predictions(row):
+    return [
+        'background-color: #e6f3ff; color: #0066cc' if col in PREDICTED_COLUMNS or col in CATEGORY_COLUMNS else ''
+        for col in row.index
+    ]
+
+
 if uploaded_file is not None:
     df = pd.read_csv(uploaded_file, sep=';')
+    if df.empty:
+        st.warning("The uploaded CSV has no rows to predict")
+        st.stop()
     st.success(f"Loaded {len(df)} rows")
     
     st.markdown("### Input Data")
     st.dataframe(df, use_container_width=True)
     
+    calibrated = st.checkbox(
+        "Calibrate the local confidence threshold on the history",
+        value=True,
+        help=(
+            "Picks the lowest threshold at which the local classifiers' answers match the "
+            f"categories of at least {TARGET_ACCURACY:.0%} of the historical NCRs they would answer. "
+            "When none does, every NCR goes to the LLM."
+        ),
+    )
+    threshold = None
+    if not calibrated:
+        threshold = st.slider(
+            "Local confidence threshold",
+            min_value=0.0, max_value=1.0, value=0.5, step=0.01,
+            help=(
+                "Minimum probability the local classifier gives its defect category (12 categories, "
+                "so 0.08 is chance level). NCRs above it, whose root cause and action stages agree "
+                "(probability >= 0.5) and are informative (not 'Unknown', 'Other' or 'Undefined'), "
+                "get local categories instead of an LLM answer."
+            ),
+        )
+    
+    # Results so far survive reruns (e.g. an interrupted run), as long as the upload is the same
+    upload_key = (uploaded_file.name, uploaded_file.size)
+    if st.session_state.get('prediction_upload') != upload_key:
+        st.session_state.prediction_upload = upload_key
+        st.session_state.prediction_chunks = []
+    
     if st.button("Predict Root Causes", type="primary"):
+        st.session_state.prediction_chunks = []
         with st.spinner("Loading context data..."):
             context_df = load_context_data()
-            context = build_context_prompt(context_df)
-        
-        with st.spinner(f"Predicting root causes for {len(df)} rows..."):
-            predictions = predict_batch(df, context)
+            selector = build_context_selector(context_df)
+        st.caption(
+            f"Context: the most relevant of {len(selector)} historical NCRs, "
+            f"up to ~{selector.token_budget} tokens per request (full history: ~{selector.full_tokens} tokens)"
+        )
+        if calibrated:
+            with st.spinner("Calibrating the local classifiers on the history..."):
+                threshold = calibrate(selector.history)
+            st.caption(
+                f"Calibrated local confidence threshold: {threshold:.3f}" if threshold is not None else
+                f"The local classifiers do not reach {TARGET_ACCURACY:.0%} accuracy on the history: every NCR goes to the LLM"
+            )
         
-        root_causes = []
-        corrective_actions = []
-        for idx, row in df.iterrows():
-            root_cause = row.get('Root cause of occurrence', '')
-            corrective = row.get('Corrective actions', '')
-            needs_root_cause = pd.isna(root_cause) or root_cause == ''
-            needs_corrective = pd.isna(corrective) or corrective == ''
-            
-            pred_root, pred_action = predictions[idx]
-            root_causes.append(pred_root if needs_root_cause else root_cause)
-            corrective_actions.append(pred_action if needs_corrective else corrective)
+        progress = st.progress(0.0, text=f"Predicting root causes for {len(df)} rows...")
+        table = st.empty()
+        partial_download = st.empty()
+        done = 0
+        for number, chunk in enumerate(iter_predict_cascade(df, selector, threshold, cache=PredictionCache())):
+            st.session_state.prediction_chunks.append(chunk)
+            done += len(chunk)
+            progress.progress(done / len(df), text=f"Predicted {done} of {len(df)} rows")
+            partial = fill_predictions(df, pd.concat(st.session_state.prediction_chunks))
+            table.dataframe(partial.style.apply(highlight_predictions, axis=1), use_container_width=True)
+            # on_click="ignore": downloading does not rerun the page, so the run goes on
+            partial_download.download_button(
+                label=f"Download Partial Results ({done} of {len(df)} rows)",
+                data=partial.to_csv(index=False, sep=';'),
+                file_name="prediction_results_partial.csv",
+                mime="text/csv",
+                on_click="ignore",
+                key=f"partial_download_{number}",
+            )
+        progress.empty()
+        table.empty()
+        partial_download.empty()
+    
+    if st.session_state.prediction_chunks:
+        predictions = pd.concat(st.session_state.prediction_chunks)
+        results = fill_predictions(df, predictions)
+        complete = len(predictions) >= len(df)
         
-        df['Root cause of occurrence'] = root_causes
-        df['Corrective actions'] = corrective_actions
+        sources = predictions['prediction_source'].value_counts()
+        # Only rows with an answer count as answered by the LLM, not its ('', '') placeholders
+        answered = (predictions['predicted_root_cause'].fillna('') != '') | (predictions['predicted_corrective_action'].fillna('') != '')
+        by_llm = int((answered & (predictions['prediction_source'] == 'llm')).sum())
+        st.info(
+            f"{sources.get('local', 0) / len(df):.0%} of rows answered locally "
+            f"({sources.get('local', 0)} local, {sources.get('cache', 0)} from the prediction cache, "
+            f"{by_llm} by the LLM)"
+        )
+        failed = predictions['prediction_error'].dropna()
+        if len(failed):
+            reasons = failed.value_counts()
+            st.error(
+                f"The LLM left {len(failed)} rows unanswered (prediction_error column): "
+                + "; ".join(f"{error} ({count} rows)" for error, count in reasons.head(3).items())
+            )
+        if not complete:
+            st.warning(f"Prediction interrupted: {len(predictions)} of {len(df)} rows predicted")
         
         st.markdown("### Prediction Results")
+        st.dataframe(results.style.apply(highlight_predictions, axis=1), use_container_width=True)
         
-        def highlight_predictions(row):
-            return ['background-color: #e6f3ff; color: #0066cc' if col in ['Root cause of occurrence', 'Corrective actions'] else '' for col in row.index]
-        
-        styled_df = df.style.apply(highlight_predictions, axis=1)
-        st.dataframe(styled_df, use_container_width=True)
-        
-        csv_output = df.to_csv(index=False, sep=';')
+        csv_output = results.to_csv(index=False, sep=';')
         st.download_button(
-            label="Download Results as CSV",
+            label="Download Results as CSV" if complete else "Download Partial Results as CSV",
             data=csv_output,
-            file_name="prediction_results.csv",
+            file_name="prediction_results.csv" if complete else "prediction_results_partial.csv",
             mime="text/csv"
         )
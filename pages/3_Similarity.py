@@ -1,26 +1,10 @@
 # pages/3_Similarity.py
 
-import streamlit as st
 import os
-import importlib.util
-
-# =============================
-# Helper: Load Python module from file
-# =============================
-def load_module_from_file(module_name, file_path):
-    spec = importlib.util.spec_from_file_location(module_name, file_path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    return module
-
-# =============================
-# Absolute paths to src modules
-# =============================
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
-clustering_path = os.path.join(BASE_DIR, "clustering.py")
 
-# Load clustering module dynamically
-clustering = load_module_from_file("clustering", clustering_path)
+import streamlit as st
+from src import clustering
+from src.similarity import DEFAULT_INDEX_DIR, EmbeddingCache, get_index
 
 # =============================
 # Streamlit page config
@@ -29,6 +13,12 @@ st.set_page_config(page_title="NCR Prediction", page_icon="🔍", layout="wide")
 st.title("🔍 NCR Defect Prediction")
 st.subheader("Enter a defect description to predict categories")
 
+# Models are shared by all sessions; only the first run of the process loads them
+load_seconds = clustering.warm_up()
+with st.expander("Model loading"):
+    st.caption(f"Warm-up: {load_seconds * 1000:.1f} ms")
+    st.dataframe(clustering.get_registry().metrics(), use_container_width=True)
+
 # =============================
 # Single defect prediction
 # =============================
@@ -51,3 +41,34 @@ if st.button("Predict"):
             st.error(f"Prediction failed: {e}")
         except Exception as e:
             st.error(f"Prediction failed: {e}")
+
+# =============================
+# Similar NCR search
+# =============================
+st.markdown("### Similar Historical NCRs")
+if not os.path.exists(os.path.join(DEFAULT_INDEX_DIR, 'meta.json')):
+    st.info(
+        "No similar-NCR index yet. Build it with "
+        "`python -m src.similarity --build` (add `--ann` with hnswlib installed for large histories)."
+    )
+else:
+    col_k, col_entity = st.columns([1, 2])
+    top_k = col_k.number_input("Number of NCRs", min_value=1, max_value=50, value=5)
+    entity = col_entity.text_input(
+        "Only NCRs involving (optional)",
+        help="A machine (AAAA-02-11), NC code (CO2910) or operation (OP7200)",
+    )
+    if st.button("Find Similar NCRs"):
+        if user_input.strip() == "":
+            st.warning("Please enter a defect description.")
+        else:
+            try:
+                index = get_index()
+                similar = index.search_text(user_input, int(top_k), entity.strip() or None, cache=EmbeddingCache())
+                if similar.empty:
+                    st.warning(f"No historical NCR involves {entity.strip()}.")
+                else:
+                    st.caption(f"Searched {len(index)} historical NCRs")
+                    st.dataframe(similar, use_container_width=True)
+            except Exception as e:
+                st.error(f"Search failed: {e}")
@@ -0,0 +1,75 @@
+import json
+from datetime import datetime
+
+import streamlit as st
+import pandas as pd
+from src import instrumentation
+
+st.set_page_config(page_title="🩺 Diagnostics", page_icon="🩺", layout="wide")
+
+st.title("🩺 Diagnostics")
+st.subheader("Where the time goes: per-stage timings and counters of this server process")
+
+enabled = st.toggle(
+    "Enable instrumentation",
+    value=instrumentation.is_enabled(),
+    help=f"Also enabled at startup with {instrumentation.ENV_VAR}=1. Disabled, the hooks cost next to nothing.",
+)
+if enabled and not instrumentation.is_enabled():
+    instrumentation.enable()
+elif not enabled and instrumentation.is_enabled():
+    instrumentation.disable()
+
+
+def stage_table(stages):
+    table = pd.DataFrame.from_dict(stages, orient='index')
+    if table.empty:
+        return table
+    table.index.name = 'Stage'
+    table['mean_ms'] = table['seconds'] / table['calls'] * 1000
+    table['max_ms'] = table['max_seconds'] * 1000
+    return table[['calls', 'seconds', 'mean_ms', 'max_ms']].sort_values('seconds', ascending=False)
+
+
+def counter_table(counters):
+    return pd.DataFrame({'Counter': list(counters), 'Value': list(counters.values())}).set_index('Counter')
+
+
+snapshot = instrumentation.snapshot()
+
+if not snapshot['stages'] and not snapshot['counters']:
+    st.info("Nothing recorded yet. Enable instrumentation, then use the other pages.")
+else:
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        st.subheader("⏱️ Stages (since process start)")
+        st.caption("Stages run in worker threads (API calls, context selection) add up across threads.")
+        stages = stage_table(snapshot['stages'])
+        st.bar_chart(stages['seconds'])
+        st.dataframe(stages, use_container_width=True)
+    with col2:
+        st.subheader("🔢 Counters")
+        st.dataframe(counter_table(snapshot['counters']), use_container_width=True)
+
+    st.subheader("🕘 Latest Runs")
+    for run in snapshot['runs'][:20]:
+        started = datetime.fromtimestamp(run['started']).strftime('%Y-%m-%d %H:%M:%S')
+        label = f"{run['name']} · {started} · {run['seconds']:.2f}s" + (" · ❌" if run['error'] else "")
+        with st.expander(label):
+            if run['error']:
+                st.error(run['error'])
+            col1, col2 = st.columns([2, 1])
+            with col1:
+                st.dataframe(stage_table(run['stages']), use_container_width=True)
+            with col2:
+                st.dataframe(counter_table(run['counters']), use_container_width=True)
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    st.download_button("Download JSON", data=json.dumps(snapshot, indent=2), file_name="diagnostics.json", mime="application/json")
+with col2:
+    st.download_button("Download Prometheus Metrics", data=instrumentation.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+with col3:
+    if st.button("Reset"):
+        instrumentation.reset()
+        st.rerun()
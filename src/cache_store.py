@@ -0,0 +1,134 @@
+"""
+Persistent key-value cache on SQLite.
+
+Keys are strings (typically content hashes, see content_key) and values are bytes;
+callers serialize. Entries are evicted least-recently-used once the store holds more
+than max_entries, and optionally expire after ttl_seconds. Lookups and inserts are
+batched, one transaction per call.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Sequence
+
+# Keys per statement, below SQLite's parameter limit.
+_BATCH = 900
+
+
+def content_key(*parts: str) -> str:
+    """sha256 of the parts, length-prefixed so ('ab', 'c') and ('a', 'bc') differ."""
+    payload = ''.join(f'{len(part)}:{part}' for part in parts)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PersistentCache:
+    """Size-bounded LRU (and optional TTL) store of bytes values in a SQLite file."""
+
+    def __init__(self, filepath: str, max_entries: Optional[int] = 100_000, ttl_seconds: Optional[float] = None):
+        self.filepath = filepath
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filepath, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL, used REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entries_used ON entries (used)')
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """Values of the keys present (and not expired); counts hits and misses."""
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            for i in range(0, len(keys), _BATCH):
+                batch = keys[i:i + _BATCH]
+                placeholders = ','.join('?' * len(batch))
+                query = f'SELECT key, value FROM entries WHERE key IN ({placeholders})'
+                params = list(batch)
+                if self.ttl_seconds is not None:
+                    query += ' AND created >= ?'
+                    params.append(now - self.ttl_seconds)
+                found.update(self._conn.execute(query, params).fetchall())
+            if found and self.max_entries is not None:
+                hit_keys = list(found)
+                for i in range(0, len(hit_keys), _BATCH):
+                    batch = hit_keys[i:i + _BATCH]
+                    placeholders = ','.join('?' * len(batch))
+                    self._conn.execute(f'UPDATE entries SET used = ? WHERE key IN ({placeholders})', [now] + batch)
+                self._conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        """Insert or replace values, then evict the least recently used entries over max_entries."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO entries (key, value, created, used) VALUES (?, ?, ?, ?)',
+                [(k, sqlite3.Binary(v), now, now) for k, v in items.items()],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def put(self, key: str, value: bytes) -> None:
+        self.put_many({key: value})
+
+    def delete_many(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            self._conn.executemany('DELETE FROM entries WHERE key = ?', [(k,) for k in keys])
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        if self.ttl_seconds is not None:
+            cursor = self._conn.execute('DELETE FROM entries WHERE created < ?', (time.time() - self.ttl_seconds,))
+            self.evictions += cursor.rowcount
+        if self.max_entries is None:
+            return
+        excess = self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                'DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY used LIMIT ?)', (excess,)
+            )
+            self.evictions += excess
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM entries')
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss/eviction counters of this instance and the hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,264 @@
+"""
+Confidence-gated prediction: local classifiers first, LLM for the rest.
+
+Every NCR is scored by the three-stage sklearn chain of src/clustering.py
+(defect -> root cause category -> corrective action category). A row is answered
+locally when:
+
+    - stage 1 gives its defect category a probability of at least the threshold
+      (its predict_proba maximum; stage 1 has 12 classes, so 0.083 is chance level)
+    - stages 2 and 3 agree: each gives its answer a probability of at least
+      MIN_STAGE_CONFIDENCE, i.e. a majority answer given the defect
+    - neither answer is uninformative: 'Unknown', or a category the rules give to any
+      text they cannot place ('Other', 'Undefined', ...; UNINFORMATIVE_LABELS)
+
+Only the others are sent to the LLM with predict_batch, so repetitive NCRs cost no
+API call. Local answers are categories, returned in the *_category columns; only the
+LLM (or its cache) fills the free-text predictions.
+
+The threshold is chosen by accuracy, not by how many rows it answers: calibrate()
+runs the chain over labelled history (the enriched context, whose root cause and
+corrective action categories come from the rules of src/rules.py) and returns the
+lowest threshold whose local answers match those categories for at least
+TARGET_ACCURACY of MIN_CALIBRATION_ROWS rows or more. When no threshold does, every
+row goes to the LLM. With the PoC models on data/prod_data.csv that is the case: the
+root cause stage only knows 'Other' and 'Unknown'.
+"""
+
+import argparse
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from src.clustering import CONFIDENCE_COLUMNS, DEFAULT_DESCRIPTION_COLUMN, predict_defect_root_action_batch
+from src.context_retrieval import ContextSelector
+from src.prediction import (
+    Generation,
+    build_context_selector,
+    iter_predict_batch,
+    load_context_data,
+    load_input_data,
+)
+from src.prediction_cache import PredictionCache
+from src.rules import CORRECTIVE_RULES, ROOT_CAUSE_RULES
+from src.storage import ENRICHED_PARQUET_PATH
+
+# Minimum probability of the stage 2 and stage 3 answers
+MIN_STAGE_CONFIDENCE = 0.5
+COVERAGE_THRESHOLDS = [0.08, 0.1, 0.12, 0.15, 0.2, 0.25, 0.3, 0.5]
+# Local answers that say nothing, always escalated: the models' fallback, and what the
+# rules answer for an unmatched or an empty text
+UNINFORMATIVE_LABELS = {
+    'Unknown', '',
+    ROOT_CAUSE_RULES.default, CORRECTIVE_RULES.default,
+    ROOT_CAUSE_RULES.categorize(''), CORRECTIVE_RULES.categorize(''),
+}
+# Calibration: history category each local answer must match, and the accuracy required
+LABEL_COLUMNS = {
+    'predicted_root_cause_category': 'root_cause_category',
+    'predicted_corrective_action_category': 'corrective_category',
+}
+TARGET_ACCURACY = 0.8
+MIN_CALIBRATION_ROWS = 20
+
+CATEGORY_COLUMNS = list(LABEL_COLUMNS)
+CASCADE_COLUMNS = [
+    'predicted_root_cause', 'predicted_corrective_action', *CATEGORY_COLUMNS,
+    'prediction_source', 'local_confidence', 'prediction_error',
+]
+
+
+def local_predictions(df: pd.DataFrame, description_col: str = DEFAULT_DESCRIPTION_COLUMN) -> pd.DataFrame:
+    """Local categories and per-stage confidences (CONFIDENCE_COLUMNS) for every row of df; rows without a description get 0."""
+    if description_col not in df.columns:
+        local = pd.DataFrame(index=df.index, columns=['predicted_root_cause_category', 'predicted_corrective_action_category'])
+        for col in CONFIDENCE_COLUMNS:
+            local[col] = 0.0
+        return local
+    local = predict_defect_root_action_batch(df, description_col, with_confidence=True)
+    for col in CONFIDENCE_COLUMNS:
+        local[col] = local[col].astype(float).fillna(0.0)
+    return local
+
+
+def is_confident(local: pd.DataFrame, threshold: float, min_stage_confidence: float = MIN_STAGE_CONFIDENCE) -> pd.Series:
+    """Rows answered locally: stage-1 confidence >= threshold, stages 2 and 3 agree, informative answers."""
+    informative = pd.Series(True, index=local.index)
+    for col in ['predicted_root_cause_category', 'predicted_corrective_action_category']:
+        informative &= local[col].notna() & ~local[col].isin(UNINFORMATIVE_LABELS)
+    agree = (local['root_cause_confidence'] >= min_stage_confidence) & (local['corrective_action_confidence'] >= min_stage_confidence)
+    return (local['defect_confidence'] >= threshold) & agree & informative
+
+
+def accuracy_curve(local: pd.DataFrame, history: pd.DataFrame) -> pd.DataFrame:
+    """
+    Accuracy of the local answers on labelled history at every threshold that changes them.
+
+    local is local_predictions(history). One row per distinct stage-1 confidence, highest
+    first: answered (rows answered locally at that threshold), coverage and accuracy
+    (fraction of them whose categories both match LABEL_COLUMNS of history).
+    """
+    correct = pd.Series(True, index=local.index)
+    for predicted, label in LABEL_COLUMNS.items():
+        labels = history[label] if label in history.columns else pd.Series(None, index=history.index, dtype=object)
+        correct &= local[predicted].astype(object).eq(labels.astype(object)).fillna(False).astype(bool)
+    eligible = is_confident(local, 0.0)
+    curve = pd.DataFrame({
+        'threshold': local.loc[eligible, 'defect_confidence'],
+        'correct': correct[eligible],
+    }).sort_values('threshold', ascending=False, kind='stable')
+    curve['answered'] = np.arange(1, len(curve) + 1)
+    curve['accuracy'] = curve['correct'].cumsum() / curve['answered']
+    # Rows tied at a confidence are all answered at that threshold
+    curve = curve.groupby('threshold', sort=False).last().reset_index()
+    curve['coverage'] = curve['answered'] / len(local) if len(local) else 0.0
+    return curve[['threshold', 'answered', 'coverage', 'accuracy']]
+
+
+def calibrate(
+    history: pd.DataFrame,
+    target_accuracy: float = TARGET_ACCURACY,
+    min_rows: int = MIN_CALIBRATION_ROWS,
+    description_col: str = DEFAULT_DESCRIPTION_COLUMN,
+) -> Optional[float]:
+    """
+    Lowest stage-1 threshold whose local answers on history are at least target_accuracy
+    correct, over at least min_rows answered rows; None when no threshold is (answer
+    nothing locally).
+    """
+    if history.empty:
+        return None
+    curve = accuracy_curve(local_predictions(history, description_col), history)
+    reliable = curve[(curve['accuracy'] >= target_accuracy) & (curve['answered'] >= min_rows)]
+    return float(reliable['threshold'].min()) if len(reliable) else None
+
+
+def _history(context: Union[str, ContextSelector]) -> pd.DataFrame:
+    """Labelled history behind a context; a prompt string has none."""
+    return context.history if isinstance(context, ContextSelector) else pd.DataFrame()
+
+
+def local_coverage(local: pd.DataFrame, thresholds: Iterable[float]) -> Dict[float, float]:
+    """Fraction of rows answered locally at each threshold, to tune the threshold without any API call."""
+    if local.empty:
+        return {threshold: 0.0 for threshold in thresholds}
+    return {threshold: float(is_confident(local, threshold).mean()) for threshold in thresholds}
+
+
+def iter_predict_cascade(
+    df: pd.DataFrame,
+    context: Union[str, ContextSelector],
+    threshold: Optional[float] = None,
+    description_col: str = DEFAULT_DESCRIPTION_COLUMN,
+    generation=Generation,
+    cache: PredictionCache = None,
+    **batch_options,
+) -> Iterator[pd.DataFrame]:
+    """
+    Generator version of predict_cascade: yields CASCADE_COLUMNS for some rows of df at a time.
+
+    The rows answered locally come first, in one chunk, then the escalated rows as
+    iter_predict_batch returns them. Every row of df is yielded once.
+    """
+    if threshold is None:
+        threshold = calibrate(_history(context), description_col=description_col)
+    local = local_predictions(df, description_col)
+    if threshold is None:
+        confident = np.zeros(len(df), dtype=bool)
+    else:
+        confident = is_confident(local, threshold).to_numpy()
+
+    if confident.any():
+        chunk = pd.DataFrame(index=df.index[confident], columns=CASCADE_COLUMNS, dtype=object)
+        for col in CATEGORY_COLUMNS:
+            chunk[col] = local.loc[confident, col]
+        chunk['prediction_source'] = 'local'
+        chunk['local_confidence'] = local.loc[confident, 'defect_confidence']
+        yield chunk
+
+    escalated = df[~confident]
+    if escalated.empty:
+        return
+    for predictions in iter_predict_batch(escalated, context, generation=generation, cache=cache, **batch_options):
+        indices = list(predictions)
+        chunk = pd.DataFrame(index=pd.Index(indices), columns=CASCADE_COLUMNS, dtype=object)
+        chunk['predicted_root_cause'] = [predictions[idx][0] for idx in indices]
+        chunk['predicted_corrective_action'] = [predictions[idx][1] for idx in indices]
+        chunk['prediction_source'] = 'cache' if predictions.cache_hits else 'llm'
+        chunk['prediction_error'] = [predictions.errors.get(idx) for idx in indices]
+        chunk.loc[chunk['prediction_error'].notna(), 'prediction_source'] = 'error'
+        chunk['local_confidence'] = local.loc[indices, 'defect_confidence'].to_numpy()
+        yield chunk
+
+
+def predict_cascade(
+    df: pd.DataFrame,
+    context: Union[str, ContextSelector],
+    threshold: Optional[float] = None,
+    description_col: str = DEFAULT_DESCRIPTION_COLUMN,
+    generation=Generation,
+    cache: PredictionCache = None,
+    **batch_options,
+) -> pd.DataFrame:
+    """
+    Predict root cause and corrective action for every row of df, locally when confident.
+
+    threshold=None calibrates it on the history of context (see calibrate). Rows not
+    answered locally are predicted by predict_batch(context, generation, cache,
+    **batch_options). Returns, aligned with df, CASCADE_COLUMNS: the LLM's free-text
+    predictions, the local categories, prediction_source ('local', 'cache', 'llm', or
+    'error' for rows the LLM left unanswered, with the reason in prediction_error) and
+    local_confidence (the stage-1 probability the threshold applies to).
+    attrs['local_fraction'] is the fraction of rows answered locally.
+    """
+    chunks = list(iter_predict_cascade(df, context, threshold, description_col, generation, cache, **batch_options))
+    result = pd.DataFrame(index=df.index, columns=CASCADE_COLUMNS, dtype=object)
+    if chunks:
+        result = pd.concat(chunks).reindex(df.index)
+    result['local_confidence'] = result['local_confidence'].astype(float)
+    result.attrs['local_fraction'] = float((result['prediction_source'] == 'local').mean()) if len(df) else 0.0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict root causes locally when confident, with the LLM otherwise")
+    parser.add_argument('input_csv', help="NCRs to predict (';'-separated)")
+    parser.add_argument('output_csv', nargs='?', help="Where to save the input with the predictions")
+    parser.add_argument('--context', default=ENRICHED_PARQUET_PATH, help="Enriched historical dataset")
+    parser.add_argument('--threshold', type=float, help="Minimum stage-1 (defect) probability for a local answer (default: calibrated on the context)")
+    parser.add_argument('--coverage', action='store_true', help="Only print the local fraction per threshold (no API call)")
+    parser.add_argument('--calibrate', action='store_true', help="Only print the local accuracy per threshold on the context (no API call)")
+    parser.add_argument('--no-cache', action='store_true', help="Do not use the persistent prediction cache")
+    args = parser.parse_args()
+
+    input_df = load_input_data(args.input_csv)
+    if args.coverage:
+        local = local_predictions(input_df)
+        for threshold, fraction in local_coverage(local, COVERAGE_THRESHOLDS).items():
+            print(f"threshold {threshold:<5} local {fraction:.1%}")
+        return
+
+    selector = build_context_selector(load_context_data(args.context))
+    if args.calibrate:
+        curve = accuracy_curve(local_predictions(selector.history), selector.history)
+        print(curve.to_string(index=False) if len(curve) else "No informative local answer on the context")
+        threshold = calibrate(selector.history)
+        print(f"Calibrated threshold: {threshold}" if threshold is not None else
+              f"No threshold reaches {TARGET_ACCURACY:.0%} accuracy on {MIN_CALIBRATION_ROWS}+ rows: every NCR goes to the LLM")
+        return
+
+    cache = None if args.no_cache else PredictionCache()
+    result = predict_cascade(input_df, selector, args.threshold, cache=cache)
+    output = input_df.join(result)
+    print(f"Answered locally: {result.attrs['local_fraction']:.1%} of {len(result)} rows")
+    print(result['prediction_source'].value_counts().to_string())
+    if args.output_csv:
+        output.to_csv(args.output_csv, index=False, sep=';')
+        print(f"Saved to {args.output_csv}")
+    else:
+        print(output[['NC Code', 'predicted_root_cause', 'predicted_corrective_action', *CATEGORY_COLUMNS, 'prediction_source']].to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
-from typing import List, Tuple
+from typing import List, Tuple, Union
+import argparse
 import os
+import numpy as np
 import pandas as pd
-import joblib
+
+from src import instrumentation
+from src.model_registry import ModelRegistry
 
 # Folder where clustering.py is located
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -13,12 +17,37 @@ stage3_path = os.path.join(BASE_DIR, "stage3_corrective_action_model.pkl")
 encoder_path = os.path.join(BASE_DIR, "encoder_defect.pkl")
 encoder2_path = os.path.join(BASE_DIR, "encoder_defect_root.pkl")
 
-# Load models
-stage1_pipeline = joblib.load(stage1_path)
-root_cause_model = joblib.load(stage2_path)
-action_model = joblib.load(stage3_path)
-encoder = joblib.load(encoder_path)
-encoder2 = joblib.load(encoder2_path)
+# Models are loaded lazily, once per process, on first use
+MODEL_PATHS = {
+    "stage1_pipeline": stage1_path,
+    "root_cause_model": stage2_path,
+    "action_model": stage3_path,
+    "encoder": encoder_path,
+    "encoder2": encoder2_path,
+}
+_registry = None
+
+
+def get_registry() -> ModelRegistry:
+    """Shared registry of the three-stage classifier artifacts."""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry(MODEL_PATHS)
+    return _registry
+
+
+def warm_up() -> float:
+    """Load all classifier artifacts now; returns the seconds spent loading."""
+    return get_registry().warm_up()
+
+
+def __getattr__(name: str):
+    # Keeps clustering.stage1_pipeline etc. working without loading at import time.
+    if name in MODEL_PATHS:
+        return get_registry().get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # =========================
 # ===== Prediction function =====
 # =========================
@@ -29,23 +58,135 @@ def predict_defect_root_action(defect_description: str):
     2. Root Cause Category
     3. Corrective Action Category
     """
-    # Stage 1: defect category
-    predicted_defect = stage1_pipeline.predict([defect_description])[0]
-    
-    # Stage 2: root cause
-    X_root = encoder.transform([[predicted_defect]])
-    predicted_root = root_cause_model.predict(X_root)[0]
-    
-    # Stage 3: corrective action
-    X_action = encoder2.transform([[predicted_defect, predicted_root]])
-    predicted_action = action_model.predict(X_action)[0]
+    registry = get_registry()
+    stage1_pipeline = registry.get("stage1_pipeline")
+    root_cause_model = registry.get("root_cause_model")
+    action_model = registry.get("action_model")
+    encoder = registry.get("encoder")
+    encoder2 = registry.get("encoder2")
+
+    with instrumentation.stage('clustering.inference'):
+        # Stage 1: defect category
+        predicted_defect = stage1_pipeline.predict([defect_description])[0]
+        
+        # Stage 2: root cause
+        X_root = encoder.transform([[predicted_defect]])
+        predicted_root = root_cause_model.predict(X_root)[0]
+        
+        # Stage 3: corrective action
+        X_action = encoder2.transform([[predicted_defect, predicted_root]])
+        predicted_action = action_model.predict(X_action)[0]
+    instrumentation.count('rows_classified')
     
     return predicted_defect, predicted_root, predicted_action
 
-# =========================
-# ===== Main interactive interface =====
-# =========================
-if __name__ == "__main__":
+
+DEFAULT_DESCRIPTION_COLUMN = "FDefectDesc_EN"
+PREDICTION_COLUMNS = [
+    "predicted_defect_category",
+    "predicted_root_cause_category",
+    "predicted_corrective_action_category",
+]
+CONFIDENCE_COLUMNS = [
+    "defect_confidence",
+    "root_cause_confidence",
+    "corrective_action_confidence",
+    "confidence",
+]
+
+
+def _predict_with_proba(model, X) -> Tuple[np.ndarray, np.ndarray]:
+    """Predicted labels and their probabilities."""
+    proba = model.predict_proba(X)
+    best = proba.argmax(axis=1)
+    return model.classes_[best], proba[np.arange(len(best)), best]
+
+
+def predict_defect_root_action_batch(
+    descriptions: Union[List[str], pd.Series, pd.DataFrame],
+    description_col: str = DEFAULT_DESCRIPTION_COLUMN,
+    with_confidence: bool = False,
+) -> pd.DataFrame:
+    """
+    Batch version of predict_defect_root_action.
+
+    Each stage runs once over the distinct inputs of the batch instead of once per NCR.
+    Accepts a list or Series of descriptions, or a DataFrame (description_col is used).
+    Returns the three predicted categories (PREDICTION_COLUMNS), aligned with the input.
+    With with_confidence, also the predict_proba of each stage's answer and their
+    product, the confidence of the whole chain (CONFIDENCE_COLUMNS).
+    """
+    if isinstance(descriptions, pd.DataFrame):
+        descriptions = descriptions[description_col]
+    if not isinstance(descriptions, pd.Series):
+        descriptions = pd.Series(list(descriptions), dtype=object)
+    texts = descriptions.astype(object).where(descriptions.notna(), "").map(str)
+    columns = PREDICTION_COLUMNS + (CONFIDENCE_COLUMNS if with_confidence else [])
+    result = pd.DataFrame(index=descriptions.index, columns=columns, dtype=object)
+    if texts.empty:
+        return result
+
+    registry = get_registry()
+
+    # Load the models before timing inference
+    registry.warm_up()
+    with instrumentation.stage('clustering.inference'):
+        # Stage 1: defect category, once per distinct description
+        text_codes, unique_texts = pd.factorize(texts)
+        stage1 = registry.get("stage1_pipeline")
+        if with_confidence:
+            defects, defect_proba = _predict_with_proba(stage1, list(unique_texts))
+        else:
+            defects = stage1.predict(list(unique_texts))
+
+        # Stages 2 and 3 only depend on the predicted defect, so run them once per distinct defect
+        defect_codes, unique_defects = pd.factorize(defects)
+        unique_defects = np.asarray(unique_defects, dtype=object)
+        X_root = registry.get("encoder").transform(unique_defects.reshape(-1, 1))
+        root_cause_model = registry.get("root_cause_model")
+        if with_confidence:
+            roots, root_proba = _predict_with_proba(root_cause_model, X_root)
+        else:
+            roots = root_cause_model.predict(X_root)
+        X_action = registry.get("encoder2").transform(np.column_stack([unique_defects, roots.astype(object)]))
+        action_model = registry.get("action_model")
+        if with_confidence:
+            actions, action_proba = _predict_with_proba(action_model, X_action)
+        else:
+            actions = action_model.predict(X_action)
+
+        row_defect_codes = defect_codes[text_codes]
+        result["predicted_defect_category"] = defects[text_codes]
+        result["predicted_root_cause_category"] = roots[row_defect_codes]
+        result["predicted_corrective_action_category"] = actions[row_defect_codes]
+        if with_confidence:
+            result["defect_confidence"] = defect_proba[text_codes]
+            result["root_cause_confidence"] = root_proba[row_defect_codes]
+            result["corrective_action_confidence"] = action_proba[row_defect_codes]
+            result["confidence"] = (
+                result["defect_confidence"] * result["root_cause_confidence"] * result["corrective_action_confidence"]
+            ).astype(float)
+    instrumentation.count('rows_classified', len(texts))
+    return result
+
+
+@instrumentation.timed_run('predict_file')
+def predict_file(
+    input_filepath: str,
+    output_filepath: str,
+    description_col: str = DEFAULT_DESCRIPTION_COLUMN,
+    sep: str = ";",
+) -> pd.DataFrame:
+    """Score every NCR of a CSV file and write it back out with the predicted categories."""
+    df = pd.read_csv(input_filepath, sep=sep)
+    predictions = predict_defect_root_action_batch(df, description_col)
+    df = pd.concat([df, predictions], axis=1)
+    df.to_csv(output_filepath, sep=sep, index=False)
+    return df
+
+
+def interactive_loop():
+    """Predict categories for descriptions typed on stdin until 'exit'."""
     print("=== Industrial Defect Prediction System ===")
     print("Type 'exit' or 'quit' to stop.\n")
     
@@ -62,3 +203,22 @@ if __name__ == "__main__":
         print(f"- Root Cause Category   : {root_cause_cat}")
         print(f"- Corrective Action     : {action_cat}")
         print("="*50)
+
+
+# =========================
+# ===== Main interface =====
+# =========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predict defect, root cause and corrective action categories.")
+    parser.add_argument("--input", help="CSV file of NCRs to score (interactive mode if omitted)")
+    parser.add_argument("--output", help="CSV file to write (default: <input>_predicted.csv)")
+    parser.add_argument("--column", default=DEFAULT_DESCRIPTION_COLUMN, help="column holding the defect description")
+    parser.add_argument("--sep", default=";", help="CSV separator")
+    args = parser.parse_args()
+
+    if args.input:
+        output = args.output or os.path.splitext(args.input)[0] + "_predicted.csv"
+        scored = predict_file(args.input, output, args.column, args.sep)
+        print(f"{len(scored)} NCRs scored, written to {output}")
+    else:
+        interactive_loop()
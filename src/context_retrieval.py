@@ -0,0 +1,197 @@
+"""
+Retrieval of the historical NCRs used as LLM context.
+
+Instead of pasting every historical NCR into the prompt, ContextSelector ranks the
+history for each input NCR and keeps the best examples that fit a token budget.
+
+Relevance of a historical NCR to an input NCR:
+    - same NC Code
+    - shared operation number (detection/occurrence, or OPxxxx in the text)
+    - shared machine (detection/occurrence, or machine IDs in the text)
+    - TF-IDF cosine similarity of the description texts
+    - Gold Sample rows get a bonus so they come first among similar cases
+"""
+
+import hashlib
+import json
+import math
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from src.entity_index import EMPTY, ENTITY_COLUMNS, EntityIndex, entity_tokens
+
+CHARS_PER_TOKEN = 4
+DEFAULT_TOP_K = 10
+DEFAULT_TOKEN_BUDGET = 3000
+
+DEFAULT_WEIGHTS = {
+    'nc_code': 3.0,
+    'operation': 1.0,
+    'machine': 1.5,
+    'text': 2.0,
+    'gold': 2.0,
+}
+
+# Entities shared with the input NCR that raise the relevance of a historical one
+MATCH_COLUMNS = {kind: ENTITY_COLUMNS[kind] for kind in ('operation', 'machine')}
+QUERY_TEXT_COLUMNS = ['NC description', 'FDefectDesc_EN', 'Fqccomments_EN']
+GOLD_COLUMN = 'Gold Sample'
+GOLD_VALUES = {'yes', 'y', 'true', '1', 'x'}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def format_context_example(row: pd.Series) -> str:
+    """One historical NCR as it appears in the prompt context."""
+    return f"""NC Code: {row.get('NC Code', '')}
+NC Description: {row.get('NC description', '')}
+Part Type: {row.get('Part type', '')}
+Machine of Occurrence: {row.get('MachineNum of occurrence', '')}
+Defect Description: {row.get('FDefectDesc_EN', '')}
+Root Cause: {row.get('Root cause of occurrence', '')}
+Corrective Action: {row.get('Corrective actions', '')}
+---"""
+
+
+def with_root_cause(context_df: pd.DataFrame) -> pd.DataFrame:
+    """Historical rows that have a root cause, the only ones usable as examples."""
+    root_cause = context_df['Root cause of occurrence']
+    return context_df[root_cause.notna() & (root_cause != '')]
+
+
+def _row_tokens(row: pd.Series, kind: str) -> Set[str]:
+    return {token for col in MATCH_COLUMNS[kind] if col in row.index for token in entity_tokens(kind, row[col])}
+
+
+def _text(df: pd.DataFrame) -> pd.Series:
+    columns = [c for c in QUERY_TEXT_COLUMNS if c in df.columns]
+    text = pd.Series('', index=df.index, dtype=object)
+    for col in columns:
+        text = text + ' ' + df[col].astype(object).where(df[col].notna(), '').astype(str)
+    return text.str.strip()
+
+
+class SelectedContext:
+    """Examples chosen for a prompt, and the token cost against the full history."""
+
+    def __init__(self, examples: List[str], positions: List[int], full_tokens: int):
+        self.examples = examples
+        self.positions = positions
+        self.text = "\n".join(examples)
+        self.tokens = estimate_tokens(self.text)
+        self.full_tokens = full_tokens
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.full_tokens - self.tokens, 0)
+
+
+class ContextSelector:
+    """Ranks historical NCRs by relevance to an input NCR and packs the best ones under a token budget."""
+
+    def __init__(
+        self,
+        context_df: pd.DataFrame,
+        top_k: int = DEFAULT_TOP_K,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        weights: Optional[Dict[str, float]] = None,
+    ):
+        self.history = with_root_cause(context_df).reset_index(drop=True)
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self._version = None
+
+        self.examples = [format_context_example(row) for _, row in self.history.iterrows()]
+        self.example_tokens = np.array([estimate_tokens(e) + 1 for e in self.examples], dtype=np.int64)
+        # What build_context_prompt would cost for the whole history
+        self.full_tokens = estimate_tokens("\n".join(self.examples))
+
+        self._nc_codes = self.history.get('NC Code', pd.Series(index=self.history.index, dtype=object))
+        self._nc_codes = self._nc_codes.astype(object).where(self._nc_codes.notna(), None).to_numpy()
+        self._entities = EntityIndex.from_dataframe(self.history, MATCH_COLUMNS)
+        gold = np.zeros(len(self.history), dtype=bool)
+        if GOLD_COLUMN in self.history.columns:
+            gold = self.history[GOLD_COLUMN].astype(str).str.strip().str.lower().isin(GOLD_VALUES).to_numpy()
+        self._gold = gold
+
+        self._vectorizer = None
+        self._tfidf = None
+        texts = _text(self.history)
+        if len(self.history) and texts.str.len().any():
+            self._vectorizer = TfidfVectorizer(lowercase=True, stop_words='english')
+            try:
+                self._tfidf = self._vectorizer.fit_transform(texts)
+            except ValueError:
+                # Only stop words or empty texts: no text similarity
+                self._vectorizer = None
+
+    def __len__(self) -> int:
+        return len(self.history)
+
+    @property
+    def version(self) -> str:
+        """Hash of everything the selected contexts depend on besides the input NCR."""
+        if self._version is None:
+            digest = hashlib.sha256()
+            settings = {'top_k': self.top_k, 'token_budget': self.token_budget, 'weights': self.weights}
+            digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+            columns = sorted(self.history.columns)
+            digest.update(json.dumps(columns).encode('utf-8'))
+            rows = pd.util.hash_pandas_object(self.history[columns].astype(str), index=False)
+            digest.update(rows.to_numpy().tobytes())
+            self._version = digest.hexdigest()[:16]
+        return self._version
+
+    def scores(self, row: pd.Series) -> np.ndarray:
+        """Relevance of every historical NCR to row."""
+        w = self.weights
+        scores = np.zeros(len(self.history), dtype=np.float64)
+        if not len(scores):
+            return scores
+        nc_code = row.get('NC Code')
+        if isinstance(nc_code, str) and nc_code:
+            scores += w['nc_code'] * (self._nc_codes == nc_code)
+        for kind in MATCH_COLUMNS:
+            postings = self._entities.postings[kind]
+            for token in _row_tokens(row, kind):
+                scores[postings.get(token, EMPTY)] += w[kind]
+        if self._vectorizer is not None:
+            query = self._vectorizer.transform(_text(row.to_frame().T))
+            scores += w['text'] * (self._tfidf @ query.T).toarray().ravel()
+        scores += w['gold'] * self._gold
+        return scores
+
+    def _pack(self, ranked: Iterable[int], limit: int) -> SelectedContext:
+        examples, positions, used = [], [], 0
+        for position in ranked:
+            if len(positions) >= limit:
+                break
+            cost = self.example_tokens[position]
+            if used + cost > self.token_budget:
+                continue
+            examples.append(self.examples[position])
+            positions.append(int(position))
+            used += cost
+        return SelectedContext(examples, positions, self.full_tokens)
+
+    def _ranked(self, scores: np.ndarray) -> np.ndarray:
+        # Highest score first, Gold Samples first among equal scores, then history order
+        return np.lexsort((np.arange(len(scores)), ~self._gold, -scores))
+
+    def select(self, row: pd.Series) -> SelectedContext:
+        """The top_k most relevant examples for one NCR that fit the token budget."""
+        return self._pack(self._ranked(self.scores(row)), self.top_k)
+
+    def select_batch(self, df: pd.DataFrame) -> SelectedContext:
+        """Shared context for several NCRs: each example ranked by its best relevance to any of them."""
+        if df.empty or not len(self.history):
+            return self._pack([], 0)
+        best = np.max([self.scores(row) for _, row in df.iterrows()], axis=0)
+        return self._pack(self._ranked(best), self.top_k * len(df))
@@ -0,0 +1,90 @@
+"""
+Co-occurrence counts of NCR attributes (e.g. Machine x NC Code x Part type).
+
+CooccurrenceIndex counts every pair and triple of a fixed set of fields once, so
+"which combinations occur most" is a lookup instead of a groupby over all NCRs.
+New NCRs are added with update(), which only groups the new rows.
+"""
+
+from itertools import combinations
+from typing import Dict, List, Sequence, Tuple
+
+import pandas as pd
+
+MAX_ORDER = 3
+
+
+class CooccurrenceIndex:
+    """Counts of every distinct value combination for each pair and triple of fields."""
+
+    def __init__(self, fields: Sequence[str], max_order: int = MAX_ORDER):
+        self.fields = list(fields)
+        self.max_order = max_order
+        self.rows = 0
+        self._counts: Dict[Tuple[str, ...], pd.Series] = {}
+        self._ranked: Dict[Tuple[str, ...], pd.Series] = {}
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, fields: Sequence[str], max_order: int = MAX_ORDER) -> 'CooccurrenceIndex':
+        index = cls([f for f in fields if f in df.columns], max_order)
+        index.update(df)
+        return index
+
+    def keys(self) -> List[Tuple[str, ...]]:
+        """Field combinations covered, in field order."""
+        return [
+            key
+            for order in range(2, min(self.max_order, len(self.fields)) + 1)
+            for key in combinations(self.fields, order)
+        ]
+
+    def update(self, df: pd.DataFrame) -> None:
+        """Add the rows of df (rows with a missing value in a combination are not counted for it)."""
+        if df.empty:
+            return
+        values = df[self.fields].astype(object)
+        for key in self.keys():
+            counts = values.groupby(list(key)).size()
+            previous = self._counts.get(key)
+            if previous is not None:
+                counts = previous.add(counts, fill_value=0).astype('int64')
+            self._counts[key] = counts
+        self._ranked.clear()
+        self.rows += len(df)
+
+    def copy(self) -> 'CooccurrenceIndex':
+        other = CooccurrenceIndex(self.fields, self.max_order)
+        other.rows = self.rows
+        other._counts = dict(self._counts)
+        return other
+
+    def _key(self, fields: Sequence[str]) -> Tuple[str, ...]:
+        if len(set(fields)) != len(fields):
+            raise ValueError(f"Fields must be distinct: {list(fields)}")
+        unknown = [f for f in fields if f not in self.fields]
+        if unknown:
+            raise KeyError(f"Fields not indexed: {unknown}")
+        if not 2 <= len(fields) <= self.max_order:
+            raise ValueError(f"Expected 2 to {self.max_order} fields, got {len(fields)}")
+        return tuple(sorted(fields, key=self.fields.index))
+
+    def top(self, fields: Sequence[str], n: int = 15) -> pd.DataFrame:
+        """The n most frequent combinations of fields, columns in the order given plus 'Count'."""
+        key = self._key(fields)
+        if key not in self._ranked:
+            counts = self._counts.get(key, pd.Series(dtype='int64'))
+            self._ranked[key] = counts.sort_values(ascending=False, kind='stable')
+        if self._ranked[key].empty:
+            return pd.DataFrame(columns=list(fields) + ['Count'])
+        top = self._ranked[key].head(n).reset_index()
+        top.columns = list(key) + ['Count']
+        return top[list(fields) + ['Count']]
+
+    def count(self, values: Dict[str, object]) -> int:
+        """Number of NCRs with all the given field values, e.g. count({'NC Code': 'EL0312', 'Part type': 'AA1'})."""
+        key = self._key(list(values))
+        counts = self._counts.get(key)
+        label = tuple(values[f] for f in key)
+        if counts is None or label not in counts.index:
+            return 0
+        return int(counts.loc[label])
@@ -0,0 +1,232 @@
+"""
+Shared data layer for the Dashboard page.
+
+Streamlit reruns the page script on every interaction, so loading, enriching and
+aggregating are done here once per data version instead. A data version is the
+source file's path, size and modification time; the enriched frame, all chart
+aggregates, the trend rollups (src/timeseries.py), the entity index and incidence
+matrix (src/entity_index.py, src/entity_matrix.py) and the early-warning alerts
+(src/early_warning.py) are kept in memory for the current version and shared by
+every session of the process. Touching or replacing the export invalidates them on
+the next call.
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src import instrumentation
+from src.cooccurrence import CooccurrenceIndex
+from src.early_warning import KEY_FIELDS as ALERT_KEY_FIELDS, EarlyWarningDetector, detect
+from src.entity_index import EntityIndex
+from src.entity_matrix import EntityMatrix
+from src.extraction import DEFAULT_CACHE_PATH, EnrichmentCache, enrich_dataframe, load_prod_data
+from src.timeseries import DIMENSIONS, TimeSeriesIndex
+
+PROD_DATA_PATH = 'data/prod_data.csv'
+
+CORRELATION_FIELDS = [
+    'MachineNum of detection',
+    'NC Code',
+    'Part type',
+    'root_cause_category',
+    'corrective_category',
+    'defect_type',
+]
+
+DataVersion = Tuple[str, int, int]
+
+_lock = threading.Lock()
+_data: Dict[str, 'DashboardData'] = {}
+
+
+def data_version(filepath: str) -> DataVersion:
+    """(absolute path, size, mtime in ns) of the source file."""
+    stat = os.stat(filepath)
+    return os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns
+
+
+def _top_counts(values: pd.Series, label: str, count_label: str, n: Optional[int] = None) -> pd.DataFrame:
+    """value_counts as a two-column frame, without unused categories."""
+    counts = values.dropna().value_counts().loc[lambda c: c > 0]
+    if n is not None:
+        counts = counts.head(n)
+    counts = counts.reset_index()
+    counts.columns = [label, count_label]
+    return counts
+
+
+@instrumentation.timed('dashboard.aggregates')
+def compute_aggregates(enriched: pd.DataFrame, timeseries: Optional[TimeSeriesIndex] = None) -> Dict[str, pd.DataFrame]:
+    """All chart tables of the Dashboard page, in display shape (the trend from timeseries when given)."""
+    if timeseries is None:
+        timeseries = TimeSeriesIndex.from_dataframe(enriched, [])
+    trend = timeseries.trend('day').reset_index()
+
+    fqc = _top_counts(enriched['fqc_category'], 'Category', 'Count')
+    fqc = fqc[~fqc['Category'].str.lower().isin(['undefined'])]
+
+    return {
+        'machines': _top_counts(enriched['MachineNum of detection'], 'Machine', 'NCR Count', 10),
+        'nc_codes': _top_counts(enriched['NC Code'], 'NC Code', 'Count', 10),
+        'part_types': _top_counts(enriched['Part type'], 'Part Type', 'NCR Count'),
+        'trend': trend,
+        'root_cause_categories': _top_counts(enriched['root_cause_category'], 'Category', 'Count'),
+        'corrective_categories': _top_counts(enriched['corrective_category'], 'Category', 'Count'),
+        'fqc_categories': fqc,
+    }
+
+
+def row_fingerprints(enriched: pd.DataFrame) -> np.ndarray:
+    """
+    64-bit hash of every column of each row. The indexes read the ID and date columns
+    too, so an edit to any of them must break the prefix check, not only text edits.
+    """
+    return pd.util.hash_pandas_object(enriched, index=False).to_numpy()
+
+
+class DashboardData:
+    """
+    Enriched NCRs and their aggregates for one data version.
+
+    When the previous version's rows are a prefix of the new ones, unchanged in every
+    column (NCRs appended to the export), the co-occurrence index, the trend rollups, the entity index and matrix and
+    the early-warning detector are carried over and only the new rows are counted.
+    """
+
+    def __init__(self, version: DataVersion, enriched: pd.DataFrame, previous: Optional['DashboardData'] = None):
+        self.version = version
+        self.enriched = enriched
+        self.columns = list(enriched.columns)
+        self.fingerprints = row_fingerprints(enriched)
+        self.correlation_fields = [f for f in CORRELATION_FIELDS if f in enriched.columns]
+        self.trend_dimensions = [d for d in DIMENSIONS if d in enriched.columns]
+        appended = previous is not None and previous.is_prefix_of(self)
+        new_rows = enriched.iloc[len(previous):] if appended else enriched
+        with instrumentation.stage('dashboard.timeseries'):
+            if appended:
+                self.timeseries = previous.timeseries.copy()
+                self.timeseries.update(new_rows)
+            else:
+                self.timeseries = TimeSeriesIndex.from_dataframe(enriched, self.trend_dimensions)
+        self.aggregates = compute_aggregates(enriched, self.timeseries)
+        with instrumentation.stage('dashboard.cooccurrence'):
+            if appended:
+                self.cooccurrence = previous.cooccurrence.copy()
+                self.cooccurrence.update(new_rows)
+            else:
+                self.cooccurrence = CooccurrenceIndex.from_dataframe(enriched, self.correlation_fields)
+        with instrumentation.stage('dashboard.entity_index'):
+            if appended:
+                self.entities = previous.entities.copy()
+                self.entities.update(new_rows)
+            else:
+                self.entities = EntityIndex.from_dataframe(enriched)
+        with instrumentation.stage('dashboard.entity_matrix'):
+            # Built from the entity index postings: the texts are tokenized once
+            if appended:
+                self.entity_matrix = previous.entity_matrix.copy()
+                self.entity_matrix.extend(self.entities)
+            else:
+                self.entity_matrix = EntityMatrix.from_index(self.entities)
+        self.early_warning: Optional[EarlyWarningDetector] = None
+        if all(f in enriched.columns for f in ALERT_KEY_FIELDS):
+            with instrumentation.stage('dashboard.early_warning'):
+                # NCRs appended with earlier dates than the ones already fed need a rebuild
+                carry_over = appended and previous.early_warning is not None and previous.early_warning.can_extend(new_rows)
+                if carry_over:
+                    self.early_warning = detect(new_rows, previous.early_warning.copy())
+                else:
+                    self.early_warning = detect(enriched)
+
+    def __len__(self) -> int:
+        return len(self.enriched)
+
+    def is_prefix_of(self, other: 'DashboardData') -> bool:
+        """True if other holds this version's rows, unchanged, followed by new ones."""
+        n = len(self.fingerprints)
+        return (
+            self.columns == other.columns
+            and self.correlation_fields == other.correlation_fields
+            and self.trend_dimensions == other.trend_dimensions
+            and n <= len(other.fingerprints)
+            and np.array_equal(self.fingerprints, other.fingerprints[:n])
+        )
+
+    def trend(self, freq: str = 'day', by: Optional[str] = None, top: Optional[int] = None) -> pd.DataFrame:
+        """NCR counts per day, week or month, optionally one column per top value of by."""
+        return self.timeseries.trend(freq, by, top)
+
+    def lag_trend(self, freq: str = 'week') -> pd.DataFrame:
+        """Mean machining-to-detection lag per day, week or month."""
+        return self.timeseries.lag_trend(freq)
+
+    def involving(
+        self,
+        terms: Dict[str, List[str]],
+        match: str = 'all',
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+    ) -> pd.DataFrame:
+        """NCRs involving the given entities (see EntityIndex.query), in export order."""
+        return self.enriched.iloc[self.entities.query(terms, match, start, end)]
+
+    def alert_counts(self) -> Dict[str, int]:
+        """Total early-warning alerts raised per kind, including those no longer listed."""
+        if self.early_warning is None:
+            return {}
+        return dict(self.early_warning.alert_counts)
+
+    def alerts(self, kind: Optional[str] = None) -> pd.DataFrame:
+        """Early-warning alerts (spikes and recurrences), latest first."""
+        if self.early_warning is None:
+            return pd.DataFrame()
+        return self.early_warning.alert_table(kind)
+
+    def pair_counts(self, field1: str, field2: str, n: int = 15) -> pd.DataFrame:
+        """Top-n co-occurrence counts of two fields."""
+        return self.cooccurrence.top([field1, field2], n)
+
+    def combination_counts(self, fields: List[str], n: int = 15) -> pd.DataFrame:
+        """Top-n co-occurrence counts of two or three fields."""
+        return self.cooccurrence.top(fields, n)
+
+
+@instrumentation.timed_run('load_dashboard_data')
+def load_dashboard_data(
+    filepath: str = PROD_DATA_PATH,
+    cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+    previous: Optional[DashboardData] = None,
+) -> DashboardData:
+    """Load and enrich the export, with the on-disk enrichment cache when cache_path is set."""
+    version = data_version(filepath)
+    df = load_prod_data(filepath)
+    cache = EnrichmentCache(cache_path) if cache_path else None
+    enriched = enrich_dataframe(df, cache=cache)
+    if cache is not None:
+        cache.save()
+    return DashboardData(version, enriched, previous)
+
+
+def get_dashboard_data(filepath: str = PROD_DATA_PATH, cache_path: Optional[str] = DEFAULT_CACHE_PATH) -> DashboardData:
+    """Dashboard data for the current version of filepath, shared across sessions."""
+    key = os.path.abspath(filepath)
+    version = data_version(filepath)
+    current = _data.get(key)
+    if current is not None and current.version == version:
+        return current
+    with _lock:
+        current = _data.get(key)
+        if current is None or current.version != data_version(filepath):
+            current = load_dashboard_data(filepath, cache_path, previous=current)
+            _data[key] = current
+        return current
+
+
+def clear_dashboard_data() -> None:
+    """Drop all loaded versions (the next call reloads from disk)."""
+    with _lock:
+        _data.clear()
@@ -0,0 +1,316 @@
+"""
+Online early-warning detector for recurring and spiking NCR keys.
+
+EarlyWarningDetector is fed one NCR at a time (update) and keys each NCR by
+(NC Code, machine of occurrence, operation of occurrence). For every key it keeps two
+exponentially decayed counts: a recent one (half-life of a week) and a baseline one
+(half-life of a quarter). It raises an alert when, after an NCR:
+
+    spike       the recent count is at least MIN_SPIKE_COUNT and SPIKE_FACTOR times
+                what the baseline rate predicts over the recent window (a new key has
+                no baseline, so its first cluster of NCRs is a spike)
+    recurrence  otherwise, the recent count reaches RECURRENCE_COUNT (the key keeps
+                coming back)
+
+The decayed counts are held in count-min sketches: fixed-size tables whatever the
+number of keys, updated in O(depth) per NCR. Decay is applied forward (weights grow
+with time and estimates are scaled back), so no table-wide decay step is needed on
+update; the table is rescaled only when the weights would overflow. Estimates can
+only over-count (hash collisions), never under-count.
+
+Keys are hashed with a sha256 digest (not hash(), which is salted per process for
+strings), so collisions, and therefore alerts, are the same from one run to the next.
+
+Alerts are kept in a bounded deque, at most one per key and kind per ALERT_COOLDOWN_DAYS;
+alert_counts keeps the totals, including alerts dropped from the deque.
+Time is the detection date of the NCR, so rows should be fed in detection order: a row
+dated before the latest date seen (`now`) is counted at `now`, since adding it at its
+own date would rescale counts already built at later dates. detect() and watch() sort
+their input; can_extend() tells whether a batch can be appended without reordering.
+"""
+
+import argparse
+import functools
+import math
+from array import array
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, Iterable, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from src import instrumentation
+from src.cache_store import content_key
+from src.extraction import DEFAULT_CHUNKSIZE, iter_enriched
+
+KEY_FIELDS = ['NC Code', 'MachineNum of occurrence', 'Operation number of occurrence']
+DATE_FIELD = 'Date of detection'
+
+RECENT_HALF_LIFE_DAYS = 7.0
+BASELINE_HALF_LIFE_DAYS = 90.0
+RECURRENCE_COUNT = 3.0
+SPIKE_FACTOR = 3.0
+MIN_SPIKE_COUNT = 3.0
+ALERT_COOLDOWN_DAYS = 7.0
+MAX_ALERTS = 1000
+
+SKETCH_WIDTH = 2 ** 16
+SKETCH_DEPTH = 4
+# Rescale the forward-decay weights before exp() gets anywhere near float overflow
+MAX_EXPONENT = 300.0
+_PRIME = (1 << 61) - 1
+
+Key = Tuple[Hashable, ...]
+
+
+# Bounded, so memory stays constant however many keys go by
+@functools.lru_cache(maxsize=SKETCH_WIDTH)
+def key_hash(key: Key) -> int:
+    """Stable 61-bit hash of a key, the same in every process."""
+    return int(content_key(*(str(value) for value in key))[:16], 16) & _PRIME
+
+
+def day_number(date: Any) -> Optional[float]:
+    """Timestamp as fractional days since 1970-01-01, None when missing."""
+    if date is None or pd.isna(date):
+        return None
+    return pd.Timestamp(date).value / 86_400e9
+
+
+class DecayedCountMinSketch:
+    """Count-min sketch of counts decayed with a half-life, in days."""
+
+    def __init__(self, half_life_days: float, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH, seed: int = 0):
+        self.half_life_days = half_life_days
+        self.width = width
+        self.depth = depth
+        self.rate = math.log(2) / half_life_days
+        rng = np.random.default_rng(seed)
+        # One hash per row, each offset into its row of the flat table
+        self._hashes = [
+            (int(a), int(b), row * width)
+            for row, (a, b) in enumerate(zip(rng.integers(1, _PRIME, size=depth), rng.integers(0, _PRIME, size=depth)))
+        ]
+        # array.array: compact, and much faster than numpy for a few scalar reads/writes
+        self.table = array('d', bytes(8 * depth * width))
+        self.origin: Optional[float] = None
+
+    def _cells(self, key: Union[Key, int]) -> List[int]:
+        h = key if isinstance(key, int) else key_hash(key)
+        return [offset + ((a * h + b) % _PRIME) % self.width for a, b, offset in self._hashes]
+
+    def _weight(self, day: float) -> float:
+        if self.origin is None:
+            self.origin = day
+        exponent = (day - self.origin) * self.rate
+        if exponent > MAX_EXPONENT:
+            # Move the origin forward: O(width * depth), once every MAX_EXPONENT / rate days
+            np.frombuffer(self.table, dtype=np.float64)[:] *= math.exp(-exponent)
+            self.origin = day
+            exponent = 0.0
+        return math.exp(exponent)
+
+    def add(self, key: Union[Key, int], day: float, count: float = 1.0) -> float:
+        """Add count occurrences of key (or its key_hash) at day; returns the decayed count of key at day."""
+        weight = self._weight(day)
+        table = self.table
+        increment = count * weight
+        smallest = math.inf
+        for cell in self._cells(key):
+            value = table[cell] + increment
+            table[cell] = value
+            smallest = min(smallest, value)
+        return smallest / weight
+
+    def estimate(self, key: Union[Key, int], day: float) -> float:
+        """Decayed count of key at day (never below the true count)."""
+        if self.origin is None:
+            return 0.0
+        weight = math.exp((day - self.origin) * self.rate)
+        return min(self.table[cell] for cell in self._cells(key)) / weight
+
+    def copy(self) -> 'DecayedCountMinSketch':
+        other = DecayedCountMinSketch.__new__(DecayedCountMinSketch)
+        other.__dict__.update(self.__dict__)
+        other.table = array('d', self.table)
+        return other
+
+
+class EarlyWarningDetector:
+    """Streaming recurrence and spike detection per (NC Code, machine, operation) key."""
+
+    def __init__(
+        self,
+        key_fields: List[str] = KEY_FIELDS,
+        recent_half_life_days: float = RECENT_HALF_LIFE_DAYS,
+        baseline_half_life_days: float = BASELINE_HALF_LIFE_DAYS,
+        recurrence_count: float = RECURRENCE_COUNT,
+        spike_factor: float = SPIKE_FACTOR,
+        min_spike_count: float = MIN_SPIKE_COUNT,
+        cooldown_days: float = ALERT_COOLDOWN_DAYS,
+        max_alerts: int = MAX_ALERTS,
+        width: int = SKETCH_WIDTH,
+        depth: int = SKETCH_DEPTH,
+    ):
+        self.key_fields = list(key_fields)
+        self.recurrence_count = recurrence_count
+        self.spike_factor = spike_factor
+        self.min_spike_count = min_spike_count
+        self.cooldown_days = cooldown_days
+        self.recent = DecayedCountMinSketch(recent_half_life_days, width, depth, seed=0)
+        self.baseline = DecayedCountMinSketch(baseline_half_life_days, width, depth, seed=1)
+        # At a steady rate, (baseline - recent) * ratio == recent
+        self._expected_ratio = recent_half_life_days / (baseline_half_life_days - recent_half_life_days)
+        self.alerts: Deque[Dict[str, Any]] = deque(maxlen=max_alerts)
+        self.alert_counts: Dict[str, int] = {'spike': 0, 'recurrence': 0}
+        # Day of the last alert per (kind, key), oldest first; only those within the cooldown are kept
+        self._last_alert: 'OrderedDict[Tuple[str, Key], float]' = OrderedDict()
+        self.now: Optional[float] = None
+        self.updates = 0
+
+    def key(self, row: Mapping) -> Optional[Key]:
+        """Key of row, None when a key field is missing."""
+        key = tuple(row.get(field) for field in self.key_fields)
+        if any(value is None or (not isinstance(value, str) and pd.isna(value)) for value in key):
+            return None
+        return key
+
+    def update(self, row: Mapping) -> List[Dict[str, Any]]:
+        """Count one NCR (a row as a mapping); returns the alerts it raised. Rows without a date count at the latest date seen."""
+        return self._update(self.key(row), day_number(row.get(DATE_FIELD)))
+
+    def _update(self, key: Optional[Key], day: Optional[float]) -> List[Dict[str, Any]]:
+        if day is None or (self.now is not None and day < self.now):
+            day = self.now
+        if key is None or day is None:
+            return []
+        self.now = day
+        self.updates += 1
+
+        hashed = key_hash(key)
+        recent = self.recent.add(hashed, day)
+        baseline = self.baseline.add(hashed, day)
+        # Baseline built before this window: the recent NCRs are taken out
+        expected = max(baseline - recent, 0.0) * self._expected_ratio
+        if recent >= self.min_spike_count and recent >= self.spike_factor * expected:
+            kind = 'spike'
+        elif recent >= self.recurrence_count:
+            kind = 'recurrence'
+        else:
+            return []
+
+        last = self._last_alert.get((kind, key))
+        if last is not None and day - last < self.cooldown_days:
+            return []
+        # Days never decrease, so moving the key to the end keeps the dict in time order
+        self._last_alert[(kind, key)] = day
+        self._last_alert.move_to_end((kind, key))
+        self._forget_old_alerts()
+
+        alert = {
+            'kind': kind,
+            'date': pd.Timestamp(round(day * 86_400e9)),
+            **dict(zip(self.key_fields, key)),
+            'recent_count': round(recent, 2),
+            'expected_count': round(expected, 2),
+        }
+        self.alerts.append(alert)
+        self.alert_counts[kind] += 1
+        instrumentation.count(f'early_warning_{kind}_alerts')
+        return [alert]
+
+    def _forget_old_alerts(self) -> None:
+        while self._last_alert and self.now - next(iter(self._last_alert.values())) >= self.cooldown_days:
+            self._last_alert.popitem(last=False)
+
+    def update_frame(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """update() each row of df in order; returns the alerts raised."""
+        if df.empty:
+            return []
+        missing = [f for f in self.key_fields if f not in df.columns]
+        if missing:
+            raise KeyError(f"Missing key columns: {missing}")
+        keys = df[self.key_fields].astype(object)
+        complete = keys.notna().all(axis=1).to_numpy()
+        if DATE_FIELD in df.columns:
+            dates = pd.to_datetime(df[DATE_FIELD])
+            days = (dates.to_numpy(dtype='datetime64[ns]').astype('int64') / 86_400e9).tolist()
+            days = [None if missing else d for d, missing in zip(days, dates.isna().to_numpy())]
+        else:
+            days = [None] * len(df)
+        alerts = []
+        with instrumentation.stage('early_warning.update'):
+            for key, ok, day in zip(keys.itertuples(index=False, name=None), complete, days):
+                alerts.extend(self._update(key if ok else None, day))
+        return alerts
+
+    @property
+    def total_alerts(self) -> int:
+        """Alerts raised so far, including those no longer kept in alerts."""
+        return sum(self.alert_counts.values())
+
+    def can_extend(self, df: pd.DataFrame) -> bool:
+        """True if no row of df is dated before the latest date seen (detect(df, self) then matches a full rebuild)."""
+        if self.now is None or df.empty or DATE_FIELD not in df.columns:
+            return True
+        first = day_number(df[DATE_FIELD].min())
+        return first is None or first >= self.now
+
+    def copy(self) -> 'EarlyWarningDetector':
+        other = EarlyWarningDetector.__new__(EarlyWarningDetector)
+        other.__dict__.update(self.__dict__)
+        other.recent = self.recent.copy()
+        other.baseline = self.baseline.copy()
+        other.alerts = deque(self.alerts, maxlen=self.alerts.maxlen)
+        other._last_alert = OrderedDict(self._last_alert)
+        other.alert_counts = dict(self.alert_counts)
+        return other
+
+    def alert_table(self, kind: Optional[str] = None, since: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        """Alerts raised so far, latest first, optionally of one kind and from a date on."""
+        alerts = [
+            a for a in reversed(self.alerts)
+            if (kind is None or a['kind'] == kind) and (since is None or a['date'] >= since)
+        ]
+        return pd.DataFrame(alerts, columns=['kind', 'date'] + self.key_fields + ['recent_count', 'expected_count'])
+
+
+def _in_detection_order(df: pd.DataFrame) -> pd.DataFrame:
+    """Dated rows of df sorted by detection date (rows without one cannot be placed in time)."""
+    if DATE_FIELD not in df.columns:
+        return df
+    return df[df[DATE_FIELD].notna()].sort_values(DATE_FIELD, kind='stable')
+
+
+def detect(df: pd.DataFrame, detector: Optional[EarlyWarningDetector] = None) -> EarlyWarningDetector:
+    """Feed the dated NCRs of df to a detector (a new one by default) in detection-date order."""
+    detector = detector or EarlyWarningDetector()
+    detector.update_frame(_in_detection_order(df))
+    return detector
+
+
+def watch(frames: Iterable[pd.DataFrame], detector: Optional[EarlyWarningDetector] = None) -> Iterable[Dict[str, Any]]:
+    """
+    Alerts raised as the NCRs of each frame (e.g. chunks of iter_enriched) are fed in.
+
+    Each frame is sorted by detection date; rows dated before an earlier frame's are
+    counted at the latest date seen, so the input should be roughly in detection order.
+    """
+    detector = detector or EarlyWarningDetector()
+    for frame in frames:
+        yield from detector.update_frame(_in_detection_order(frame))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stream an NCR export through the early-warning detector.')
+    parser.add_argument('--input', default='data/prod_data.csv', help='semicolon-separated NCR export (each chunk is sorted by detection date)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--recurrence', type=float, default=RECURRENCE_COUNT, help='recent NCRs of a key that make a recurrence')
+    parser.add_argument('--spike-factor', type=float, default=SPIKE_FACTOR, help='recent NCRs over the baseline expectation that make a spike')
+    args = parser.parse_args()
+
+    detector = EarlyWarningDetector(recurrence_count=args.recurrence, spike_factor=args.spike_factor)
+    for alert in watch(iter_enriched(args.input, args.chunksize), detector):
+        key = ' / '.join(str(alert[f]) for f in detector.key_fields)
+        print(f"{alert['date']:%Y-%m-%d} {alert['kind']:<10} {key}  recent {alert['recent_count']:.1f}, expected {alert['expected_count']:.1f}")
+    print(f"{detector.updates} NCRs, {detector.total_alerts} alerts")
@@ -0,0 +1,239 @@
+"""
+Inverted index of the entities NCRs involve, for "NCRs involving X" queries.
+
+EntityIndex maps every machine, NC code, operation, operator and part type to the
+sorted row IDs (positions in the indexed frame) of the NCRs involving it, from the ID
+columns and from the entities extracted from the texts (extracted_machines, ...).
+A query looks its values up, combines the posting lists (OR within an entity kind,
+AND or OR across kinds) and keeps the rows detected within a date range, so its cost
+depends on the posting lists involved, not on the size of the history.
+
+Operations are indexed by their digits, so 'OP7200', '7200' and 7200.0 are the same
+operation. New NCRs are added with update(), which only tokenizes the new rows;
+row IDs continue from the previous ones.
+
+This is the one entity -> rows index of the app: EntityMatrix (src/entity_matrix.py) is
+built from its posting lists, and the similarity search and context retrieval filter
+and score with their own EntityIndex over the columns they use.
+"""
+
+import math
+import re
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from src.timeseries import DETECTION_COLUMN, INT32_NAT, to_day_numbers
+
+ENTITY_COLUMNS = {
+    'machine': ['MachineNum of detection', 'MachineNum of occurrence', 'extracted_machines'],
+    'nc_code': ['NC Code', 'extracted_nc_codes'],
+    'operation': ['Operation number of detection', 'Operation number of occurrence', 'extracted_operations'],
+    'operator': ['Operator of detection', 'operator of machining'],
+    'part_type': ['Part type'],
+}
+
+PLACEHOLDERS = {'', '/', '\\', ','}
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+_NUMBER_RE = re.compile(r'\d+')
+_OPERATION_RE = re.compile(r'(?:OP)?\d+', re.IGNORECASE)
+
+Values = Union[object, Sequence[object]]
+DateLike = Union[str, pd.Timestamp, None]
+Postings = Dict[str, Dict[str, np.ndarray]]
+
+
+def cell_tokens(value) -> List[str]:
+    """The comma-separated entities of a cell, without blanks and placeholders."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return []
+    return [token for token in (t.strip() for t in str(value).split(',')) if token not in PLACEHOLDERS]
+
+
+def operation_tokens(value) -> List[str]:
+    """Operation numbers in a cell: 7200, 7200.0, 'OP7200' and 'OP7200, OP5800' all give digits."""
+    if isinstance(value, float) and not math.isnan(value) and value.is_integer():
+        value = int(value)
+    return [number for token in cell_tokens(value) for number in _NUMBER_RE.findall(token)]
+
+
+def entity_tokens(kind: str, value) -> List[str]:
+    """Index tokens of one cell: the comma-separated entities, operations reduced to digits."""
+    if kind == 'operation':
+        return operation_tokens(value)
+    return cell_tokens(value)
+
+
+def _is_operation(value) -> bool:
+    """Whether a value of unknown kind can name an operation ('OP7200', 7200), not e.g. 'EM1060'."""
+    return not isinstance(value, str) or _OPERATION_RE.fullmatch(value.strip()) is not None
+
+
+def _column_postings(values: pd.Series, kind: str, offset: int) -> Dict[str, np.ndarray]:
+    """token -> sorted row IDs for one column; each distinct cell is tokenized once."""
+    codes, uniques = pd.factorize(values.astype(object), use_na_sentinel=True)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    rows_by_token: Dict[str, List[np.ndarray]] = {}
+    for code, value in enumerate(uniques):
+        rows = order[bounds[code]:bounds[code + 1]] + offset
+        for token in entity_tokens(kind, value):
+            rows_by_token.setdefault(token, []).append(rows)
+    return {
+        token: parts[0] if len(parts) == 1 else np.unique(np.concatenate(parts))
+        for token, parts in rows_by_token.items()
+    }
+
+
+def entity_postings(df: pd.DataFrame, entity_columns: Mapping[str, Sequence[str]], offset: int = 0) -> Postings:
+    """kind -> token -> sorted row IDs (offset + position in df) of the rows involving it."""
+    postings: Postings = {}
+    for kind, columns in entity_columns.items():
+        postings[kind] = {}
+        for col in columns:
+            if col in df.columns:
+                _merge(postings[kind], _column_postings(df[col], kind, offset))
+    return postings
+
+
+def _merge(postings: Dict[str, np.ndarray], new: Dict[str, np.ndarray]) -> None:
+    for token, rows in new.items():
+        previous = postings.get(token)
+        postings[token] = rows if previous is None else np.union1d(previous, rows)
+
+
+def _day(date: DateLike) -> Optional[int]:
+    if date is None:
+        return None
+    return int(pd.Timestamp(date).to_datetime64().astype('datetime64[D]').astype(np.int64))
+
+
+class EntityIndex:
+    """Posting lists of row IDs per entity kind and value, with the detection day of each row."""
+
+    def __init__(self, entity_columns: Mapping[str, Sequence[str]] = ENTITY_COLUMNS):
+        self.entity_columns = {kind: list(columns) for kind, columns in entity_columns.items()}
+        self.postings: Postings = {kind: {} for kind in self.entity_columns}
+        self.days = np.empty(0, dtype=np.int32)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, entity_columns: Mapping[str, Sequence[str]] = ENTITY_COLUMNS) -> 'EntityIndex':
+        index = cls(entity_columns)
+        index.update(df)
+        return index
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[pd.DataFrame], entity_columns: Mapping[str, Sequence[str]] = ENTITY_COLUMNS) -> 'EntityIndex':
+        """Index chunks as they come out of the enrichment pipeline (e.g. iter_enriched)."""
+        index = cls(entity_columns)
+        for chunk in chunks:
+            index.update(chunk)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def update(self, df: pd.DataFrame) -> None:
+        """Index the rows of df as the next row IDs."""
+        if df.empty:
+            return
+        for kind, new in entity_postings(df, self.entity_columns, len(self)).items():
+            _merge(self.postings[kind], new)
+        if DETECTION_COLUMN in df.columns:
+            days = to_day_numbers(df[DETECTION_COLUMN])
+        else:
+            days = np.full(len(df), INT32_NAT, dtype=np.int32)
+        self.days = np.concatenate([self.days, days])
+
+    def copy(self) -> 'EntityIndex':
+        other = EntityIndex(self.entity_columns)
+        other.postings = {kind: dict(postings) for kind, postings in self.postings.items()}
+        other.days = self.days
+        return other
+
+    def _kind(self, kind: str) -> Dict[str, np.ndarray]:
+        if kind not in self.postings:
+            raise KeyError(f"Unknown entity kind {kind!r}, expected one of {list(self.postings)}")
+        return self.postings[kind]
+
+    def values(self, kind: str) -> pd.Series:
+        """Number of NCRs involving each value of kind, most frequent first."""
+        postings = self._kind(kind)
+        counts = pd.Series({token: len(rows) for token, rows in postings.items()}, dtype='int64')
+        return counts.sort_values(ascending=False, kind='stable')
+
+    def lookup(self, kind: str, values: Values) -> np.ndarray:
+        """Sorted row IDs of the NCRs involving any of values (one value or a list)."""
+        postings = self._kind(kind)
+        if isinstance(values, (str, bytes)) or not isinstance(values, Iterable):
+            values = [values]
+        lists = [
+            postings[token]
+            for value in values
+            for token in entity_tokens(kind, value)
+            if token in postings
+        ]
+        if not lists:
+            return EMPTY
+        if len(lists) == 1:
+            return lists[0]
+        return np.unique(np.concatenate(lists))
+
+    def lookup_any(self, value) -> np.ndarray:
+        """Sorted row IDs of the NCRs involving value as any kind of entity ('EM1060', 'CO2610', 'OP7200')."""
+        lists = [
+            self.lookup(kind, value)
+            for kind in self.postings
+            if kind != 'operation' or _is_operation(value)
+        ]
+        lists = [rows for rows in lists if len(rows)]
+        if not lists:
+            return EMPTY
+        return lists[0] if len(lists) == 1 else np.unique(np.concatenate(lists))
+
+    def query(
+        self,
+        terms: Optional[Mapping[str, Values]] = None,
+        match: str = 'all',
+        start: DateLike = None,
+        end: DateLike = None,
+    ) -> np.ndarray:
+        """
+        Sorted row IDs of the NCRs matching terms and detected between start and end (inclusive).
+
+        terms maps entity kinds to a value or a list of values; the values of one kind are
+        OR-ed, and kinds are AND-ed (match='all') or OR-ed (match='any'), e.g.
+        query({'machine': ['EM1060', 'EM1061'], 'operation': 'OP7200'}, start='2025-12-01').
+        Without terms, every NCR in the date range matches.
+        """
+        if match not in ('all', 'any'):
+            raise ValueError(f"match must be 'all' or 'any', got {match!r}")
+        if terms:
+            lists = [self.lookup(kind, values) for kind, values in terms.items()]
+            if match == 'all':
+                lists.sort(key=len)
+                rows = lists[0]
+                for other in lists[1:]:
+                    if not len(rows):
+                        break
+                    rows = np.intersect1d(rows, other, assume_unique=True)
+            else:
+                rows = np.unique(np.concatenate(lists))
+        else:
+            rows = np.arange(len(self), dtype=np.int64)
+        return self._in_date_range(rows, start, end)
+
+    def _in_date_range(self, rows: np.ndarray, start: DateLike, end: DateLike) -> np.ndarray:
+        first, last = _day(start), _day(end)
+        if first is None and last is None:
+            return rows
+        days = self.days[rows]
+        keep = days != INT32_NAT
+        if first is not None:
+            keep &= days >= first
+        if last is not None:
+            keep &= days <= last
+        return rows[keep]
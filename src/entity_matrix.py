@@ -0,0 +1,225 @@
+"""
+Interned entity IDs and a sparse NCR x entity incidence matrix.
+
+The extracted entities of enrich_dataframe are comma-joined strings, one Python string
+per cell. EntityMatrix interns every entity (machine, NC code, operation, operator,
+part type) to an integer ID and keeps which NCRs involve which entities as a scipy CSR
+matrix of ones, int32 indices and int8 values. It is built from the posting lists of an
+EntityIndex (src/entity_index.py), so both agree on the entities of every NCR. The
+questions then become sparse linear algebra:
+
+    frequencies     column sums (NCRs involving each entity)
+    cooccurrence    A.T @ B over the columns of two entity kinds
+    related         entity column.T @ incidence (entities of the NCRs involving one entity)
+    rows            the NCRs involving an entity (one CSC column)
+
+New NCRs are added with update(), or extend() from an EntityIndex that already has
+them; only the entities they bring in are interned.
+"""
+
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from src.entity_index import ENTITY_COLUMNS, EntityIndex, Postings, entity_postings, entity_tokens
+
+# Counts come from int8 cells; products are computed in this type
+COUNT_DTYPE = np.int32
+
+
+class EntityVocabulary:
+    """Interned (kind, value) entities; IDs are assigned in order of first appearance."""
+
+    def __init__(self):
+        self.kinds: List[str] = []
+        self.values: List[str] = []
+        self._ids: Dict[Tuple[str, str], int] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def intern(self, kind: str, value: str) -> int:
+        key = (kind, value)
+        entity_id = self._ids.get(key)
+        if entity_id is None:
+            entity_id = len(self.values)
+            self._ids[key] = entity_id
+            self.kinds.append(kind)
+            self.values.append(value)
+        return entity_id
+
+    def id(self, kind: str, value: object) -> Optional[int]:
+        """ID of an entity (normalized like the index, e.g. 'OP7200' -> '7200'), None if unknown."""
+        tokens = entity_tokens(kind, value)
+        return self._ids.get((kind, tokens[0])) if len(tokens) == 1 else None
+
+    def ids_of_kind(self, kind: str) -> np.ndarray:
+        return np.flatnonzero(np.asarray(self.kinds, dtype=object) == kind)
+
+    def copy(self) -> 'EntityVocabulary':
+        other = EntityVocabulary()
+        other.kinds = list(self.kinds)
+        other.values = list(self.values)
+        other._ids = dict(self._ids)
+        return other
+
+
+class EntityMatrix:
+    """NCR x entity incidence matrix (CSR) over an interned entity vocabulary."""
+
+    def __init__(self, entity_columns: Mapping[str, Sequence[str]] = ENTITY_COLUMNS):
+        self.entity_columns = {kind: list(columns) for kind, columns in entity_columns.items()}
+        self.vocabulary = EntityVocabulary()
+        self.incidence = sp.csr_matrix((0, 0), dtype=np.int8)
+        self._csc: Optional[sp.csc_matrix] = None
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, entity_columns: Mapping[str, Sequence[str]] = ENTITY_COLUMNS) -> 'EntityMatrix':
+        matrix = cls(entity_columns)
+        matrix.update(df)
+        return matrix
+
+    @classmethod
+    def from_index(cls, index: EntityIndex) -> 'EntityMatrix':
+        """Matrix of the NCRs of an EntityIndex, from its posting lists (no re-tokenizing)."""
+        matrix = cls(index.entity_columns)
+        matrix.extend(index)
+        return matrix
+
+    def __len__(self) -> int:
+        return self.incidence.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory of the incidence matrix arrays."""
+        m = self.incidence
+        return m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+
+    def _append(self, postings: Postings, start: int, stop: int) -> None:
+        """Add rows start..stop-1 of postings (kind -> token -> sorted row IDs) as the next NCRs."""
+        rows, ids = [], []
+        for kind, tokens in postings.items():
+            for token, token_rows in tokens.items():
+                token_rows = token_rows[np.searchsorted(token_rows, start):np.searchsorted(token_rows, stop)]
+                if len(token_rows):
+                    rows.append(token_rows - start)
+                    ids.append(np.full(len(token_rows), self.vocabulary.intern(kind, token), dtype=np.int32))
+        width = len(self.vocabulary)
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int32)
+        # A posting list holds each row once, so every cell is a single 1
+        new = sp.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, ids)), shape=(stop - start, width))
+        old = self.incidence
+        old = sp.csr_matrix((old.data, old.indices, old.indptr), shape=(old.shape[0], width))
+        self.incidence = sp.vstack([old, new], format='csr', dtype=np.int8)
+        self.incidence.indices = self.incidence.indices.astype(np.int32, copy=False)
+        self._csc = None
+
+    def update(self, df: pd.DataFrame) -> None:
+        """Add the rows of df as the next NCRs, interning new entities."""
+        if df.empty:
+            return
+        self._append(entity_postings(df, self.entity_columns), 0, len(df))
+
+    def extend(self, index: EntityIndex) -> None:
+        """Add the NCRs index has beyond the rows of this matrix (same row IDs)."""
+        if len(index) > len(self):
+            self._append(index.postings, len(self), len(index))
+
+    def copy(self) -> 'EntityMatrix':
+        other = EntityMatrix(self.entity_columns)
+        other.vocabulary = self.vocabulary.copy()
+        other.incidence = self.incidence
+        return other
+
+    @property
+    def csc(self) -> sp.csc_matrix:
+        """Column-major copy for per-entity access, built on first use."""
+        if self._csc is None:
+            self._csc = self.incidence.tocsc()
+        return self._csc
+
+    def _ids(self, kind: Optional[str]) -> np.ndarray:
+        if kind is None:
+            return np.arange(len(self.vocabulary))
+        if kind not in self.entity_columns:
+            raise KeyError(f"Unknown entity kind {kind!r}, expected one of {list(self.entity_columns)}")
+        return self.vocabulary.ids_of_kind(kind)
+
+    def _entity(self, kind: str, value: object) -> int:
+        entity_id = self.vocabulary.id(kind, value)
+        if entity_id is None:
+            raise KeyError(f"Unknown {kind} {value!r}")
+        return entity_id
+
+    def labels(self, ids: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """kind and value of entity IDs (all by default)."""
+        ids = np.arange(len(self.vocabulary)) if ids is None else ids
+        kinds = np.asarray(self.vocabulary.kinds, dtype=object)
+        values = np.asarray(self.vocabulary.values, dtype=object)
+        return pd.DataFrame({'kind': kinds[ids], 'value': values[ids]}, index=pd.Index(ids, name='entity_id'))
+
+    def frequencies(self, kind: Optional[str] = None, rows: Optional[np.ndarray] = None) -> pd.Series:
+        """NCRs involving each entity of kind (among rows when given), most frequent first."""
+        ids = self._ids(kind)
+        matrix = self.incidence if rows is None else self.incidence[rows]
+        counts = np.asarray(matrix.sum(axis=0, dtype=COUNT_DTYPE)).ravel()[ids]
+        values = np.asarray(self.vocabulary.values, dtype=object)[ids]
+        index = values if kind is not None else pd.MultiIndex.from_arrays(
+            [np.asarray(self.vocabulary.kinds, dtype=object)[ids], values], names=['kind', 'value']
+        )
+        frequencies = pd.Series(counts, index=index, name='NCRs')
+        return frequencies[frequencies > 0].sort_values(ascending=False, kind='stable')
+
+    def rows(self, kind: str, value: object) -> np.ndarray:
+        """Sorted row IDs of the NCRs involving one entity."""
+        entity_id = self._entity(kind, value)
+        csc = self.csc
+        rows = csc.indices[csc.indptr[entity_id]:csc.indptr[entity_id + 1]]
+        return np.sort(rows)
+
+    def cooccurrence_matrix(self, kind_a: str, kind_b: str) -> Tuple[sp.csr_matrix, np.ndarray, np.ndarray]:
+        """(counts, ids_a, ids_b): counts[i, j] NCRs involving both entities ids_a[i] and ids_b[j]."""
+        ids_a, ids_b = self._ids(kind_a), self._ids(kind_b)
+        a = self.csc[:, ids_a].astype(COUNT_DTYPE)
+        b = a if kind_b == kind_a else self.csc[:, ids_b].astype(COUNT_DTYPE)
+        return (a.T @ b).tocsr(), ids_a, ids_b
+
+    def cooccurrence(self, kind_a: str, kind_b: str, n: int = 15) -> pd.DataFrame:
+        """The n most frequent pairs of a kind_a and a kind_b entity, with their NCR count."""
+        counts, ids_a, ids_b = self.cooccurrence_matrix(kind_a, kind_b)
+        counts = counts.tocoo()
+        keep = counts.row < counts.col if kind_a == kind_b else np.ones(counts.nnz, dtype=bool)
+        order = np.argsort(-counts.data[keep], kind='stable')[:n]
+        values = np.asarray(self.vocabulary.values, dtype=object)
+        label_b = kind_b if kind_b != kind_a else f'{kind_b} (2)'
+        return pd.DataFrame({
+            kind_a: values[ids_a[counts.row[keep][order]]],
+            label_b: values[ids_b[counts.col[keep][order]]],
+            'Count': counts.data[keep][order],
+        })
+
+    def related(self, kind: str, value: object, other_kind: Optional[str] = None, n: int = 15) -> pd.Series:
+        """Entities (of other_kind) most often in the NCRs involving one entity."""
+        entity_id = self._entity(kind, value)
+        column = self.csc[:, [entity_id]].astype(COUNT_DTYPE)
+        counts = np.asarray((column.T @ self.incidence.astype(COUNT_DTYPE)).todense()).ravel()
+        counts[entity_id] = 0
+        ids = self._ids(other_kind)
+        related = pd.Series(counts[ids], index=self.labels(ids).set_index(['kind', 'value']).index, name='NCRs')
+        if other_kind is not None:
+            related.index = related.index.droplevel('kind')
+        return related[related > 0].sort_values(ascending=False, kind='stable').head(n)
+
+    def to_strings(self, kind: str) -> pd.Series:
+        """The entities of kind of each NCR joined with ', ' (entity ID order), like the extracted_* columns."""
+        ids = self._ids(kind)
+        values = np.asarray(self.vocabulary.values, dtype=object)
+        sub = self.incidence[:, ids]
+        sub.sort_indices()
+        return pd.Series([
+            ', '.join(values[ids[sub.indices[start:end]]])
+            for start, end in zip(sub.indptr[:-1], sub.indptr[1:])
+        ], name=kind)
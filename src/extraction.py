@@ -1,21 +1,69 @@
+import argparse
+import functools
+import hashlib
+import json
+import os
 import re
-from typing import Dict, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
 import pandas as pd
 import numpy as np
+from src import instrumentation
+from src.schema import DATE_COLUMNS, ID_COLUMNS, NUMERIC_COLUMNS, apply_schema, read_dtypes
+from src.timeseries import LAG_COLUMN, detection_lag_days
+from src.storage import ENRICHED_PARQUET_PATH, ChunkWriter, load_enriched
+from src.rules import (
+    RULES,
+    DEFECT_SCORER,
+    CORRECTIVE_RULES,
+    ROOT_CAUSE_RULES,
+    FQC_RULES,
+    DEFECT_RULES,
+)
  
 MACHINE_PATTERN = r'\b(EM\d+|AAAA-\d+-\d+|BBBB-\d+-\d+|CCCC-\d+-\d+|MARK-\d+-\d+)\b'
 NC_CODE_PATTERN = r'\b([A-Z]{2}\d{4})\b'
 JOB_ORDER_PATTERN = r'\b(AA[12]_\d+)\b'
 OPERATION_PATTERN = r'\b(OP\d+)\b'
- 
-DEFECT_KEYWORDS = {
-    'dimensional': ['dimensional', 'diameter', 'tolerance', 'mm', 'out of tolerance', 'measured', 'gauge', 'no-go'],
-    'surface': ['surface', 'scratch', 'dent', 'pit', 'bulge', 'offset'],
-    'marking': ['marking', 'faint', 'unrecognizable', 'character', 'dot', 'label'],
-    'appearance': ['appearance', 'collapse', 'tooth', 'rib', 'slot'],
-    'process': ['deviation', 'calibration', 'compensation', 'clamping', 'centering', 'not stable'],
-    'measurement': ['re-measurement', 'after re-measurement', 'FCTD', 'mini program'],
+
+ENTITY_PATTERNS = {
+    'machines': MACHINE_PATTERN,
+    'nc_codes': NC_CODE_PATTERN,
+    'operations': OPERATION_PATTERN,
 }
+# One scan finds every candidate token; each token is then classified against the
+# individual patterns, so a token such as EM1060 can be both a machine and an NC code.
+ENTITY_RE = re.compile('|'.join(f'(?:{p})' for p in ENTITY_PATTERNS.values()))
+ENTITY_KIND_RES = {kind: re.compile(p) for kind, p in ENTITY_PATTERNS.items()}
+
+COMMENT_DATE_PATTERN = r'\d{4}[./-]\d{2}[./-]\d{2}'
+COMMENT_CODE_PATTERN = r'[A-Z]{4}-\d{2}-\d{2}'
+# Placeholders in ID columns (see src/schema.py) contain /, \ or ,; in free text, commas and
+# slashes are content, and only a blank cell or a lone /, \ or , is a placeholder.
+PLACEHOLDER_PATTERNS = [r'[\/\\,]', r'^\s*$']
+PLACEHOLDER_RE = re.compile('|'.join(PLACEHOLDER_PATTERNS))
+TEXT_PLACEHOLDER_PATTERN = r'^\s*[\/\\,]?\s*$'
+TEXT_PLACEHOLDER_RE = re.compile(TEXT_PLACEHOLDER_PATTERN)
+
+# Rows per chunk when streaming an export through the enrichment pipeline.
+DEFAULT_CHUNKSIZE = 50_000
+
+# Parallel enrichment: below PARALLEL_MIN_ROWS rows (or on one core) the serial path is
+# faster than shipping shards to worker processes; shards have at least MIN_SHARD_ROWS rows.
+PARALLEL_MIN_ROWS = 20_000
+MIN_SHARD_ROWS = 5_000
+
+# Columns the derived enrichment columns are computed from; they key the enrichment cache.
+SOURCE_COLUMNS = ['Job order', 'NC description', 'FDefectDesc_EN', 'Fqccomments_EN',
+                  'Root cause of occurrence', 'Corrective actions']
+# Columns derive_columns reads
+DERIVE_COLUMNS = ['NC description', 'FDefectDesc_EN', 'Fqccomments_EN',
+                  'Root cause of occurrence', 'Corrective actions']
+DEFAULT_CACHE_PATH = 'data/.enrichment_cache.pkl'
+# Bump when the enrichment code changes in a way the patterns and rules below don't capture.
+ENRICHMENT_VERSION = 1
+ 
+DEFECT_KEYWORDS = RULES['defect_keywords']
  
  
 def extract_machines(text: str) -> List[str]:
@@ -31,15 +79,7 @@ def extract_operations(text: str) -> List[str]:
  
  
 def classify_defect(text: str) -> str:
-    text_lower = text.lower()
-    scores = {}
-    for defect_type, keywords in DEFECT_KEYWORDS.items():
-        score = sum(1 for kw in keywords if kw.lower() in text_lower)
-        if score > 0:
-            scores[defect_type] = score
-    if scores:
-        return max(scores, key=scores.get)
-    return 'unknown'
+    return DEFECT_SCORER.classify(text)
  
  
 def extract_all(text: str) -> Dict:
@@ -51,169 +91,419 @@ def extract_all(text: str) -> Dict:
     }
 
 
+def extract_entity_columns(texts: pd.Series) -> pd.DataFrame:
+    """Column-wise extract_machines/extract_nc_codes/extract_operations, joined with ', '."""
+    result = pd.DataFrame({kind: '' for kind in ENTITY_PATTERNS}, index=texts.index, dtype=object)
+    matches = texts.reset_index(drop=True).str.findall(ENTITY_RE).explode().dropna()
+    if matches.empty:
+        return result
+
+    # findall yields one tuple per match with only the matching alternative's group set.
+    groups = pd.DataFrame(matches.tolist(), index=matches.index)
+    found = pd.DataFrame({
+        'row': matches.index,
+        'token': groups.sum(axis=1).to_numpy(dtype=object),
+    }).drop_duplicates()
+    unique_tokens = found['token'].unique()
+    for kind, kind_re in ENTITY_KIND_RES.items():
+        kind_tokens = [t for t in unique_tokens if kind_re.fullmatch(t)]
+        kind_found = found[found['token'].isin(kind_tokens)]
+        if kind_found.empty:
+            continue
+        # Spread each row's tokens over columns and join them column-wise, not group by group.
+        slot = kind_found.groupby('row').cumcount()
+        wide = kind_found.assign(slot=slot).pivot(index='row', columns='slot', values='token')
+        joined = wide[0]
+        for k in wide.columns[1:]:
+            joined = joined.where(wide[k].isna(), joined + ', ' + wide[k])
+        result.iloc[wide.index.to_numpy(), result.columns.get_loc(kind)] = joined.to_numpy(dtype=object)
+    return result
+
+
+def classify_defect_column(texts: pd.Series) -> pd.Series:
+    """Column-wise classify_defect: highest keyword count wins, ties go to the first type."""
+    return DEFECT_SCORER.classify_column(texts)
+
+
+def combine_text_columns(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """Join the given text columns with a space, treating missing cells as ''."""
+    if not columns:
+        return pd.Series('', index=df.index, dtype=object)
+    combined = df[columns[0]].fillna('').astype(str)
+    for col in columns[1:]:
+        combined = combined + ' ' + df[col].fillna('').astype(str)
+    return combined
+
+
+def _is_text(values) -> bool:
+    return values.dtype == object or pd.api.types.is_string_dtype(values)
+
+
+def placeholder_mask(values: pd.Series, id_column: bool = True) -> pd.Series:
+    """
+    True where a text cell is a placeholder: in an ID column, a cell that contains
+    /, \\ or , or is blank; in free text, a cell that is blank or a lone /, \\ or ,.
+    """
+    pattern = PLACEHOLDER_RE if id_column else TEXT_PLACEHOLDER_RE
+    return values.str.contains(pattern, na=False).astype(bool)
+
+
 def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    """Clean placeholder values (/, \\, ,) and empty strings to NaN."""
-    cleaned = df.copy()
-    with pd.option_context('future.no_silent_downcasting', True):
-        cleaned = cleaned.replace(r'[\/\\,]', np.nan, regex=True)
-        cleaned = cleaned.replace(r'^\s*$', np.nan, regex=True)
+    """
+    Parse numeric and date columns (see src/schema.py) and set placeholders to NaN
+    in the remaining text columns: any cell with /, \\ or , in the ID columns, only
+    blank cells and a lone /, \\ or , in free text (see placeholder_mask).
+    Categorical columns are cleaned on their categories, not row by row.
+    """
+    cleaned = apply_schema(df)
+    for col in cleaned.columns:
+        if col in NUMERIC_COLUMNS or col in DATE_COLUMNS:
+            continue
+        values = cleaned[col]
+        id_column = col in ID_COLUMNS
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories = values.cat.categories
+            if _is_text(categories):
+                placeholders = categories[placeholder_mask(categories.to_series(), id_column).to_numpy()]
+                if len(placeholders):
+                    cleaned[col] = values.cat.remove_categories(placeholders)
+        elif _is_text(values):
+            mask = placeholder_mask(values, id_column)
+            if mask.any():
+                cleaned[col] = values.mask(mask)
     return cleaned
 
 
 def categorize_corrective(val: str) -> str:
     """Categorize corrective actions."""
-    val = str(val).strip()
-    if val in ['NaN', 'nan', '', 'None']:
-        return 'Action Not Specified (NaN)'
-    elif 'clamping force' in val.lower():
-        return 'Cancel Releasing Clamping Force'
-    elif 'manual tool calibration' in val.lower():
-        return 'Add Manual Tool Calibration'
-    elif 'compensation 0.005' in val.lower():
-        return 'Cancelled Compensation 0.005'
-    elif 'lesson&learn' in val.lower():
-        return 'Lesson & Learn'
-    elif val == 'Maintenance marking machine':
-        return 'Maintenance marking machine'
-    elif val == 'Marking machine maintenance':
-        return 'Marking machine maintenance'
-    else:
-        return 'Other'
+    return CORRECTIVE_RULES.categorize(val)
 
 
 def categorize_root_cause(val: str) -> str:
     """Categorize root causes."""
-    val = str(val).strip()
-    if val == 'NaN' or val == 'nan' or val == '':
-        return 'Undefined'
-    elif 'EL2415' in val:
-        return 'Related to NC EL2415'
-    elif '1.Marking NC' in val:
-        return 'Marking Precision'
-    elif 'Marking machine precision' in val:
-        return 'Marking Precision'
-    elif 'AAAA-02-11 deviation' in val:
-        return 'Machine AAAA-02-11 Deviation'
-    elif 'CP&CPK' in val:
-        return 'Process Stability (CP/CPK)'
-    elif 'AAAA-02-11 not stable' in val:
-        return 'Machine AAAA-02-11 Stability'
-    elif 'transportation' in val:
-        return 'Logistics & Transport'
-    elif 'not clear' in val:
-        return 'Unclear'
-    elif 'has deviation on centering' in val:
-        return 'Machine BBBB-02-05 Centering'
-    elif 'deviation on cerntering' in val:
-        return 'Machine BBBB-02-05 Centering'
-    else:
-        return 'Other'
+    return ROOT_CAUSE_RULES.categorize(val)
 
 
 def categorize_fqc(text: str) -> str:
     """Categorize QA comments."""
-    text = str(text).lower().strip()
-    if text in ['nan', 'none', '', '/']:
-        return 'Undefined'
-    elif any(word in text for word in ['awaiting', 'waiting', 'investigation']):
-        return 'Pending Decision'
-    elif any(word in text for word in ['continue', 'accept', 'approved', 'verbal']):
-        return 'Decision: Proceed/Accept'
-    elif any(word in text for word in ['re-measurement', 'recheck', 'retest', 'fctd', 'attachment']):
-        return 'Measurement/Verification'
-    elif any(word in text for word in ['confirmed', 'reply', 'decided', 'rework']):
-        return 'QA Replied/Action Taken'
-    else:
-        return 'Other/General'
+    return FQC_RULES.categorize(text)
 
 
 def categorize_defect(val: str) -> str:
     """Categorize defect descriptions."""
-    val = str(val).strip()
-    if val in ['NaN', 'nan', '', '/']:
-        return 'Undefined'
-    elif val == 'CO2910-R342':
-        return 'CO2910-R342 Deviation'
-    elif val == 'OP7200 DA':
-        return 'OP7200 DA Operation'
-    elif 'DA2512100009' in val:
-        return 'DA2512100009 (Post-Check)'
-    elif val in ['out of tolerance after re-measurement 1', 'after re-measurement dimension out of tolerance']:
-        return 'Out of Tolerance (Post-Check)'
-    elif 'the 1st time' in val:
-        return 'Primary Measurement Failure'
-    elif 'EL0312-MAX' in val:
-        return 'EL0312-MAX Deviation'
-    elif val == 'dimension out of tolerance':
-        return 'General Out of Tolerance'
-    elif 'after rework' in val:
-        return 'Post-Rework Failure'
-    elif 'CO2910-R342 out of tolerance' in val:
-        return 'CO2910-R342 Out of Tolerance'
-    elif 'dent' in val:
-        return 'Flange Surface Dent'
-    elif 'scratch' in val:
-        return 'Flange Scratch'
-    elif 'visually clear' in val:
-        return 'Marking Visual Clarity'
-    elif 'too shallow' in val:
-        return 'Marking Depth Issue'
-    else:
-        return 'Other Technical Records'
+    return DEFECT_RULES.categorize(val)
 
 
 def extract_comment_dates(text: str) -> str:
     """Extract dates from comments."""
     text = str(text)
-    dates = re.findall(r'\d{4}[./-]\d{2}[./-]\d{2}', text)
+    dates = re.findall(COMMENT_DATE_PATTERN, text)
     return '; '.join(dates) if dates else ''
 
 
 def extract_comment_codes(text: str) -> str:
     """Extract department codes from comments."""
     text = str(text)
-    codes = re.findall(r'[A-Z]{4}-\d{2}-\d{2}', text)
+    codes = re.findall(COMMENT_CODE_PATTERN, text)
     return '; '.join(codes) if codes else ''
  
  
-def enrich_dataframe(df: pd.DataFrame, description_col: str = 'NC description') -> pd.DataFrame:
-    enriched = clean_dataframe(df)
-    
+def derive_columns(cleaned: pd.DataFrame) -> pd.DataFrame:
+    """Compute the enrichment columns from a cleaned NCR frame."""
+    derived = pd.DataFrame(index=cleaned.index)
+
     text_cols = ['NC description', 'FDefectDesc_EN', 'Fqccomments_EN', 'Root cause of occurrence']
-    available_cols = [c for c in text_cols if c in enriched.columns]
-    combined_text = enriched[available_cols].fillna('').agg(' '.join, axis=1)
+    available_cols = [c for c in text_cols if c in cleaned.columns]
+    with instrumentation.stage('extraction.extract'):
+        combined_text = combine_text_columns(cleaned, available_cols)
+        entities = extract_entity_columns(combined_text)
+        derived['extracted_machines'] = entities['machines']
+        derived['extracted_nc_codes'] = entities['nc_codes']
+        derived['extracted_operations'] = entities['operations']
+        derived['defect_type'] = classify_defect_column(combined_text)
     
-    extractions = combined_text.apply(extract_all)
-    enriched['extracted_machines'] = extractions.apply(lambda x: ', '.join(x['machines']) if x['machines'] else '')
-    enriched['extracted_nc_codes'] = extractions.apply(lambda x: ', '.join(x['nc_codes']) if x['nc_codes'] else '')
-    enriched['extracted_operations'] = extractions.apply(lambda x: ', '.join(x['operations']) if x['operations'] else '')
-    enriched['defect_type'] = extractions.apply(lambda x: x['defect_type'])
+    with instrumentation.stage('extraction.categorize'):
+        _derive_categories(cleaned, derived)
     
-    if 'Root cause of occurrence' in enriched.columns:
-        enriched['root_cause'] = enriched['Root cause of occurrence'].fillna('')
-        enriched['root_cause_category'] = enriched['Root cause of occurrence'].apply(categorize_root_cause)
-    
-    if 'Corrective actions' in enriched.columns:
-        enriched['corrective_category'] = enriched['Corrective actions'].apply(categorize_corrective)
+    return derived
+
+
+def available_cpus() -> int:
+    """Cores this process may run on (respects CPU affinity, e.g. batch scheduler limits)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def default_workers(n_rows: int) -> int:
+    """Worker processes for enriching n_rows rows: 1 (serial) for small inputs, else up to one per core."""
+    if n_rows < PARALLEL_MIN_ROWS:
+        return 1
+    return max(1, min(available_cpus(), n_rows // MIN_SHARD_ROWS))
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool shared by successive calls (e.g. the chunks of enrich_file)."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def derive_columns_parallel(cleaned: pd.DataFrame, workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    derive_columns on shards of the rows in worker processes.
+
+    Every derived column depends on its own row only, so the shards are enriched
+    independently and concatenated in order: the result is identical to derive_columns.
+    workers=None picks the count with default_workers.
+    """
+    workers = default_workers(len(cleaned)) if workers is None else workers
+    if workers <= 1 or len(cleaned) < 2 * MIN_SHARD_ROWS:
+        return derive_columns(cleaned)
+    # Only the text columns derive_columns reads are sent to the workers
+    source = cleaned[[c for c in DERIVE_COLUMNS if c in cleaned.columns]]
+    # A few shards per worker so a slow shard does not hold up the others
+    n_shards = min(workers * 4, len(source) // MIN_SHARD_ROWS)
+    bounds = np.linspace(0, len(source), n_shards + 1, dtype=np.int64)
+    shards = [source.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    # Workers record their stages and counters per shard; they are merged here
+    derive = functools.partial(instrumentation.collect, instrumentation.is_enabled(), derive_columns)
+    with instrumentation.stage('extraction.derive_parallel'):
+        results = list(_get_pool(workers).map(derive, shards))
+    for _, stats in results:
+        instrumentation.merge(stats)
+    instrumentation.count('enrichment_shards', len(shards))
+    return pd.concat([shard for shard, _ in results])
+
+
+def _derive_categories(cleaned: pd.DataFrame, derived: pd.DataFrame) -> None:
+    """Add the rule-based category columns of derive_columns to derived."""
+    if 'Root cause of occurrence' in cleaned.columns:
+        derived['root_cause'] = cleaned['Root cause of occurrence'].fillna('')
+        derived['root_cause_category'] = ROOT_CAUSE_RULES.categorize_column(cleaned['Root cause of occurrence'])
     
-    if 'Fqccomments_EN' in enriched.columns:
-        enriched['fqc_category'] = enriched['Fqccomments_EN'].apply(categorize_fqc)
-        enriched['fqc_dates'] = enriched['Fqccomments_EN'].apply(extract_comment_dates)
-        enriched['fqc_dept_codes'] = enriched['Fqccomments_EN'].apply(extract_comment_codes)
+    if 'Corrective actions' in cleaned.columns:
+        derived['corrective_category'] = CORRECTIVE_RULES.categorize_column(cleaned['Corrective actions'])
     
-    if 'FDefectDesc_EN' in enriched.columns:
-        enriched['defect_category'] = enriched['FDefectDesc_EN'].apply(categorize_defect)
+    if 'Fqccomments_EN' in cleaned.columns:
+        derived['fqc_category'] = FQC_RULES.categorize_column(cleaned['Fqccomments_EN'])
+        derived['fqc_dates'] = cleaned['Fqccomments_EN'].apply(extract_comment_dates)
+        derived['fqc_dept_codes'] = cleaned['Fqccomments_EN'].apply(extract_comment_codes)
     
+    if 'FDefectDesc_EN' in cleaned.columns:
+        derived['defect_category'] = DEFECT_RULES.categorize_column(cleaned['FDefectDesc_EN'])
+
+
+def enrichment_version() -> str:
+    """Hash of everything the derived columns depend on besides the row itself."""
+    payload = json.dumps({
+        'version': ENRICHMENT_VERSION,
+        'entity_patterns': ENTITY_PATTERNS,
+        'comment_patterns': [COMMENT_DATE_PATTERN, COMMENT_CODE_PATTERN],
+        'placeholder_patterns': PLACEHOLDER_PATTERNS + [TEXT_PLACEHOLDER_PATTERN],
+        'id_columns': ID_COLUMNS,
+        'rules': RULES,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def fingerprint_rows(df: pd.DataFrame) -> pd.Series:
+    """64-bit hash of each row's source fields (missing columns count as empty)."""
+    source = df.reindex(columns=SOURCE_COLUMNS).astype(object)
+    return pd.util.hash_pandas_object(source, index=False)
+
+
+class EnrichmentCache:
+    """
+    On-disk store of derived enrichment columns keyed by row fingerprint.
+
+    Only rows whose fingerprint is not stored yet are cleaned and enriched. The store
+    is tagged with enrichment_version(), so changing a pattern or a rule discards it.
+    Call save() to persist new rows; it also drops the rows that none of the frames
+    passed to derive() since loading had, so the store tracks the current export
+    instead of every version of it.
+    """
+
+    def __init__(self, filepath: str = DEFAULT_CACHE_PATH):
+        self.filepath = filepath
+        self.version = enrichment_version()
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._rows = pd.DataFrame()
+        # Fingerprints seen by derive(), one array per call
+        self._used: List[np.ndarray] = []
+        if os.path.exists(filepath):
+            stored = pd.read_pickle(filepath)
+            if stored.get('version') == self.version:
+                self._rows = stored['rows']
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def derive(
+        self,
+        df: pd.DataFrame,
+        cleaned: Optional[pd.DataFrame] = None,
+        workers: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """Derived columns for df, computing only rows missing from the store.
+
+        `cleaned` is clean_dataframe(df) when the caller already has it. Missing rows
+        are derived with derive_columns_parallel(workers).
+        """
+        if cleaned is None:
+            cleaned = clean_dataframe(df.reindex(columns=[c for c in SOURCE_COLUMNS if c in df.columns]))
+        keys = fingerprint_rows(df)
+        self._used.append(keys.to_numpy())
+        missing = ~keys.isin(self._rows.index)
+        self.misses += int(missing.sum())
+        self.hits += int(len(keys) - missing.sum())
+        instrumentation.count('enrichment_cache_hits', int(len(keys) - missing.sum()))
+        if missing.any():
+            source = cleaned.loc[missing.to_numpy()].reindex(columns=SOURCE_COLUMNS)
+            fresh = derive_columns_parallel(source, workers)
+            fresh.index = keys[missing].to_numpy()
+            fresh = fresh[~fresh.index.duplicated()]
+            self._rows = fresh if self._rows.empty else pd.concat([self._rows, fresh])
+            self._dirty = True
+
+        # Only the columns the uncached path would add for df's columns.
+        columns = derive_columns(cleaned.iloc[:0]).columns
+        derived = self._rows.reindex(keys.to_numpy())[columns]
+        derived.index = df.index
+        return derived
+
+    def save(self) -> None:
+        """Write the store if rows were added or dropped (rows no derive() call used)."""
+        if self._used:
+            used = self._rows.index.isin(np.concatenate(self._used))
+            if not used.all():
+                self._rows = self._rows[used]
+                self._dirty = True
+        if not self._dirty:
+            return
+        tmp_filepath = self.filepath + '.tmp'
+        pd.to_pickle({'version': self.version, 'rows': self._rows}, tmp_filepath)
+        os.replace(tmp_filepath, self.filepath)
+        self._dirty = False
+ 
+ 
+def enrich_dataframe(
+    df: pd.DataFrame,
+    description_col: str = 'NC description',
+    cache: Optional[EnrichmentCache] = None,
+    workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Clean df and add the derived enrichment columns, and the machining-to-detection
+    lag in days (LAG_COLUMN) when both dates are present.
+
+    Large inputs are derived in shards on a process pool (see derive_columns_parallel);
+    workers=None chooses serial or parallel from the size, workers=1 forces serial.
+    """
+    with instrumentation.stage('extraction.clean'):
+        enriched = clean_dataframe(df)
+    if cache is None:
+        derived = derive_columns_parallel(enriched, workers)
+    else:
+        derived = cache.derive(df, enriched, workers)
+    instrumentation.count('rows_enriched', len(df))
+    for col in derived.columns:
+        enriched[col] = derived[col]
+    if set(DATE_COLUMNS) <= set(enriched.columns):
+        enriched[LAG_COLUMN] = detection_lag_days(enriched)
     return enriched
 
 
 def load_prod_data(filepath: str = 'data/prod_data.csv') -> pd.DataFrame:
-    return pd.read_csv(filepath, sep=';')
+    """Load the NCR export with the typed schema of src/schema.py."""
+    with instrumentation.stage('extraction.load'):
+        return apply_schema(pd.read_csv(filepath, sep=';', dtype=read_dtypes()))
+
+
+def iter_prod_data(filepath: str = 'data/prod_data.csv', chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """Read the NCR export in chunks of `chunksize` rows."""
+    with pd.read_csv(filepath, sep=';', dtype=read_dtypes(), chunksize=chunksize) as reader:
+        while True:
+            with instrumentation.stage('extraction.load'):
+                chunk = next(reader, None)
+                if chunk is not None:
+                    chunk = apply_schema(chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+
+def iter_enriched(
+    filepath: str = 'data/prod_data.csv',
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    cache: Optional[EnrichmentCache] = None,
+    workers: Optional[int] = None,
+) -> Iterator[pd.DataFrame]:
+    """Clean and enrich the NCR export chunk by chunk."""
+    for chunk in iter_prod_data(filepath, chunksize):
+        yield enrich_dataframe(chunk, cache=cache, workers=workers)
+
+
+def enrich_file(
+    input_filepath: str = 'data/prod_data.csv',
+    output_filepath: str = ENRICHED_PARQUET_PATH,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    cache_path: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> int:
+    """
+    Stream-enrich a CSV export: each chunk is enriched and appended to the output
+    (Parquet row group or CSV rows, from the extension), so memory stays bounded by
+    the chunk size whatever the file size.
+
+    With cache_path, rows already in the enrichment cache are not re-enriched and
+    new rows are added to it. Each chunk is sharded over `workers` processes (see
+    enrich_dataframe); raise chunksize so every worker gets enough rows.
+
+    The output is written to a temporary file and moved into place at the end,
+    so readers never see a half-written file. Returns the number of rows written.
+    """
+    cache = EnrichmentCache(cache_path) if cache_path else None
+    root, ext = os.path.splitext(output_filepath)
+    tmp_filepath = root + '.tmp' + ext
+    writer = ChunkWriter(tmp_filepath)
+    try:
+        with instrumentation.run('enrich_file'):
+            for chunk in iter_enriched(input_filepath, chunksize, cache, workers):
+                with instrumentation.stage('extraction.write'):
+                    writer.write(chunk)
+        writer.close()
+        os.replace(tmp_filepath, output_filepath)
+    finally:
+        writer.close()
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+    if cache is not None:
+        cache.save()
+    return writer.rows
 
 
 if __name__ == '__main__':
-    df = load_prod_data()
-    enriched = enrich_dataframe(df)
-    enriched.to_csv('data/prod_data_enriched.csv', index=False, sep=';')
-    print(enriched[['Job order', 'NC Code', 'extracted_machines', 'defect_type']].head(10).to_string())
- 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Enrich an NCR export with extracted entities and categories.')
+    parser.add_argument('--input', default='data/prod_data.csv', help='semicolon-separated NCR export')
+    parser.add_argument('--output', default=ENRICHED_PARQUET_PATH, help='enriched .parquet or .csv file to write')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help='rows per chunk (bounds memory)')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help='enrichment cache file')
+    parser.add_argument('--no-cache', action='store_true', help='re-enrich every row')
+    parser.add_argument('--workers', type=int, help='worker processes (default: from the chunk size and core count, 1 = serial)')
+    args = parser.parse_args()
+
+    rows = enrich_file(args.input, args.output, args.chunksize, None if args.no_cache else args.cache, args.workers)
+    preview = load_enriched(args.output, columns=['Job order', 'NC Code', 'extracted_machines', 'defect_type'])
+    print(preview.head(10).to_string())
+    print(f"{rows} rows written to {args.output}")
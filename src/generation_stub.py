@@ -0,0 +1,83 @@
+"""
+Local stand-in for the DashScope Generation API, for tests and benchmarks.
+
+StubGeneration.call() takes the same arguments as dashscope.Generation.call() and
+returns a response of the same shape (status_code, code, message,
+output.choices[0].message.content). It answers every NCR of the prompt with a
+deterministic root cause and corrective action, after an optional latency, and can be
+told to fail a fraction of calls with a transient error (HTTP 429 by default).
+
+    from src.generation_stub import StubGeneration
+    predict_root_cause_and_action(row, context, generation=StubGeneration(latency=0.2))
+"""
+
+import random
+import re
+import threading
+import time
+from http import HTTPStatus
+from types import SimpleNamespace
+from typing import List, Optional
+
+_NCR_TAG_RE = re.compile(r'^\[NCR ([^\]]+)\]\s*$', re.MULTILINE)
+_NC_CODE_RE = re.compile(r'^NC Code: (.*)$', re.MULTILINE)
+
+
+def _response(status_code: int, content: str = '', code: str = '', message: str = ''):
+    choice = SimpleNamespace(message=SimpleNamespace(role='assistant', content=content))
+    return SimpleNamespace(
+        status_code=status_code,
+        code=code,
+        message=message,
+        output=SimpleNamespace(choices=[choice]),
+    )
+
+
+class StubGeneration:
+    """Fake Generation API with configurable latency and failure rate; counts calls."""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        failure_status: int = HTTPStatus.TOO_MANY_REQUESTS,
+        seed: Optional[int] = 0,
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.calls = 0
+        self.failures = 0
+        self.prompts: List[str] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def answer(nc_code: str) -> str:
+        return f"Root Cause: stub root cause for {nc_code}\nCorrective Action: stub action for {nc_code}"
+
+    def call(self, model: str = '', messages=None, result_format: str = 'message', **kwargs):
+        prompt = messages[-1]['content'] if messages else ''
+        with self._lock:
+            self.calls += 1
+            self.prompts.append(prompt)
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            status = HTTPStatus(self.failure_status)
+            return _response(status, code=status.phrase.replace(' ', ''), message='stub failure')
+
+        # The NCRs to predict come after the context examples, so answer the last NC Code(s)
+        tags = list(_NCR_TAG_RE.finditer(prompt))
+        if not tags:
+            codes = _NC_CODE_RE.findall(prompt)
+            return _response(HTTPStatus.OK, self.answer(codes[-1] if codes else ''))
+        blocks = []
+        for i, tag in enumerate(tags):
+            end = tags[i + 1].start() if i + 1 < len(tags) else len(prompt)
+            codes = _NC_CODE_RE.findall(prompt, tag.end(), end)
+            blocks.append(f"[NCR {tag.group(1)}]\n{self.answer(codes[0] if codes else '')}")
+        return _response(HTTPStatus.OK, "\n\n".join(blocks))
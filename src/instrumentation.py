@@ -0,0 +1,295 @@
+"""
+Lightweight stage timers and counters.
+
+Pipeline stages are wrapped in `with stage('extraction.clean'):` (or decorated with
+@timed('clustering.inference')) and report quantities with count('rows_enriched', n).
+Totals are kept for the whole process; `with run('predict_batch'):` (or @timed_run)
+also records what happened during one entry-point call, and the last MAX_RUNS runs
+are kept for the Diagnostics page. Runs overlapping in time (concurrent sessions,
+worker threads) all see the stages and counters recorded meanwhile.
+
+Instrumentation is off unless NCR_INSTRUMENTATION=1 is set or enable() is called.
+When off, stage() returns a shared no-op context manager and count() returns at once.
+
+Work done in worker processes is recorded there: run it through collect() and merge()
+the stats it returns in the parent, so it shows in the totals and the active runs.
+
+Export with to_json() or to_prometheus() (text exposition format).
+"""
+
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+ENV_VAR = 'NCR_INSTRUMENTATION'
+MAX_RUNS = 50
+METRIC_PREFIX = 'ncr'
+
+_enabled = os.environ.get(ENV_VAR, '').lower() in ('1', 'true', 'yes', 'on')
+_lock = threading.Lock()
+
+
+class Stats:
+    """Stage timings and counters."""
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}
+
+    def add_time(self, name: str, seconds: float) -> None:
+        stats = self.stages.get(name)
+        if stats is None:
+            self.stages[name] = {'calls': 1, 'seconds': seconds, 'max_seconds': seconds}
+        else:
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+    def add_count(self, name: str, value: float) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other: Dict[str, Any]) -> None:
+        """Add the stages and counters of another Stats.to_dict()."""
+        for name, theirs in other.get('stages', {}).items():
+            stats = self.stages.get(name)
+            if stats is None:
+                self.stages[name] = dict(theirs)
+            else:
+                stats['calls'] += theirs['calls']
+                stats['seconds'] += theirs['seconds']
+                stats['max_seconds'] = max(stats['max_seconds'], theirs['max_seconds'])
+        for name, value in other.get('counters', {}).items():
+            self.add_count(name, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'stages': {name: dict(stats) for name, stats in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+
+class Run(Stats):
+    """Stages and counters recorded during one entry-point call."""
+
+    def __init__(self, name: str):
+        super().__init__()
+        self.name = name
+        self.started = time.time()
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'started': self.started,
+            'seconds': self.seconds,
+            'error': self.error,
+            **super().to_dict(),
+        }
+
+
+_totals = Stats()
+_active: List[Stats] = []
+_runs: Deque[Run] = deque(maxlen=MAX_RUNS)
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    """Forget all totals and finished runs."""
+    global _totals
+    with _lock:
+        _totals = Stats()
+        _runs.clear()
+
+
+def record_time(name: str, seconds: float) -> None:
+    with _lock:
+        _totals.add_time(name, seconds)
+        for active in _active:
+            active.add_time(name, seconds)
+
+
+def count(name: str, value: float = 1) -> None:
+    """Add value to the counter name (no-op when disabled)."""
+    if not _enabled:
+        return
+    with _lock:
+        _totals.add_count(name, value)
+        for active in _active:
+            active.add_count(name, value)
+
+
+class _NoOp:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP = _NoOp()
+
+
+class _Stage:
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name: str):
+    """Context manager timing one execution of the stage name."""
+    return _Stage(name) if _enabled else _NOOP
+
+
+def timed(name: str) -> Callable:
+    """Decorator timing every call of the function as the stage name."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _Run:
+    def __init__(self, name: str):
+        self.run = Run(name)
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        with _lock:
+            _active.append(self.run)
+        return self.run
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.run.seconds = time.perf_counter() - self.start
+        if exc_type is not None and exc_type is not GeneratorExit:
+            self.run.error = f"{exc_type.__name__}: {exc}"
+        with _lock:
+            _active.remove(self.run)
+            _runs.append(self.run)
+        return False
+
+
+def run(name: str):
+    """Context manager recording the stages and counters of one entry-point call as a run."""
+    return _Run(name) if _enabled else _NOOP
+
+
+def timed_run(name: str) -> Callable:
+    """Decorator recording every call of the function as a run."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Run(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def collect(enabled: bool, fn: Callable, *args, **kwargs) -> Tuple[Any, Optional[Dict[str, Any]]]:
+    """
+    Call fn with instrumentation on or off (pass is_enabled() of the caller), returning
+    its result and the stages and counters recorded during the call (None when off).
+
+    Meant for worker processes, whose instrumentation state and totals are their own:
+    ship both back and merge() the stats in the parent.
+    """
+    global _enabled
+    _enabled = enabled
+    if not enabled:
+        return fn(*args, **kwargs), None
+    recorded = Stats()
+    with _lock:
+        _active.append(recorded)
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        with _lock:
+            _active.remove(recorded)
+    return result, recorded.to_dict()
+
+
+def merge(stats: Optional[Dict[str, Any]]) -> None:
+    """Add stats recorded elsewhere (see collect()) to the totals and the active runs."""
+    if not stats or not _enabled:
+        return
+    with _lock:
+        _totals.merge(stats)
+        for active in _active:
+            active.merge(stats)
+
+
+def snapshot() -> Dict[str, Any]:
+    """Process totals and the latest runs (most recent first)."""
+    with _lock:
+        return {
+            'enabled': _enabled,
+            **_totals.to_dict(),
+            'runs': [r.to_dict() for r in reversed(_runs)],
+        }
+
+
+def to_json(indent: Optional[int] = 2) -> str:
+    return json.dumps(snapshot(), indent=indent)
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus() -> str:
+    """Process totals in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = []
+    for metric, key, help_text in [
+        ('stage_seconds_total', 'seconds', 'Time spent in each stage'),
+        ('stage_calls_total', 'calls', 'Executions of each stage'),
+        ('stage_max_seconds', 'max_seconds', 'Longest execution of each stage'),
+    ]:
+        name = f"{METRIC_PREFIX}_{metric}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {'gauge' if metric == 'stage_max_seconds' else 'counter'}")
+        for stage_name, stats in sorted(data['stages'].items()):
+            lines.append(f'{name}{{stage="{_label(stage_name)}"}} {stats[key]}')
+    for counter, value in sorted(data['counters'].items()):
+        name = f"{METRIC_PREFIX}_{_metric_name(counter)}_total"
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,203 @@
+"""
+Concurrent execution of LLM calls.
+
+run_concurrently() runs one call per item on a thread pool (the calls are network-bound),
+with a client-side rate limit, retries with exponential backoff on transient errors, and
+per-item error capture: a failing item never discards the others. With a checkpoint
+file, every finished item is appended to it as one JSON line, and items already there
+are skipped on the next run, so an interrupted run resumes where it stopped.
+iter_concurrently() yields the results as they finish, for callers that show progress.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from src import instrumentation
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_REQUESTS_PER_SECOND = 5.0
+DEFAULT_RETRIES = 4
+DEFAULT_BACKOFF_SECONDS = 1.0
+DEFAULT_MAX_BACKOFF_SECONDS = 30.0
+
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second on average, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a call is allowed."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed call is worth retrying: rate limits, server errors, network errors."""
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in TRANSIENT_STATUS_CODES
+    # OSError covers connection errors and timeouts (requests' exceptions derive from it)
+    return isinstance(error, OSError)
+
+
+def backoff_delay(attempt: int, base: float = DEFAULT_BACKOFF_SECONDS, cap: float = DEFAULT_MAX_BACKOFF_SECONDS) -> float:
+    """Exponential backoff with jitter before retry number `attempt` (1-based)."""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class ItemResult:
+    """Outcome of one item: its value, or the error of its last attempt (and whether it was transient)."""
+
+    def __init__(
+        self,
+        value: Any = None,
+        error: Optional[str] = None,
+        attempts: int = 0,
+        resumed: bool = False,
+        transient: bool = False,
+    ):
+        self.value = value
+        self.error = error
+        self.attempts = attempts
+        self.resumed = resumed
+        self.transient = transient
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_json(self, key: str) -> str:
+        return json.dumps({'key': key, 'value': self.value, 'error': self.error, 'attempts': self.attempts})
+
+
+def load_checkpoint(filepath: str) -> Dict[str, ItemResult]:
+    """Successful items recorded in a checkpoint file (failed ones are retried)."""
+    done: Dict[str, ItemResult] = {}
+    if not filepath or not os.path.exists(filepath):
+        return done
+    with open(filepath, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of an interrupted run
+                continue
+            if record.get('error') is None:
+                done[record['key']] = ItemResult(record['value'], None, record.get('attempts', 0), resumed=True)
+    return done
+
+
+def call_with_retries(
+    fn: Callable[[Any], Any],
+    item: Any,
+    rate_limiter: Optional[RateLimiter] = None,
+    retries: int = DEFAULT_RETRIES,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+) -> ItemResult:
+    """fn(item), retried on transient errors; errors are captured, not raised."""
+    attempt = 0
+    while True:
+        attempt += 1
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return ItemResult(fn(item), None, attempt)
+        except Exception as e:
+            if attempt > retries or not is_transient(e):
+                instrumentation.count('api_errors')
+                return ItemResult(None, f"{type(e).__name__}: {e}", attempt, transient=is_transient(e))
+            instrumentation.count('api_retries')
+            with instrumentation.stage('executor.backoff'):
+                time.sleep(backoff_delay(attempt, backoff_seconds))
+
+
+def iter_concurrently(
+    items: Dict[str, Any],
+    fn: Callable[[Any], Any],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    requests_per_second: Optional[float] = DEFAULT_REQUESTS_PER_SECOND,
+    retries: int = DEFAULT_RETRIES,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+    checkpoint_path: Optional[str] = None,
+) -> Iterator[Tuple[str, ItemResult]]:
+    """
+    Run fn over items ({key: item}) on max_workers threads, yielding (key, ItemResult) as each finishes.
+
+    Items already completed in the checkpoint are yielded first, without running them.
+    Closing the generator early drops the calls not started yet.
+    """
+    done = {key: result for key, result in load_checkpoint(checkpoint_path).items() if key in items}
+    yield from done.items()
+    pending = {key: item for key, item in items.items() if key not in done}
+    if not pending:
+        return
+
+    limiter = RateLimiter(requests_per_second, burst=max_workers) if requests_per_second else None
+    checkpoint = open(checkpoint_path, 'a', encoding='utf-8') if checkpoint_path else None
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            executor.submit(call_with_retries, fn, item, limiter, retries, backoff_seconds): key
+            for key, item in pending.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            result = future.result()
+            if checkpoint is not None:
+                checkpoint.write(result.to_json(key) + '\n')
+                checkpoint.flush()
+            yield key, result
+    finally:
+        # On interruption, drop the queued calls; finished ones are in the checkpoint
+        executor.shutdown(wait=True, cancel_futures=True)
+        if checkpoint is not None:
+            checkpoint.close()
+
+
+def run_concurrently(
+    items: Dict[str, Any],
+    fn: Callable[[Any], Any],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    requests_per_second: Optional[float] = DEFAULT_REQUESTS_PER_SECOND,
+    retries: int = DEFAULT_RETRIES,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+    checkpoint_path: Optional[str] = None,
+    on_result: Optional[Callable[[str, ItemResult], None]] = None,
+) -> Dict[str, ItemResult]:
+    """
+    Run fn over items ({key: item}) on max_workers threads and return {key: ItemResult}.
+
+    Values must be JSON-serializable when checkpoint_path is set. Keys already completed
+    in the checkpoint are not run again. on_result is called in the calling thread as
+    each item finishes.
+    """
+    results = {}
+    for key, result in iter_concurrently(
+        items, fn, max_workers, requests_per_second, retries, backoff_seconds, checkpoint_path
+    ):
+        results[key] = result
+        if on_result is not None:
+            on_result(key, result)
+    return results
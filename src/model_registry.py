@@ -0,0 +1,76 @@
+"""
+Lazy, process-wide registry of joblib model artifacts.
+
+Each artifact is deserialized on first use and then shared by every caller (and every
+Streamlit session) of the process. Large numpy arrays are memory-mapped from the file
+instead of copied (mmap_mode='r'), so loading them is cheap and the pages are shared
+between processes by the OS. Load times are recorded per artifact.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+import joblib
+
+from src import instrumentation
+
+DEFAULT_MMAP_MODE = 'r'
+
+
+class ModelRegistry:
+    """Named joblib artifacts, each loaded once on first get()."""
+
+    def __init__(self, paths: Dict[str, str], mmap_mode: Optional[str] = DEFAULT_MMAP_MODE):
+        self.paths = dict(paths)
+        self.mmap_mode = mmap_mode
+        self._models: Dict[str, Any] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.paths
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def get(self, name: str) -> Any:
+        """The artifact called name, loading it if needed."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self.paths:
+            raise KeyError(f"Unknown model: {name}")
+        with self._lock:
+            if name not in self._models:
+                start = time.perf_counter()
+                with instrumentation.stage('models.load'):
+                    self._models[name] = joblib.load(self.paths[name], mmap_mode=self.mmap_mode)
+                self._load_seconds[name] = time.perf_counter() - start
+            return self._models[name]
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> float:
+        """Load the given artifacts (all by default) now; returns the seconds spent loading."""
+        names = list(self.paths) if names is None else list(names)
+        start = time.perf_counter()
+        for name in names:
+            self.get(name)
+        return time.perf_counter() - start
+
+    def unload(self) -> None:
+        """Forget loaded artifacts (they are reloaded on next use)."""
+        with self._lock:
+            self._models.clear()
+            self._load_seconds.clear()
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Per artifact: loaded flag, load time in seconds and file size in bytes."""
+        return {
+            name: {
+                'loaded': name in self._models,
+                'load_seconds': self._load_seconds.get(name),
+                'size_bytes': os.path.getsize(path) if os.path.exists(path) else None,
+            }
+            for name, path in self.paths.items()
+        }
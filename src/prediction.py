@@ -7,14 +7,78 @@ Environment variables:
 """
 
 from http import HTTPStatus
+import re
+from typing import Dict, Hashable, Iterable, Iterator, List, Union
 import pandas as pd
 from dashscope import Generation
 from dashscope.api_entities.dashscope_response import Role
 
-
-def load_context_data(filepath: str = 'data/prod_data_enriched.csv') -> pd.DataFrame:
-    """Load enriched NCR data as context for predictions."""
-    return pd.read_csv(filepath, sep=';')
+from src import instrumentation
+from src.cache_store import content_key
+from src.context_retrieval import (
+    DEFAULT_TOKEN_BUDGET,
+    DEFAULT_TOP_K,
+    GOLD_COLUMN,
+    ContextSelector,
+    estimate_tokens,
+    format_context_example,
+    with_root_cause,
+)
+from src.llm_executor import DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND, iter_concurrently, run_concurrently
+from src.prediction_cache import PredictionCache, context_version
+from src.storage import ENRICHED_PARQUET_PATH, enriched_columns, load_enriched, resolve_enriched_path
+
+MODEL_NAME = 'qwen-plus'
+TEMPERATURE = 0.3
+
+# Micro-batching of predict_batch: each call's prompt and answer must fit these limits
+OUTPUT_TOKENS_PER_NCR = 150
+DEFAULT_MAX_INPUT_TOKENS = 30_000
+DEFAULT_MAX_OUTPUT_TOKENS = 8_000
+# Rounds of re-requesting the rows missing from the answers
+DEFAULT_MAX_ROUNDS = 3
+# Error of a row the model left out of an otherwise successful answer
+NO_ANSWER_ERROR = 'No answer for this NCR in the response'
+
+NCR_TAG_RE = re.compile(r'^\[NCR\s*([^\]]+?)\s*\]')
+
+# Columns of the enriched dataset used in context examples and to rank them.
+CONTEXT_COLUMNS = [
+    'NC Code',
+    'NC description',
+    'Part type',
+    'Operation number of detection',
+    'Operation number of occurrence',
+    'MachineNum of detection',
+    'MachineNum of occurrence',
+    'FDefectDesc_EN',
+    'Fqccomments_EN',
+    'Root cause of occurrence',
+    'Corrective actions',
+    'extracted_machines',
+    'extracted_operations',
+    GOLD_COLUMN,
+]
+
+
+class DashScopeError(Exception):
+    """Non-OK response from the DashScope API; status_code tells transient (429, 5xx) from permanent errors."""
+
+    def __init__(self, status_code, code, message):
+        super().__init__(f"DashScope error {status_code}: {code} - {message}")
+        self.status_code = status_code
+        self.code = code
+
+
+def load_context_data(filepath: str = ENRICHED_PARQUET_PATH) -> pd.DataFrame:
+    """Load the historical NCRs with a known root cause, only the columns used as context."""
+    filepath = resolve_enriched_path(filepath)
+    available = set(enriched_columns(filepath))
+    return load_enriched(
+        filepath,
+        columns=[col for col in CONTEXT_COLUMNS if col in available],
+        filters=[('Root cause of occurrence', '!=', '')],
+    )
 
 
 def load_input_data(filepath: str) -> pd.DataFrame:
@@ -23,25 +87,18 @@ def load_input_data(filepath: str) -> pd.DataFrame:
 
 
 def build_context_prompt(context_df: pd.DataFrame) -> str:
-    """Build context from historical NCR data with known root causes."""
-    rows_with_root_cause = context_df[
-        context_df['Root cause of occurrence'].notna() & 
-        (context_df['Root cause of occurrence'] != '')
-    ]
-    
-    examples = []
-    for _, row in rows_with_root_cause.iterrows():
-        example = f"""NC Code: {row.get('NC Code', '')}
-NC Description: {row.get('NC description', '')}
-Part Type: {row.get('Part type', '')}
-Machine of Occurrence: {row.get('MachineNum of occurrence', '')}
-Defect Description: {row.get('FDefectDesc_EN', '')}
-Root Cause: {row.get('Root cause of occurrence', '')}
-Corrective Action: {row.get('Corrective actions', '')}
----"""
-        examples.append(example)
-    
-    return "\n".join(examples)
+    """Build context from all historical NCR data with known root causes."""
+    rows_with_root_cause = with_root_cause(context_df)
+    return "\n".join(format_context_example(row) for _, row in rows_with_root_cause.iterrows())
+
+
+def build_context_selector(
+    context_df: pd.DataFrame,
+    top_k: int = DEFAULT_TOP_K,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+) -> ContextSelector:
+    """Selector of the most relevant historical NCRs per input NCR, under a token budget."""
+    return ContextSelector(context_df, top_k=top_k, token_budget=token_budget)
 
 
 def build_prediction_prompt(row: pd.Series, context: str) -> str:
@@ -69,42 +126,66 @@ Root Cause: <predicted root cause>
 Corrective Action: <predicted corrective action>"""
 
 
-def predict_root_cause_and_action(row: pd.Series, context: str) -> tuple[str, str]:
-    """Predict root cause and corrective action for a single NCR row using DashScope."""
-    prompt = build_prediction_prompt(row, context)
+def predict_root_cause_and_action(
+    row: pd.Series,
+    context: str,
+    generation=Generation,
+    cache: PredictionCache = None,
+) -> tuple[str, str]:
+    """Predict root cause and corrective action for a single NCR row using DashScope (or a stand-in generation API)."""
+    if cache is not None:
+        row_df = row.to_frame().T
+        version = context_version(context)
+        cached = cache.get_rows(row_df, version, MODEL_NAME, TEMPERATURE)
+        if cached:
+            instrumentation.count('prediction_cache_hits')
+            return next(iter(cached.values()))
+        prediction = predict_root_cause_and_action(row, context, generation)
+        cache.put_rows(row_df, {row.name: prediction}, version, MODEL_NAME, TEMPERATURE)
+        return prediction
+    
+    with instrumentation.stage('prediction.prompt_build'):
+        prompt = build_prediction_prompt(row, context)
+    _count_prompt(prompt)
     
     messages = [
         {'role': Role.SYSTEM, 'content': 'You are an expert in manufacturing quality control and root cause analysis.'},
         {'role': Role.USER, 'content': prompt}
     ]
     
-    response = Generation.call(
-        model='qwen-plus',
-        messages=messages,
-        result_format='message',
-        temperature=0.3,
-        max_tokens=150
-    )
+    with instrumentation.stage('prediction.api_call'):
+        response = generation.call(
+            model=MODEL_NAME,
+            messages=messages,
+            result_format='message',
+            temperature=TEMPERATURE,
+            max_tokens=150
+        )
+    instrumentation.count('api_calls')
     
     if response.status_code == HTTPStatus.OK:
         content = response.output.choices[0].message.content.strip()
         root_cause = ''
         corrective_action = ''
-        for line in content.split('\n'):
-            if line.lower().startswith('root cause:'):
-                root_cause = line.split(':', 1)[1].strip()
-            elif line.lower().startswith('corrective action:'):
-                corrective_action = line.split(':', 1)[1].strip()
+        with instrumentation.stage('prediction.parse'):
+            for line in content.split('\n'):
+                if line.lower().startswith('root cause:'):
+                    root_cause = line.split(':', 1)[1].strip()
+                elif line.lower().startswith('corrective action:'):
+                    corrective_action = line.split(':', 1)[1].strip()
         return root_cause, corrective_action
     else:
-        raise Exception(f"DashScope error: {response.code} - {response.message}")
+        raise DashScopeError(response.status_code, response.code, response.message)
 
 
-def build_batch_prediction_prompt(df: pd.DataFrame, context: str) -> str:
-    """Build prompt for predicting root cause and corrective actions for multiple NCRs."""
-    ncr_items = []
-    for idx, row in df.iterrows():
-        ncr_items.append(f"""[NCR {idx}]
+def _count_prompt(prompt: str) -> None:
+    instrumentation.count('prompt_chars', len(prompt))
+    instrumentation.count('prompt_tokens_estimated', estimate_tokens(prompt))
+
+
+def format_batch_item(idx: Hashable, row: pd.Series) -> str:
+    """One NCR to predict in a batch prompt, tagged with its index."""
+    return f"""[NCR {idx}]
 NC Code: {row.get('NC Code', '')}
 NC Description: {row.get('NC description', '')}
 Part Type: {row.get('Part type', '')}
@@ -113,9 +194,12 @@ Machine of Occurrence: {row.get('MachineNum of occurrence', '')}
 Operation of Detection: {row.get('Operation number of detection', '')}
 Operation of Occurrence: {row.get('Operation number of occurrence', '')}
 Defect Description: {row.get('FDefectDesc_EN', '')}
-QC Comments: {row.get('Fqccomments_EN', '')}""")
-    
-    ncr_list = "\n\n".join(ncr_items)
+QC Comments: {row.get('Fqccomments_EN', '')}"""
+
+
+def build_batch_prediction_prompt(df: pd.DataFrame, context: str) -> str:
+    """Build prompt for predicting root cause and corrective actions for multiple NCRs."""
+    ncr_list = "\n\n".join(format_batch_item(idx, row) for idx, row in df.iterrows())
     
     return f"""You are an expert in manufacturing quality control. You are familiar with root cause analysis and proposing corrective actions. You mission is to become a machine learning model to predict root cause analysis and proposing corrective actions .
 
@@ -166,96 +250,345 @@ Corrective Action: <predicted corrective action>
 """
 
 
-def predict_batch(df: pd.DataFrame, context: str) -> list[tuple[str, str]]:
-    """Predict root cause and corrective action for multiple NCR rows in a single API call."""
-    prompt = build_batch_prediction_prompt(df, context)
+def plan_batches(
+    df: pd.DataFrame,
+    context_tokens: int,
+    max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS,
+    max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS,
+) -> List[List[Hashable]]:
+    """
+    Split df's index into consecutive batches whose estimated prompt (instructions,
+    context and NCRs) fits max_input_tokens and whose answers fit max_output_tokens.
+    Every batch has at least one NCR.
+    """
+    overhead = estimate_tokens(build_batch_prediction_prompt(df.iloc[:0], '')) + context_tokens
+    max_rows = max(max_output_tokens // OUTPUT_TOKENS_PER_NCR, 1)
+    batches: List[List[Hashable]] = []
+    current: List[Hashable] = []
+    used = overhead
+    for idx, row in df.iterrows():
+        cost = estimate_tokens(format_batch_item(idx, row)) + 1
+        if current and (used + cost > max_input_tokens or len(current) >= max_rows):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(idx)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _predict_one_batch(
+    batch_df: pd.DataFrame,
+    context: str,
+    generation=Generation,
+) -> Dict[Hashable, tuple[str, str]]:
+    """One API call for the NCRs of batch_df; returns the answers found, by index."""
+    with instrumentation.stage('prediction.prompt_build'):
+        prompt = build_batch_prediction_prompt(batch_df, context)
+    _count_prompt(prompt)
     
     messages = [
         {'role': Role.SYSTEM, 'content': 'You are an expert in manufacturing quality control and root cause analysis.'},
         {'role': Role.USER, 'content': prompt}
     ]
     
-    response = Generation.call(
-        model='qwen-plus',
-        messages=messages,
-        result_format='message',
-        temperature=0.3,
-        max_tokens=150 * len(df)
-    )
+    with instrumentation.stage('prediction.api_call'):
+        response = generation.call(
+            model=MODEL_NAME,
+            messages=messages,
+            result_format='message',
+            temperature=TEMPERATURE,
+            max_tokens=OUTPUT_TOKENS_PER_NCR * len(batch_df)
+        )
+    instrumentation.count('api_calls')
     
     if response.status_code == HTTPStatus.OK:
         content = response.output.choices[0].message.content.strip()
-        return parse_batch_response(content, len(df))
+        with instrumentation.stage('prediction.parse'):
+            return parse_batch_response(content, batch_df.index)
     else:
-        raise Exception(f"DashScope error: {response.code} - {response.message}")
+        raise DashScopeError(response.status_code, response.code, response.message)
 
 
-def parse_batch_response(content: str, expected_count: int) -> list[tuple[str, str]]:
-    """Parse batch response into list of (root_cause, corrective_action) tuples."""
-    results = []
+def _batch_context(context: Union[str, ContextSelector], batch_df: pd.DataFrame) -> str:
+    if not isinstance(context, ContextSelector):
+        return context
+    with instrumentation.stage('prediction.context_select'):
+        return context.select_batch(batch_df).text
+
+
+class BatchPredictions(dict):
+    """
+    {index: (root_cause, corrective_action)}, plus the indices answered from the
+    prediction cache and {index: error} for the rows left unanswered.
+    """
+
+    def __init__(self, *args, cache_hits=(), errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_hits = set(cache_hits)
+        self.errors = dict(errors or {})
+
+
+def iter_predict_batch(
+    df: pd.DataFrame,
+    context: Union[str, ContextSelector],
+    generation=Generation,
+    max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS,
+    max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    max_rounds: int = DEFAULT_MAX_ROUNDS,
+    cache: PredictionCache = None,
+) -> Iterator[BatchPredictions]:
+    """
+    Generator version of predict_batch: yields predictions as they arrive.
+    
+    Each item is a BatchPredictions for some rows of df: first the rows found in the
+    cache (cache_hits set), then one per answered micro-batch as its call completes,
+    and last the rows never answered, with ('', '') and the reason in errors. Every
+    row of df is yielded once. Rows whose call failed with a non-transient error
+    (e.g. 401) are not re-requested in later rounds.
+    Closing the generator early drops the calls not started yet.
+    """
+    with instrumentation.run('predict_batch'):
+        answered = set()
+        errors: Dict[Hashable, str] = {}
+        given_up = set()
+        if cache is not None:
+            version = context_version(context)
+            cached = cache.get_rows(df, version, MODEL_NAME, TEMPERATURE)
+            instrumentation.count('prediction_cache_hits', len(cached))
+            if cached:
+                answered.update(cached)
+                yield BatchPredictions(cached, cache_hits=cached)
+        missing = df[~df.index.isin(list(answered))]
+        for _ in range(max_rounds):
+            if missing.empty:
+                break
+            items = {}
+            if isinstance(context, ContextSelector):
+                # The selected context depends on the batch, so plan with the largest possible context
+                planned = plan_batches(missing, context.token_budget, max_input_tokens, max_output_tokens)
+            else:
+                planned = plan_batches(missing, estimate_tokens(context), max_input_tokens, max_output_tokens)
+            for number, indices in enumerate(planned):
+                items[str(number)] = missing.loc[indices]
+            # Context is selected in the workers, so the first call does not wait for every batch's selection
+            results = iter_concurrently(
+                items,
+                lambda batch_df: _predict_one_batch(batch_df, _batch_context(context, batch_df), generation),
+                max_workers=max_workers,
+                requests_per_second=requests_per_second,
+            )
+            for key, result in results:
+                batch_indices = items[key].index
+                if not result.ok:
+                    errors.update((idx, result.error) for idx in batch_indices)
+                    if not result.transient:
+                        given_up.update(batch_indices)
+                    continue
+                for idx in batch_indices:
+                    if idx not in result.value:
+                        errors[idx] = NO_ANSWER_ERROR
+                if result.value:
+                    instrumentation.count('rows_predicted', len(result.value))
+                    answered.update(result.value)
+                    if cache is not None:
+                        cache.put_rows(df.loc[list(result.value)], result.value, version, MODEL_NAME, TEMPERATURE)
+                    yield BatchPredictions(result.value)
+            missing = df[~df.index.isin(list(answered | given_up))]
+    
+        unanswered = df.index[~df.index.isin(list(answered))]
+        if len(unanswered):
+            instrumentation.count('rows_unanswered', len(unanswered))
+            yield BatchPredictions(
+                {idx: ('', '') for idx in unanswered},
+                errors={idx: errors.get(idx, NO_ANSWER_ERROR) for idx in unanswered},
+            )
+
+
+def predict_batch(
+    df: pd.DataFrame,
+    context: Union[str, ContextSelector],
+    generation=Generation,
+    max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS,
+    max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    max_rounds: int = DEFAULT_MAX_ROUNDS,
+    cache: PredictionCache = None,
+) -> BatchPredictions:
+    """
+    Predict root cause and corrective action for multiple NCR rows.
+    
+    The rows are split into micro-batches sized by estimated input and output tokens
+    (see plan_batches), which are sent in parallel. Answers are matched to rows by
+    their [NCR <index>] tag, and rows missing from the answers (or from a failed
+    call) are re-requested, up to max_rounds calls per row.
+    
+    context is the context text, or a ContextSelector to pick context per batch.
+    With a cache, rows already predicted for the same context version are not sent,
+    and new answers are stored.
+    Returns {index: (root_cause, corrective_action)} for every row of df; rows never
+    answered get ('', ''). Its cache_hits attribute lists the rows answered from cache,
+    and errors gives the last error of each unanswered row.
+    See iter_predict_batch to get the answers as they arrive.
+    """
+    predictions: Dict[Hashable, tuple[str, str]] = {}
+    cache_hits = set()
+    errors = {}
+    for chunk in iter_predict_batch(
+        df, context, generation, max_input_tokens, max_output_tokens,
+        max_workers, requests_per_second, max_rounds, cache,
+    ):
+        predictions.update(chunk)
+        cache_hits.update(chunk.cache_hits)
+        errors.update(chunk.errors)
+    
+    return BatchPredictions(
+        {idx: predictions.get(idx, ('', '')) for idx in df.index},
+        cache_hits=cache_hits,
+        errors=errors,
+    )
+
+
+def _field_value(line: str) -> str:
+    return line.split(':', 1)[1].strip().strip('*').strip()
+
+
+def parse_batch_response(content: str, indices: Iterable[Hashable]) -> dict[Hashable, tuple[str, str]]:
+    """
+    Parse a batch response into {index: (root_cause, corrective_action)}.
+    
+    Blocks are matched to rows by their [NCR <index>] tag, whatever their order; tags
+    that are not in indices and blocks without an answer are ignored.
+    """
+    by_label = {str(idx): idx for idx in indices}
+    results = {}
+    current = None
     current_root = ''
     current_action = ''
     
+    def flush():
+        if current is not None and (current_root or current_action):
+            results[current] = (current_root, current_action)
+    
     for line in content.split('\n'):
-        line = line.strip()
-        if line.lower().startswith('[ncr'):
-            if current_root or current_action:
-                results.append((current_root, current_action))
+        line = line.strip().strip('*#').strip()
+        tag = NCR_TAG_RE.match(line)
+        if tag:
+            flush()
+            current = by_label.get(tag.group(1))
             current_root = ''
             current_action = ''
-        elif line.lower().startswith('root cause:'):
-            current_root = line.split(':', 1)[1].strip()
-        elif line.lower().startswith('corrective action:'):
-            current_action = line.split(':', 1)[1].strip()
-    
-    if current_root or current_action:
-        results.append((current_root, current_action))
+        elif line.lower().startswith('root cause') and ':' in line:
+            current_root = _field_value(line)
+        elif line.lower().startswith('corrective action') and ':' in line:
+            current_action = _field_value(line)
+    flush()
     
-    while len(results) < expected_count:
-        results.append(('', ''))
-    
-    return results[:expected_count]
+    return results
 
 
+@instrumentation.timed_run('predict_from_csv')
 def predict_from_csv(
     input_filepath: str,
-    context_filepath: str = 'data/prod_data_enriched.csv',
-    output_filepath: str = None
+    context_filepath: str = ENRICHED_PARQUET_PATH,
+    output_filepath: str = None,
+    top_k: int = DEFAULT_TOP_K,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    checkpoint_path: str = None,
+    generation=Generation,
+    cache: PredictionCache = None,
 ) -> pd.DataFrame:
     """
     Predict root causes for NCRs in input CSV using context data.
     
+    Rows are predicted concurrently (max_workers calls in flight, at most
+    requests_per_second started per second), transient API errors are retried with
+    backoff, and a row that still fails gets its error in 'prediction_error' instead
+    of aborting the run. With checkpoint_path, finished rows are recorded there and
+    skipped when the run is restarted. With a cache, rows already predicted for the
+    same context are not sent again; 'cache_hit' marks them.
+    
     Args:
         input_filepath: Path to CSV with empty root cause field
-        context_filepath: Path to enriched CSV with historical data
+        context_filepath: Path to the enriched dataset (Parquet or CSV) with historical data
         output_filepath: Optional path to save results
+        top_k: Maximum number of historical NCRs in each prompt
+        token_budget: Maximum estimated tokens of context in each prompt
+        max_workers: Maximum number of concurrent API calls
+        requests_per_second: Client-side rate limit (None for no limit)
+        checkpoint_path: Optional JSON-lines file to resume an interrupted run from
+        generation: DashScope Generation API, or a stand-in with the same call()
+        cache: Optional persistent PredictionCache
     
     Returns:
-        DataFrame with predicted root causes
+        DataFrame with predicted root causes. attrs['context_tokens'] and
+        attrs['context_tokens_saved'] give the context tokens sent and saved
+        compared with sending the whole history.
     """
     context_df = load_context_data(context_filepath)
-    context = build_context_prompt(context_df)
+    selector = build_context_selector(context_df, top_k, token_budget)
     
     input_df = load_input_data(input_filepath)
     
+    root_cause = input_df.get('Root cause of occurrence', pd.Series('', index=input_df.index))
+    corrective = input_df.get('Corrective actions', pd.Series('', index=input_df.index))
+    needs_root_cause = root_cause.isna() | (root_cause == '')
+    needs_corrective = corrective.isna() | (corrective == '')
+    
+    to_predict = input_df[needs_root_cause | needs_corrective]
+    cached = {}
+    if cache is not None:
+        cached = cache.get_rows(to_predict, selector.version, MODEL_NAME, TEMPERATURE)
+        instrumentation.count('prediction_cache_hits', len(cached))
+    
+    # One call per row to predict, keyed by its prompt so a checkpoint only matches the same request
+    items = {}
+    row_keys = {}
+    context_tokens = 0
+    tokens_saved = 0
+    for idx, row in to_predict[~to_predict.index.isin(list(cached))].iterrows():
+        context = selector.select(row)
+        context_tokens += context.tokens
+        tokens_saved += context.tokens_saved
+        key = content_key(MODEL_NAME, build_prediction_prompt(row, context.text))
+        items[key] = (row, context.text)
+        row_keys[idx] = key
+    
+    results = run_concurrently(
+        items,
+        lambda item: list(predict_root_cause_and_action(item[0], item[1], generation)),
+        max_workers=max_workers,
+        requests_per_second=requests_per_second,
+        checkpoint_path=checkpoint_path,
+    )
+    predicted = {idx: tuple(results[key].value) for idx, key in row_keys.items() if results[key].ok}
+    instrumentation.count('rows_predicted', len(predicted))
+    if cache is not None:
+        cache.put_rows(to_predict.loc[list(predicted)], predicted, selector.version, MODEL_NAME, TEMPERATURE)
+    predicted.update(cached)
+    
     root_causes = []
     corrective_actions = []
-    for idx, row in input_df.iterrows():
-        root_cause = row.get('Root cause of occurrence', '')
-        corrective = row.get('Corrective actions', '')
-        needs_root_cause = pd.isna(root_cause) or root_cause == ''
-        needs_corrective = pd.isna(corrective) or corrective == ''
-        
-        if needs_root_cause or needs_corrective:
-            pred_root, pred_action = predict_root_cause_and_action(row, context)
-            root_causes.append(pred_root if needs_root_cause else root_cause)
-            corrective_actions.append(pred_action if needs_corrective else corrective)
-        else:
-            root_causes.append(root_cause)
-            corrective_actions.append(corrective)
+    errors = []
+    for idx in input_df.index:
+        result = results[row_keys[idx]] if idx in row_keys else None
+        pred_root, pred_action = predicted.get(idx, ('', ''))
+        root_causes.append(pred_root if needs_root_cause[idx] else root_cause[idx])
+        corrective_actions.append(pred_action if needs_corrective[idx] else corrective[idx])
+        errors.append(result.error if result is not None else None)
     
     input_df['Root cause of occurrence'] = root_causes
     input_df['Corrective actions'] = corrective_actions
+    input_df['prediction_error'] = errors
+    input_df['cache_hit'] = input_df.index.isin(list(cached))
+    input_df.attrs['context_tokens'] = context_tokens
+    input_df.attrs['context_tokens_saved'] = tokens_saved
     
     if output_filepath:
         input_df.to_csv(output_filepath, index=False, sep=';')
@@ -264,14 +597,33 @@ def predict_from_csv(
 
 
 if __name__ == '__main__':
+    import argparse
     import sys
     
-    if len(sys.argv) < 2:
-        print("Usage: python prediction.py <input_csv> [output_csv]")
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    output_file = sys.argv[2] if len(sys.argv) > 2 else None
+    parser = argparse.ArgumentParser(description='Predict missing root causes and corrective actions with DashScope.')
+    parser.add_argument('input_csv', help='semicolon-separated NCRs with empty root cause and/or corrective actions')
+    parser.add_argument('output_csv', nargs='?', help='where to write the results')
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS, help='concurrent API calls')
+    parser.add_argument('--rps', type=float, default=DEFAULT_REQUESTS_PER_SECOND, help='API calls started per second')
+    parser.add_argument('--checkpoint', help='JSON-lines file to resume an interrupted run from')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='historical NCRs per prompt')
+    parser.add_argument('--token-budget', type=int, default=DEFAULT_TOKEN_BUDGET, help='context tokens per prompt')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the persistent prediction cache')
+    args = parser.parse_args()
     
-    result = predict_from_csv(input_file, output_filepath=output_file)
+    result = predict_from_csv(
+        args.input_csv,
+        output_filepath=args.output_csv,
+        top_k=args.top_k,
+        token_budget=args.token_budget,
+        max_workers=args.workers,
+        requests_per_second=args.rps,
+        checkpoint_path=args.checkpoint,
+        cache=None if args.no_cache else PredictionCache(),
+    )
     print(result.to_csv(index=False, sep=';'))
+    print(f"Context tokens sent: {result.attrs['context_tokens']}, "
+          f"saved vs full history: {result.attrs['context_tokens_saved']}", file=sys.stderr)
+    failed = result['prediction_error'].notna().sum()
+    if failed:
+        print(f"{failed} rows failed, see the prediction_error column", file=sys.stderr)
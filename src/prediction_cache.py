@@ -0,0 +1,99 @@
+"""
+Persistent cache of LLM root cause / corrective action predictions.
+
+A prediction is keyed by the NCR fields that go into the prompt (normalized: case,
+whitespace, 7200 vs 7200.0), the model name, the temperature and the context version
+(ContextSelector.version, or a hash of a fixed context text). Uploading the same or an
+overlapping CSV again then makes no API call for the rows already predicted, and any
+change to the history, the selector settings or the model gives new keys.
+"""
+
+import hashlib
+import json
+import math
+from typing import Dict, Hashable, Optional, Tuple, Union
+
+import pandas as pd
+
+from src.cache_store import PersistentCache, content_key
+from src.context_retrieval import ContextSelector
+
+DEFAULT_PREDICTION_CACHE_PATH = 'data/.prediction_cache.sqlite'
+DEFAULT_PREDICTION_CACHE_ENTRIES = 100_000
+
+# Input fields of build_prediction_prompt / format_batch_item
+PROMPT_FIELDS = [
+    'NC Code',
+    'NC description',
+    'Part type',
+    'MachineNum of detection',
+    'MachineNum of occurrence',
+    'Operation number of detection',
+    'Operation number of occurrence',
+    'FDefectDesc_EN',
+    'Fqccomments_EN',
+]
+
+
+def normalize_field(value) -> str:
+    """Field value as compared by the cache: missing -> '', integral floats as ints, lowercased, single spaces."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ''
+    if isinstance(value, float) and math.isfinite(value) and value.is_integer():
+        value = int(value)
+    return ' '.join(str(value).split()).lower()
+
+
+def context_version(context: Union[str, ContextSelector]) -> str:
+    """Version of a context: the selector's version, or a hash of the context text."""
+    if isinstance(context, ContextSelector):
+        return context.version
+    return hashlib.sha256(context.encode('utf-8')).hexdigest()[:16]
+
+
+class PredictionCache:
+    """(root cause, corrective action) per NCR content, model settings and context version."""
+
+    def __init__(
+        self,
+        filepath: str = DEFAULT_PREDICTION_CACHE_PATH,
+        max_entries: Optional[int] = DEFAULT_PREDICTION_CACHE_ENTRIES,
+        ttl_seconds: Optional[float] = None,
+    ):
+        self.store = PersistentCache(filepath, max_entries, ttl_seconds)
+
+    @staticmethod
+    def key(row: pd.Series, version: str, model: str, temperature: float) -> str:
+        fields = json.dumps([normalize_field(row.get(field)) for field in PROMPT_FIELDS])
+        return content_key(model, repr(float(temperature)), version, fields)
+
+    def get_rows(
+        self,
+        df: pd.DataFrame,
+        version: str,
+        model: str,
+        temperature: float,
+    ) -> Dict[Hashable, Tuple[str, str]]:
+        """Cached predictions for the rows of df, by index (rows not cached are absent)."""
+        keys = {idx: self.key(row, version, model, temperature) for idx, row in df.iterrows()}
+        found = self.store.get_many(keys.values())
+        return {idx: tuple(json.loads(found[key])) for idx, key in keys.items() if key in found}
+
+    def put_rows(
+        self,
+        df: pd.DataFrame,
+        predictions: Dict[Hashable, Tuple[str, str]],
+        version: str,
+        model: str,
+        temperature: float,
+    ) -> None:
+        """Store the predictions of the rows of df (empty answers are not stored)."""
+        items = {}
+        for idx, row in df.iterrows():
+            prediction = predictions.get(idx)
+            if prediction and any(prediction):
+                items[self.key(row, version, model, temperature)] = json.dumps(list(prediction)).encode('utf-8')
+        self.store.put_many(items)
+
+    def stats(self) -> Dict[str, float]:
+        return self.store.stats()
@@ -0,0 +1,185 @@
+"""
+Data-driven categorization rules for NCR text.
+
+Rules live in categorization_rules.json (next to this file) so new categories
+can be added without code changes. Each rule set is compiled once into:
+    - a dict for exact-value rules ("equals")
+    - a single alternation regex for substring rules ("contains")
+and evaluated over a whole column in one pass.
+
+Rule set format:
+    {"default": <category>, "lowercase": <bool, optional>,
+     "rules": [{"category": ..., "equals": [...], "contains": [...], "ignore_case": <bool>}, ...]}
+
+Rules are first-match: the earliest rule that matches wins, as in an if/elif chain.
+"""
+
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RULES_PATH = os.path.join(BASE_DIR, "categorization_rules.json")
+
+
+def load_rules(filepath: str = RULES_PATH) -> Dict:
+    """Load the raw rules config."""
+    with open(filepath, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _lookahead_regex(patterns: List[str]) -> Optional[re.Pattern]:
+    """Alternation wrapped in a lookahead so findall reports a match at every position, even overlapping ones."""
+    if not patterns:
+        return None
+    return re.compile('(?=(' + '|'.join(re.escape(p) for p in patterns) + '))')
+
+
+def _distinct_as_str(values: pd.Series) -> Tuple[np.ndarray, pd.Series]:
+    """Factorize a column on str(value), so rules only run once per distinct value."""
+    if values.dtype == object or pd.api.types.is_string_dtype(values):
+        as_obj = values.astype(object)
+        missing = as_obj.isna()
+        if missing.any():
+            as_obj = as_obj.copy()
+            as_obj[missing] = as_obj[missing].map(str)
+    else:
+        as_obj = values.map(str)
+    codes, uniques = pd.factorize(as_obj.to_numpy(dtype=object))
+    return codes, pd.Series(uniques, dtype=object).map(str)
+
+
+class CategoryRules:
+    """First-match rule set compiled into one dict lookup and one regex per case mode."""
+
+    def __init__(self, config: Dict):
+        self.default = config['default']
+        self.lowercase = config.get('lowercase', False)
+        self.categories = np.array([rule['category'] for rule in config['rules']] + [self.default], dtype=object)
+
+        # Per case mode (False = as-is, True = ignore case): value/pattern -> earliest rule index.
+        self._equals = {False: {}, True: {}}
+        contains_rank = {False: {}, True: {}}
+        for rank, rule in enumerate(config['rules']):
+            ignore_case = rule.get('ignore_case', False)
+            for value in rule.get('equals', []):
+                key = value.lower() if ignore_case else value
+                self._equals[ignore_case].setdefault(key, rank)
+            for pattern in rule.get('contains', []):
+                if not pattern:
+                    raise ValueError(f"Empty 'contains' pattern in rule {rule['category']!r}")
+                key = pattern.lower() if ignore_case else pattern
+                contains_rank[ignore_case].setdefault(key, rank)
+
+        # Alternatives are ordered by rule rank, so at any position the regex reports
+        # the earliest rule whose pattern starts there.
+        self._contains_rank = contains_rank
+        self._contains_re = {
+            mode: _lookahead_regex(sorted(ranks, key=lambda p: (ranks[p], -len(p))))
+            for mode, ranks in contains_rank.items()
+        }
+
+    def _modes(self):
+        return [mode for mode in (False, True) if self._equals[mode] or self._contains_re[mode] is not None]
+
+    def categorize(self, value) -> str:
+        """Categorize a single value."""
+        text = str(value).strip()
+        if self.lowercase:
+            text = text.lower()
+        best = len(self.categories) - 1
+        for mode in self._modes():
+            candidate = text.lower() if mode else text
+            best = min(best, self._equals[mode].get(candidate, best))
+            if self._contains_re[mode] is not None:
+                for match in self._contains_re[mode].findall(candidate):
+                    best = min(best, self._contains_rank[mode][match])
+        return self.categories[best]
+
+    def categorize_column(self, values: pd.Series) -> pd.Series:
+        """Categorize a whole column: one dict map and one regex scan per case mode over its distinct values."""
+        codes, uniques = _distinct_as_str(values)
+        normalized = uniques.str.strip()
+        if self.lowercase:
+            normalized = normalized.str.lower()
+        default_rank = len(self.categories) - 1
+        best = np.full(len(normalized), default_rank, dtype=np.int64)
+        for mode in self._modes():
+            candidate = normalized.str.lower() if mode else normalized
+            equals_rank = candidate.map(self._equals[mode]).fillna(default_rank)
+            best = np.minimum(best, equals_rank.to_numpy(dtype=np.int64))
+            if self._contains_re[mode] is not None:
+                matches = candidate.str.findall(self._contains_re[mode]).explode().dropna()
+                if not matches.empty:
+                    ranks = matches.map(self._contains_rank[mode]).groupby(level=0).min()
+                    rows = ranks.index.to_numpy()
+                    best[rows] = np.minimum(best[rows], ranks.to_numpy(dtype=np.int64))
+        return pd.Series(self.categories[best][codes], index=values.index, dtype=object)
+
+
+class KeywordScorer:
+    """Keyword-count classifier: the label with most distinct keywords present wins, ties go to the first label."""
+
+    def __init__(self, keywords: Dict[str, List[str]], default: str = 'unknown'):
+        self.default = default
+        self.labels = np.array(list(keywords), dtype=object)
+        # keyword -> label indices, one entry per occurrence so duplicated keywords score twice.
+        self._keyword_labels: Dict[str, List[int]] = {}
+        for i, words in enumerate(keywords.values()):
+            for word in words:
+                if not word:
+                    raise ValueError(f"Empty keyword for {self.labels[i]!r}")
+                self._keyword_labels.setdefault(word.lower(), []).append(i)
+
+        # Longest first: at each position the regex reports the longest keyword starting there,
+        # and every keyword contained in it is present as well.
+        patterns = sorted(self._keyword_labels, key=len, reverse=True)
+        self._regex = _lookahead_regex(patterns)
+        self._implied: Dict[str, Tuple[str, ...]] = {
+            kw: tuple(other for other in patterns if other in kw) for kw in patterns
+        }
+
+    def _present(self, matches) -> set:
+        return {implied for match in matches for implied in self._implied[match]}
+
+    def classify(self, text: str) -> str:
+        """Classify a single text."""
+        if self._regex is None:
+            return self.default
+        scores = [0] * len(self.labels)
+        for kw in self._present(self._regex.findall(text.lower())):
+            for i in self._keyword_labels[kw]:
+                scores[i] += 1
+        best = max(range(len(scores)), key=scores.__getitem__)
+        return self.labels[best] if scores[best] > 0 else self.default
+
+    def classify_column(self, texts: pd.Series) -> pd.Series:
+        """Classify a whole column with one regex scan over its distinct values."""
+        codes, uniques = _distinct_as_str(texts)
+        labels = np.full(len(uniques), self.default, dtype=object)
+        matches = uniques.str.lower().str.findall(self._regex).explode().dropna() if self._regex else uniques[:0]
+        if not matches.empty:
+            found = matches.map(self._implied).explode().reset_index()
+            found.columns = ['row', 'keyword']
+            found = found.drop_duplicates()
+            found['label'] = found['keyword'].map(self._keyword_labels)
+            found = found.explode('label')
+            scores = (
+                found.groupby(['row', 'label']).size()
+                .unstack(fill_value=0)
+                .reindex(columns=range(len(self.labels)), fill_value=0)
+            )
+            labels[scores.index.to_numpy()] = self.labels[scores.to_numpy().argmax(axis=1)]
+        return pd.Series(labels[codes], index=texts.index, dtype=object)
+
+
+RULES = load_rules()
+DEFECT_SCORER = KeywordScorer(RULES['defect_keywords'])
+CORRECTIVE_RULES = CategoryRules(RULES['corrective'])
+ROOT_CAUSE_RULES = CategoryRules(RULES['root_cause'])
+FQC_RULES = CategoryRules(RULES['fqc'])
+DEFECT_RULES = CategoryRules(RULES['defect'])
@@ -0,0 +1,70 @@
+"""
+Column schema of the NCR export (data/prod_data.csv).
+
+The export is ';'-separated with decimal commas ("22,2") and US short dates
+("12/14/25"). Loading with this schema keeps measured values and tolerances as
+floats, parses dates once, and stores low-cardinality ID columns as categoricals.
+"""
+
+from typing import Dict
+
+import pandas as pd
+
+NUMERIC_COLUMNS = ['Nomial', 'FLowerTolerance', 'FUpperTolerance', 'Measured Value']
+DATE_COLUMNS = ['Date of detection', 'Date of machining']
+DATE_FORMAT = '%m/%d/%y'
+CATEGORICAL_COLUMNS = [
+    'Part type',
+    'NC Code',
+    'MachineNum of detection',
+    'Operator of detection',
+    'MachineNum of occurrence',
+    'operator of machining',
+]
+# Identifier columns: a '/', '\\' or ',' anywhere in a cell means it holds no valid ID
+# (e.g. '/' or a stray date in an operator column). Free text only loses blank cells.
+ID_COLUMNS = [
+    'Job order',
+    'Operation number of detection',
+    'Operation number of occurrence',
+] + CATEGORICAL_COLUMNS
+TEXT_COLUMNS = [
+    'NC description',
+    'FDefectDesc_EN',
+    'Fqccomments_EN',
+    'Root cause of occurrence',
+    'Corrective actions',
+]
+
+
+def read_dtypes() -> Dict[str, str]:
+    """dtype argument for pd.read_csv; numbers and dates are read as text and parsed by apply_schema."""
+    dtypes = {col: 'category' for col in CATEGORICAL_COLUMNS}
+    dtypes.update({col: 'str' for col in NUMERIC_COLUMNS + DATE_COLUMNS})
+    return dtypes
+
+
+def parse_decimal(values: pd.Series) -> pd.Series:
+    """Parse decimal-comma numbers ("22,2" -> 22.2); anything else becomes NaN."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values
+    return pd.to_numeric(values.str.replace(',', '.', regex=False), errors='coerce')
+
+
+def parse_date(values: pd.Series) -> pd.Series:
+    """Parse export dates ("12/14/25"); unparseable cells become NaT."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values, format=DATE_FORMAT, errors='coerce')
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Parse the numeric and date columns of df that are still text. Other columns are left as is."""
+    typed = df.copy(deep=False)
+    for col in NUMERIC_COLUMNS:
+        if col in typed.columns:
+            typed[col] = parse_decimal(typed[col])
+    for col in DATE_COLUMNS:
+        if col in typed.columns:
+            typed[col] = parse_date(typed[col])
+    return typed
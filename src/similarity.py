@@ -0,0 +1,397 @@
+"""
+Similar-NCR search over sentence embeddings (see ADR-002).
+
+NCR texts are embedded in batches with all-MiniLM-L6-v2 and L2-normalized, so cosine
+similarity is a dot product. The matrix is stored on disk as float32, or int8 with one
+scale per row (4x smaller), and memory-mapped when loaded. A query is one matrix-vector
+product (blockwise over the memmap) followed by a partial sort, optionally restricted to
+the NCRs that involve an entity (machine, NC code or operation).
+
+For very large histories an approximate nearest-neighbour backend (hnswlib, optional)
+can answer unfiltered queries instead of the exact scan.
+"""
+
+import json
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.cache_store import PersistentCache, content_key
+from src.entity_index import EntityIndex
+from src.extraction import combine_text_columns
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+DEFAULT_INDEX_DIR = 'data/similarity_index'
+DEFAULT_EMBEDDING_CACHE_PATH = 'data/.embedding_cache.sqlite'
+DEFAULT_EMBEDDING_CACHE_ENTRIES = 1_000_000
+TEXT_COLUMNS = ['NC description', 'FDefectDesc_EN', 'Root cause of occurrence']
+# Entity columns kept with the embeddings to filter searches (see EntityIndex)
+ENTITY_COLUMNS = {
+    'machine': ['MachineNum of detection', 'MachineNum of occurrence', 'extracted_machines'],
+    'nc_code': ['NC Code', 'extracted_nc_codes'],
+    'operation': ['extracted_operations'],
+}
+ID_COLUMN = 'Job order'
+DEFAULT_BATCH_SIZE = 256
+SCORE_BLOCK_ROWS = 65_536
+
+# Texts -> (n, dim) embeddings; defaults to the sentence-transformers model.
+Encoder = Callable[[List[str]], np.ndarray]
+
+logger = logging.getLogger(__name__)
+
+_model = None
+_indexes: Dict[str, Tuple[float, 'SimilarityIndex']] = {}
+_ann_fallback_logged = False
+
+
+def get_model():
+    """Shared SentenceTransformer instance, loaded on first use."""
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer
+        _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+
+def _default_encoder(texts: List[str]) -> np.ndarray:
+    return get_model().encode(texts, batch_size=len(texts), normalize_embeddings=True)
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit L2 norm (zero rows stay zero), as float32."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1, norms)
+
+
+def normalize_text(text: str) -> str:
+    """Text as embedded and cached: whitespace runs collapsed, ends stripped."""
+    return ' '.join(str(text).split())
+
+
+class EmbeddingCache:
+    """
+    Persistent embeddings keyed by sha256 of (model name, normalized text).
+
+    Only texts not in the cache are sent to the encoder, so re-embedding a mostly
+    unchanged history costs almost no encoder time. model_name must identify the
+    encoder used: embeddings of different models never mix.
+    """
+
+    def __init__(
+        self,
+        filepath: str = DEFAULT_EMBEDDING_CACHE_PATH,
+        model_name: str = MODEL_NAME,
+        max_entries: Optional[int] = DEFAULT_EMBEDDING_CACHE_ENTRIES,
+    ):
+        self.model_name = model_name
+        self.store = PersistentCache(filepath, max_entries)
+
+    def key(self, text: str) -> str:
+        return content_key(self.model_name, normalize_text(text))
+
+    def encode(
+        self,
+        texts: Sequence[str],
+        encoder: Optional[Encoder] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> np.ndarray:
+        """Normalized float32 embeddings of texts, encoding (and storing) only the cache misses."""
+        keys = [self.key(text) for text in texts]
+        vectors = {k: np.frombuffer(v, dtype=np.float32) for k, v in self.store.get_many(keys).items()}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            fresh = _encode_batches(list(missing.values()), batch_size, encoder)
+            self.store.put_many({k: v.tobytes() for k, v in zip(missing, fresh)})
+            vectors.update(zip(missing, fresh))
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack([vectors[k] for k in keys])
+
+    def stats(self) -> Dict[str, float]:
+        return self.store.stats()
+
+
+def _encode_batches(texts: List[str], batch_size: int, encoder: Optional[Encoder]) -> np.ndarray:
+    """Encode texts as the cache keys them (whitespace-normalized), with or without the cache."""
+    encoder = encoder or _default_encoder
+    texts = [normalize_text(text) for text in texts]
+    batches = [normalize(encoder(texts[i:i + batch_size])) for i in range(0, len(texts), batch_size)]
+    return np.vstack(batches) if batches else np.empty((0, 0), dtype=np.float32)
+
+
+def compute_embeddings(
+    texts: Sequence[str],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    encoder: Optional[Encoder] = None,
+    cache: Optional[EmbeddingCache] = None,
+) -> np.ndarray:
+    """Normalized float32 embeddings of texts, encoded batch_size texts at a time (through cache if given)."""
+    if cache is not None:
+        return cache.encode(texts, encoder, batch_size)
+    return _encode_batches(list(texts), batch_size, encoder)
+
+
+def quantize(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """int8 codes and per-row float32 scales such that codes * scales ~= embeddings."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    scales = np.abs(embeddings).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.rint(embeddings / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def top_k_positions(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best], kind='stable')]
+
+
+def find_similar(query_embedding: np.ndarray, embeddings: np.ndarray, top_k: int = 5) -> List[Tuple[int, float]]:
+    """(index, cosine similarity) of the top_k embeddings most similar to the query."""
+    embeddings = normalize(np.asarray(embeddings))
+    scores = embeddings @ normalize(query_embedding)
+    return [(int(i), float(scores[i])) for i in top_k_positions(scores, top_k)]
+
+
+class SimilarityIndex:
+    """
+    Embeddings of historical NCRs plus their ids and entities, searchable by similarity.
+
+    embeddings is float32 (n, dim), or int8 codes with scales (n,). Both may be memmaps.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        rows: pd.DataFrame,
+        scales: Optional[np.ndarray] = None,
+        model_name: str = MODEL_NAME,
+        text_columns: Optional[List[str]] = None,
+    ):
+        if len(embeddings) != len(rows):
+            raise ValueError(f"{len(embeddings)} embeddings for {len(rows)} rows")
+        self.embeddings = embeddings
+        self.scales = scales
+        self.rows = rows.reset_index(drop=True)
+        self.model_name = model_name
+        self.text_columns = text_columns or TEXT_COLUMNS
+        self._entities: Optional[EntityIndex] = None
+        self._ann = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def quantized(self) -> bool:
+        return self.scales is not None
+
+    @classmethod
+    def build(
+        cls,
+        df: pd.DataFrame,
+        text_columns: Optional[List[str]] = None,
+        encoder: Optional[Encoder] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        dtype: str = 'float32',
+        cache: Optional[EmbeddingCache] = None,
+    ) -> 'SimilarityIndex':
+        """Embed the NCRs of an enriched frame (dtype 'float32' or 'int8')."""
+        text_columns = [c for c in (text_columns or TEXT_COLUMNS) if c in df.columns]
+        texts = combine_text_columns(df, text_columns).str.strip().tolist()
+        embeddings = compute_embeddings(texts, batch_size, encoder, cache)
+        scales = None
+        if dtype == 'int8':
+            embeddings, scales = quantize(embeddings)
+        elif dtype != 'float32':
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        entity_columns = [c for columns in ENTITY_COLUMNS.values() for c in columns]
+        keep = [c for c in [ID_COLUMN] + entity_columns if c in df.columns]
+        rows = df[keep].astype(object).where(df[keep].notna(), None)
+        return cls(embeddings, rows, scales, text_columns=text_columns)
+
+    def save(self, directory: str = DEFAULT_INDEX_DIR) -> None:
+        """Write embeddings.npy (+ scales.npy, hnsw.bin), rows.parquet and meta.json to directory."""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'embeddings.npy'), np.asarray(self.embeddings))
+        if self.scales is not None:
+            np.save(os.path.join(directory, 'scales.npy'), np.asarray(self.scales))
+        self.rows.to_parquet(os.path.join(directory, 'rows.parquet'), index=False)
+        meta = {
+            'model': self.model_name,
+            'dtype': 'int8' if self.quantized else 'float32',
+            'count': len(self),
+            'text_columns': self.text_columns,
+            'ann': self._ann is not None,
+        }
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        ann_path = os.path.join(directory, 'hnsw.bin')
+        if self._ann is not None:
+            self._ann.save_index(ann_path)
+        elif os.path.exists(ann_path):
+            # A graph left by an earlier build indexes other rows
+            os.remove(ann_path)
+
+    @classmethod
+    def load(cls, directory: str = DEFAULT_INDEX_DIR, mmap: bool = True) -> 'SimilarityIndex':
+        """Open a saved index; the embeddings are memory-mapped unless mmap is False.
+
+        The HNSW graph is attached only if meta.json says it was saved with this index.
+        """
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        embeddings = np.load(os.path.join(directory, 'embeddings.npy'), mmap_mode=mmap_mode)
+        scales = None
+        if meta['dtype'] == 'int8':
+            scales = np.load(os.path.join(directory, 'scales.npy'))
+        rows = pd.read_parquet(os.path.join(directory, 'rows.parquet'))
+        index = cls(embeddings, rows, scales, meta['model'], meta['text_columns'])
+        ann_path = os.path.join(directory, 'hnsw.bin')
+        if meta.get('ann') and os.path.exists(ann_path):
+            index.load_ann(ann_path)
+        return index
+
+    def _block(self, start: int, stop: int) -> np.ndarray:
+        block = np.asarray(self.embeddings[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:stop, None]
+        return block
+
+    def _score_rows(self, rows: np.ndarray, query: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+        scores = rows.astype(np.float32, copy=False) @ query
+        # int8 rows: scale the scores rather than dequantizing the whole block
+        return scores * scales if scales is not None else scores
+
+    def scores(self, query_embedding: np.ndarray, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine similarity of the query to every row (or to the rows at positions)."""
+        query = normalize(query_embedding)
+        if positions is not None:
+            scales = self.scales[positions] if self.scales is not None else None
+            return self._score_rows(self.embeddings[positions], query, scales)
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            stop = min(start + SCORE_BLOCK_ROWS, len(self))
+            scales = self.scales[start:stop] if self.scales is not None else None
+            scores[start:stop] = self._score_rows(self.embeddings[start:stop], query, scales)
+        return scores
+
+    def entity_rows(self, entity: str) -> np.ndarray:
+        """Positions of the NCRs that involve entity (machine, NC code or operation)."""
+        if self._entities is None:
+            self._entities = EntityIndex.from_dataframe(self.rows, ENTITY_COLUMNS)
+        return self._entities.lookup_any(entity)
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 5,
+        entity: Optional[str] = None,
+    ) -> List[Tuple[int, float]]:
+        """(row position, similarity) of the top_k most similar NCRs, optionally involving entity."""
+        if entity:
+            positions = self.entity_rows(entity)
+            scores = self.scores(query_embedding, positions)
+            best = top_k_positions(scores, top_k)
+            return [(int(positions[i]), float(scores[i])) for i in best]
+        if self._ann is not None:
+            labels, distances = self._ann.knn_query(normalize(query_embedding), k=min(top_k, len(self)))
+            return [(int(i), float(1 - d)) for i, d in zip(labels[0], distances[0])]
+        scores = self.scores(query_embedding)
+        return [(int(i), float(scores[i])) for i in top_k_positions(scores, top_k)]
+
+    def search_text(
+        self,
+        text: str,
+        top_k: int = 5,
+        entity: Optional[str] = None,
+        encoder: Optional[Encoder] = None,
+        cache: Optional[EmbeddingCache] = None,
+    ) -> pd.DataFrame:
+        """The top_k NCRs most similar to text, as rows with a 'similarity' column."""
+        query = compute_embeddings([text], encoder=encoder, cache=cache)[0]
+        hits = self.search(query, top_k, entity)
+        result = self.rows.iloc[[i for i, _ in hits]].copy()
+        result['similarity'] = [score for _, score in hits]
+        return result
+
+    def build_ann(self, ef_construction: int = 200, m: int = 16, ef_search: int = 64) -> None:
+        """Build an HNSW graph (requires hnswlib) used for unfiltered searches."""
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("The ANN backend requires hnswlib (pip install hnswlib)") from e
+        ann = hnswlib.Index(space='ip', dim=self.embeddings.shape[1])
+        ann.init_index(max_elements=len(self), ef_construction=ef_construction, M=m)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            stop = min(start + SCORE_BLOCK_ROWS, len(self))
+            ann.add_items(normalize(self._block(start, stop)), np.arange(start, stop))
+        ann.set_ef(ef_search)
+        self._ann = ann
+
+    def load_ann(self, path: str, ef_search: int = 64) -> None:
+        """Use a saved HNSW graph; without hnswlib installed, searches stay exact (logged once per process)."""
+        global _ann_fallback_logged
+        try:
+            import hnswlib
+        except ImportError:
+            if not _ann_fallback_logged:
+                logger.warning("hnswlib is not installed: ignoring %s, similar-NCR searches use the exact scan", path)
+                _ann_fallback_logged = True
+            return
+        ann = hnswlib.Index(space='ip', dim=self.embeddings.shape[1])
+        ann.load_index(path, max_elements=len(self))
+        ann.set_ef(ef_search)
+        self._ann = ann
+
+
+def get_index(directory: str = DEFAULT_INDEX_DIR) -> 'SimilarityIndex':
+    """Shared index saved in directory, loaded on first use and again after a rebuild."""
+    modified = os.path.getmtime(os.path.join(directory, 'meta.json'))
+    cached = _indexes.get(directory)
+    if cached is None or cached[0] != modified:
+        _indexes[directory] = (modified, SimilarityIndex.load(directory))
+    return _indexes[directory][1]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from src.storage import load_enriched, resolve_enriched_path
+
+    parser = argparse.ArgumentParser(description='Build the similar-NCR index or query it.')
+    parser.add_argument('--build', action='store_true', help='embed the enriched dataset and save the index')
+    parser.add_argument('--input', default=None, help='enriched dataset (default: data/prod_data_enriched.parquet)')
+    parser.add_argument('--index', default=DEFAULT_INDEX_DIR, help='index directory')
+    parser.add_argument('--dtype', choices=['float32', 'int8'], default='float32', help='stored embedding type')
+    parser.add_argument('--ann', action='store_true', help='also build an HNSW graph (requires hnswlib)')
+    parser.add_argument('--query', help='text to find similar NCRs for')
+    parser.add_argument('--entity', help='only NCRs involving this machine, NC code or operation')
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--no-cache', action='store_true', help='do not use the embedding cache')
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else EmbeddingCache()
+    if args.build:
+        df = load_enriched(args.input or resolve_enriched_path())
+        index = SimilarityIndex.build(df, dtype=args.dtype, cache=cache)
+        if args.ann:
+            index.build_ann()
+        index.save(args.index)
+        print(f"{len(index)} NCRs indexed in {args.index}")
+        if cache is not None:
+            print(f"Embedding cache: {cache.stats()}")
+    if args.query:
+        index = SimilarityIndex.load(args.index)
+        print(index.search_text(args.query, args.top_k, args.entity, cache=cache).to_string())
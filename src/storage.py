@@ -0,0 +1,175 @@
+"""
+Storage of the enriched NCR dataset.
+
+Parquet is the primary format: categorical columns are dictionary-encoded and
+readers can load only the columns (projection) and rows (predicate pushdown)
+they need. The semicolon CSV format stays available for import and export;
+the format is chosen from the file extension.
+
+Filters use the pyarrow/pandas syntax, a list of (column, op, value) tuples that
+must all hold, e.g. [('NC Code', '==', 'EL0312'), ('Part type', 'in', ['AA1'])].
+As in Parquet, comparisons with a missing value are false ('not in' keeps them).
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from src.schema import CATEGORICAL_COLUMNS, TEXT_COLUMNS
+
+ENRICHED_PARQUET_PATH = 'data/prod_data_enriched.parquet'
+ENRICHED_CSV_PATH = 'data/prod_data_enriched.csv'
+
+# Low-cardinality columns stored dictionary-encoded.
+DICTIONARY_COLUMNS = CATEGORICAL_COLUMNS + [
+    'defect_type',
+    'root_cause_category',
+    'corrective_category',
+    'fqc_category',
+    'defect_category',
+]
+
+# Free-text columns; a chunk where one is empty must still be written as strings.
+STRING_COLUMNS = TEXT_COLUMNS + [
+    'Job order',
+    'extracted_machines',
+    'extracted_nc_codes',
+    'extracted_operations',
+    'root_cause',
+    'fqc_dates',
+    'fqc_dept_codes',
+]
+
+Filters = List[Tuple[str, str, object]]
+
+
+def is_parquet(filepath: str) -> bool:
+    return os.path.splitext(filepath)[1].lower() in ('.parquet', '.pq')
+
+
+def to_storage_types(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast the dictionary columns of df to categoricals."""
+    typed = df.copy(deep=False)
+    for col in DICTIONARY_COLUMNS:
+        if col in typed.columns and not isinstance(typed[col].dtype, pd.CategoricalDtype):
+            typed[col] = typed[col].astype('category')
+    return typed
+
+
+def apply_filters(df: pd.DataFrame, filters: Optional[Filters]) -> pd.DataFrame:
+    """Apply Parquet-style filters in pandas (used for CSV files)."""
+    if not filters:
+        return df
+    keep = pd.Series(True, index=df.index)
+    for col, op, value in filters:
+        values = df[col]
+        if op in ('=', '=='):
+            cond = values == value
+        elif op == '!=':
+            cond = values != value
+        elif op == '<':
+            cond = values < value
+        elif op == '<=':
+            cond = values <= value
+        elif op == '>':
+            cond = values > value
+        elif op == '>=':
+            cond = values >= value
+        elif op == 'in':
+            cond = values.isin(value)
+        elif op == 'not in':
+            keep &= ~values.isin(value)
+            continue
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        keep &= cond.fillna(False).astype(bool) & values.notna()
+    return df[keep]
+
+
+def save_enriched(df: pd.DataFrame, filepath: str = ENRICHED_PARQUET_PATH) -> None:
+    """Write the enriched dataset as Parquet or ';'-separated CSV depending on the extension."""
+    if is_parquet(filepath):
+        to_storage_types(df).to_parquet(filepath, index=False)
+    else:
+        df.to_csv(filepath, index=False, sep=';')
+
+
+def load_enriched(
+    filepath: str = ENRICHED_PARQUET_PATH,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> pd.DataFrame:
+    """
+    Load the enriched dataset, optionally only some columns and the rows matching filters.
+
+    With Parquet, columns and filters are pushed down to the reader; with CSV they
+    are applied after parsing.
+    """
+    if is_parquet(filepath):
+        return pd.read_parquet(filepath, columns=columns, filters=filters or None)
+    usecols = None
+    if columns is not None:
+        usecols = list(dict.fromkeys(list(columns) + [col for col, _, _ in filters or []]))
+    df = apply_filters(pd.read_csv(filepath, sep=';', usecols=usecols), filters)
+    return df[columns] if columns is not None else df
+
+
+def enriched_columns(filepath: str = ENRICHED_PARQUET_PATH) -> List[str]:
+    """Column names of a stored enriched dataset, without reading its rows."""
+    if is_parquet(filepath):
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(filepath).names
+    return list(pd.read_csv(filepath, sep=';', nrows=0).columns)
+
+
+def resolve_enriched_path(filepath: str = ENRICHED_PARQUET_PATH) -> str:
+    """The Parquet file when it exists, else the CSV export next to it."""
+    if is_parquet(filepath) and not os.path.exists(filepath):
+        csv_filepath = os.path.splitext(filepath)[0] + '.csv'
+        if os.path.exists(csv_filepath):
+            return csv_filepath
+    return filepath
+
+
+class ChunkWriter:
+    """Append DataFrame chunks to a Parquet (one row group per chunk) or CSV file."""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.rows = 0
+        self._parquet = is_parquet(filepath)
+        self._writer = None
+        # Whether the CSV header is written; rows stays 0 after an empty first chunk
+        self._started = False
+
+    def write(self, chunk: pd.DataFrame) -> None:
+        if self._parquet:
+            self._write_parquet(chunk)
+        else:
+            chunk.to_csv(self.filepath, index=False, sep=';', mode='a' if self._started else 'w', header=not self._started)
+            self._started = True
+        self.rows += len(chunk)
+
+    def _write_parquet(self, chunk: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(to_storage_types(chunk), preserve_index=False)
+        if self._writer is None:
+            # Later chunks have other categories or all-empty columns, so fix the types up front.
+            fields = []
+            for field in table.schema:
+                if pa.types.is_dictionary(field.type):
+                    field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+                elif field.name in STRING_COLUMNS or pa.types.is_null(field.type):
+                    field = field.with_type(pa.string())
+                fields.append(field)
+            self._writer = pq.ParquetWriter(self.filepath, pa.schema(fields))
+        self._writer.write_table(table.select(self._writer.schema.names).cast(self._writer.schema))
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
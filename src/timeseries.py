@@ -0,0 +1,198 @@
+"""
+Pre-aggregated NCR time series.
+
+TimeSeriesIndex keeps NCR counts per day, week (starting Monday) and month of
+detection, in total and broken down by NC Code, machine and part type, together with
+the machining-to-detection lag of those NCRs. Trend charts at any granularity are then
+a lookup instead of a scan of all NCRs. New NCRs are added with update(), which only
+groups the new rows.
+
+Detection dates are kept as one int32 day number per NCR (days since 1970-01-01,
+INT32_NAT when missing), parsed once by the schema of src/schema.py.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+DETECTION_COLUMN = 'Date of detection'
+MACHINING_COLUMN = 'Date of machining'
+LAG_COLUMN = 'detection_lag_days'
+
+FREQUENCIES = ['day', 'week', 'month']
+DIMENSIONS = ['NC Code', 'MachineNum of detection', 'Part type']
+
+INT32_NAT = np.iinfo(np.int32).min
+ROLLUP_COLUMNS = ['count', 'lag_sum', 'lag_count']
+
+# 1970-01-01 was a Thursday: day n is (n + 3) % 7 days after the Monday of its week
+_EPOCH_WEEKDAY = 3
+
+RollupKey = Tuple[str, Optional[str]]
+
+
+def detection_lag_days(df: pd.DataFrame) -> pd.Series:
+    """Days between machining and detection of each NCR (NaN when either date is missing)."""
+    if DETECTION_COLUMN not in df.columns or MACHINING_COLUMN not in df.columns:
+        return pd.Series(np.nan, index=df.index, name=LAG_COLUMN)
+    lag = (df[DETECTION_COLUMN] - df[MACHINING_COLUMN]) / np.timedelta64(1, 'D')
+    return lag.rename(LAG_COLUMN)
+
+
+def to_day_numbers(dates: pd.Series) -> np.ndarray:
+    """Datetime series as int32 days since 1970-01-01, INT32_NAT for NaT."""
+    values = dates.to_numpy(dtype='datetime64[D]')
+    days = values.astype('int64')
+    missing = np.isnat(values)
+    days[missing] = INT32_NAT
+    return days.astype(np.int32)
+
+
+def period_starts(days: np.ndarray, freq: str) -> np.ndarray:
+    """First day number of the day, week or month each day number falls in (valid day numbers only)."""
+    if freq == 'day':
+        return days
+    if freq == 'week':
+        return days - (days + _EPOCH_WEEKDAY) % 7
+    if freq == 'month':
+        months = days.astype('datetime64[D]').astype('datetime64[M]')
+        return months.astype('datetime64[D]').astype(np.int32)
+    raise ValueError(f"Unknown frequency {freq!r}, expected one of {FREQUENCIES}")
+
+
+def _to_dates(days: np.ndarray) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(days.astype('datetime64[D]').astype('datetime64[s]'))
+
+
+class TimeSeriesIndex:
+    """NCR counts and detection-lag sums per period, in total and per value of each dimension."""
+
+    def __init__(self, dimensions: Sequence[str] = DIMENSIONS):
+        self.dimensions = list(dimensions)
+        self.days = np.empty(0, dtype=np.int32)
+        self._rollups: Dict[RollupKey, pd.DataFrame] = {}
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, dimensions: Sequence[str] = DIMENSIONS) -> 'TimeSeriesIndex':
+        index = cls([d for d in dimensions if d in df.columns])
+        index.update(df)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def keys(self) -> List[RollupKey]:
+        """(frequency, dimension) of every rollup; dimension None is the total."""
+        return [(freq, dim) for freq in FREQUENCIES for dim in [None] + self.dimensions]
+
+    def update(self, df: pd.DataFrame) -> None:
+        """Add the rows of df (rows without a detection date are kept in days but not counted)."""
+        if df.empty:
+            return
+        if DETECTION_COLUMN not in df.columns:
+            raise KeyError(f"Missing column {DETECTION_COLUMN!r}")
+        days = to_day_numbers(df[DETECTION_COLUMN])
+        self.days = np.concatenate([self.days, days])
+
+        dated = days != INT32_NAT
+        lag = detection_lag_days(df).to_numpy(dtype=float)[dated]
+        has_lag = ~np.isnan(lag)
+        measures = pd.DataFrame({
+            'count': np.ones(len(lag), dtype=np.int64),
+            'lag_sum': np.where(has_lag, lag, 0.0),
+            'lag_count': has_lag.astype(np.int64),
+        })
+        dimension_values = {dim: df[dim].to_numpy()[dated] for dim in self.dimensions}
+        for freq in FREQUENCIES:
+            periods = period_starts(days[dated], freq)
+            for dim in [None] + self.dimensions:
+                keys = [periods] if dim is None else [periods, dimension_values[dim]]
+                rollup = measures.groupby(keys, observed=True, dropna=True).sum()
+                previous = self._rollups.get((freq, dim))
+                if previous is not None:
+                    rollup = previous.add(rollup, fill_value=0).astype(previous.dtypes.to_dict())
+                self._rollups[(freq, dim)] = rollup
+
+    def copy(self) -> 'TimeSeriesIndex':
+        other = TimeSeriesIndex(self.dimensions)
+        other.days = self.days
+        other._rollups = dict(self._rollups)
+        return other
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        """Detection date of every NCR added (NaT when missing)."""
+        days = self.days.astype('int64')
+        values = days.astype('datetime64[D]')
+        values[self.days == INT32_NAT] = np.datetime64('NaT')
+        return pd.DatetimeIndex(values.astype('datetime64[s]'))
+
+    def date_range(self) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        """First and last detection date, (None, None) without any."""
+        dated = self.days[self.days != INT32_NAT]
+        if not len(dated):
+            return None, None
+        first, last = _to_dates(np.array([dated.min(), dated.max()]))
+        return first, last
+
+    def rollup(self, freq: str = 'day', by: Optional[str] = None) -> pd.DataFrame:
+        """Raw rollup: count, lag_sum, lag_count, indexed by period start date (and value of by)."""
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Unknown frequency {freq!r}, expected one of {FREQUENCIES}")
+        if by is not None and by not in self.dimensions:
+            raise KeyError(f"Dimension not indexed: {by!r}")
+        rollup = self._rollups.get((freq, by))
+        if rollup is None:
+            return pd.DataFrame(columns=ROLLUP_COLUMNS)
+        rollup = rollup.copy()
+        if by is None:
+            rollup.index = _to_dates(rollup.index.to_numpy())
+            rollup.index.name = 'Date'
+        else:
+            rollup.index = rollup.index.set_levels(_to_dates(rollup.index.levels[0].to_numpy()), level=0)
+            rollup.index.names = ['Date', by]
+        return rollup
+
+    def trend(
+        self,
+        freq: str = 'day',
+        by: Optional[str] = None,
+        top: Optional[int] = None,
+        values: Optional[Sequence] = None,
+    ) -> pd.DataFrame:
+        """
+        NCR counts per period, one row per period start date.
+
+        Without by, a single 'Count' column; with by, one column per value of that
+        dimension (the top most frequent ones, or the given values), ready for st.line_chart.
+        """
+        rollup = self.rollup(freq, by)
+        if by is None:
+            return rollup[['count']].rename(columns={'count': 'Count'})
+        counts = rollup['count'].unstack(by, fill_value=0)
+        if values is not None:
+            counts = counts.reindex(columns=list(values), fill_value=0)
+        elif top is not None:
+            counts = counts[counts.sum().sort_values(ascending=False, kind='stable').index[:top]]
+        counts.columns = counts.columns.astype(str)
+        return counts
+
+    def lag_trend(self, freq: str = 'week', by: Optional[str] = None) -> pd.DataFrame:
+        """Mean machining-to-detection lag (days) per period, with the NCRs it is measured on."""
+        rollup = self.rollup(freq, by)
+        lag = pd.DataFrame({
+            'Mean lag (days)': rollup['lag_sum'] / rollup['lag_count'].where(rollup['lag_count'] > 0),
+            'NCRs with lag': rollup['lag_count'],
+        })
+        return lag
+
+    def lag_by(self, by: str) -> pd.DataFrame:
+        """Mean lag over the whole history for each value of by, longest first."""
+        rollup = self.rollup('month', by).groupby(level=by, observed=True).sum()
+        lag = pd.DataFrame({
+            by: rollup.index,
+            'Mean lag (days)': (rollup['lag_sum'] / rollup['lag_count'].where(rollup['lag_count'] > 0)).to_numpy(),
+            'NCRs with lag': rollup['lag_count'].to_numpy(),
+        })
+        return lag.dropna().sort_values('Mean lag (days)', ascending=False, kind='stable').reset_index(drop=True)
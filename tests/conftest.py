@@ -0,0 +1,16 @@
+import pandas as pd
+import pytest
+
+from src.extraction import enrich_dataframe, load_prod_data
+
+PROD_DATA_PATH = 'data/prod_data.csv'
+
+
+@pytest.fixture(scope='session')
+def prod_raw() -> pd.DataFrame:
+    return load_prod_data(PROD_DATA_PATH)
+
+
+@pytest.fixture(scope='session')
+def prod_enriched(prod_raw) -> pd.DataFrame:
+    return enrich_dataframe(prod_raw, workers=1)
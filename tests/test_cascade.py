@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip('dashscope')
+
+from src.cascade import (  # noqa: E402
+    CATEGORY_COLUMNS,
+    accuracy_curve,
+    calibrate,
+    is_confident,
+    predict_cascade,
+)
+from src.generation_stub import StubGeneration  # noqa: E402
+
+
+def _local(roots, actions, confidences):
+    return pd.DataFrame({
+        'predicted_root_cause_category': roots,
+        'predicted_corrective_action_category': actions,
+        'defect_confidence': confidences,
+        'root_cause_confidence': 0.9,
+        'corrective_action_confidence': 0.9,
+    })
+
+
+def test_fallback_categories_are_never_confident():
+    local = _local(['Other', 'Unknown', 'Undefined', 'Tooling'], ['Tool change', 'Other', 'Tool change', 'Tool change'], 0.9)
+    assert is_confident(local, 0.1).tolist() == [False, False, False, True]
+
+
+def test_accuracy_curve_counts_ties_and_mismatches():
+    local = _local(['A'] * 30 + ['B'] * 10, ['X'] * 40, [0.9] * 25 + [0.5] * 5 + [0.3] * 10)
+    history = pd.DataFrame({
+        'root_cause_category': ['A'] * 24 + ['Z'] + ['A'] * 5 + ['Q'] * 10,
+        'corrective_category': ['X'] * 40,
+    })
+    curve = accuracy_curve(local, history)
+    assert curve['threshold'].tolist() == [0.9, 0.5, 0.3]
+    assert curve['answered'].tolist() == [25, 30, 40]
+    assert curve['accuracy'].tolist() == pytest.approx([24 / 25, 29 / 30, 29 / 40])
+
+
+def test_poc_models_are_not_calibrated_on_prod(prod_enriched):
+    assert calibrate(prod_enriched) is None
+
+
+def test_uncalibrated_cascade_sends_every_row_to_the_llm(prod_enriched):
+    rows = prod_enriched.head(4).drop(columns=['Root cause of occurrence', 'Corrective actions'])
+    stub = StubGeneration()
+    result = predict_cascade(rows, 'context', generation=stub, max_workers=1, requests_per_second=0)
+    assert result['prediction_source'].eq('llm').all()
+    assert result['predicted_root_cause'].str.startswith('stub root cause').all()
+    assert result[CATEGORY_COLUMNS].isna().all().all()
+
+
+def test_permanent_llm_errors_are_reported_without_retrying(prod_enriched):
+    rows = prod_enriched.head(4).drop(columns=['Root cause of occurrence', 'Corrective actions'])
+    stub = StubGeneration(failure_rate=1.0, failure_status=401)
+    result = predict_cascade(rows, 'context', generation=stub, max_workers=1, requests_per_second=0)
+    assert stub.calls == 1
+    assert result['prediction_source'].eq('error').all()
+    assert result['prediction_error'].str.contains('401').all()
+    assert result['predicted_root_cause'].eq('').all()
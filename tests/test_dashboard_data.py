@@ -0,0 +1,48 @@
+import pandas as pd
+import pandas.testing as pdt
+
+from src.dashboard_data import DashboardData
+
+MACHINE = 'MachineNum of detection'
+
+
+def _appended(enriched: pd.DataFrame, n: int = 1) -> pd.DataFrame:
+    return pd.concat([enriched, enriched.tail(n)], ignore_index=True)
+
+
+def _assert_same_indexes(incremental: DashboardData, fresh: DashboardData) -> None:
+    pdt.assert_frame_equal(incremental.pair_counts(MACHINE, 'NC Code'), fresh.pair_counts(MACHINE, 'NC Code'))
+    pdt.assert_frame_equal(incremental.trend('week', MACHINE, top=5), fresh.trend('week', MACHINE, top=5))
+    assert incremental.entities.values('machine').to_dict() == fresh.entities.values('machine').to_dict()
+    pdt.assert_series_equal(incremental.entity_matrix.frequencies('machine'), fresh.entity_matrix.frequencies('machine'))
+    pdt.assert_frame_equal(incremental.alerts(), fresh.alerts())
+
+
+def test_appended_rows_are_counted_incrementally(prod_enriched):
+    previous = DashboardData(('prod', 1), prod_enriched)
+    enriched = _appended(prod_enriched, 5)
+    current = DashboardData(('prod', 2), enriched, previous)
+
+    assert previous.is_prefix_of(current)
+    _assert_same_indexes(current, DashboardData(('prod', 2), enriched))
+
+
+def test_edited_id_column_forces_rebuild(prod_enriched):
+    previous = DashboardData(('prod', 1), prod_enriched)
+    edited = prod_enriched.copy()
+    edited[MACHINE] = 'ZZZZ-99-99'
+    enriched = _appended(edited)
+    current = DashboardData(('prod', 2), enriched, previous)
+
+    assert not previous.is_prefix_of(current)
+    _assert_same_indexes(current, DashboardData(('prod', 2), enriched))
+    assert current.pair_counts(MACHINE, 'NC Code')[MACHINE].eq('ZZZZ-99-99').all()
+
+
+def test_edited_date_forces_rebuild(prod_enriched):
+    previous = DashboardData(('prod', 1), prod_enriched)
+    edited = prod_enriched.copy()
+    edited.loc[0, 'Date of detection'] = edited['Date of detection'].max() + pd.Timedelta(days=30)
+    current = DashboardData(('prod', 2), _appended(edited), previous)
+
+    assert not previous.is_prefix_of(current)
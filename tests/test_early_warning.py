@@ -0,0 +1,30 @@
+import pandas as pd
+
+from src.early_warning import ALERT_COOLDOWN_DAYS, EarlyWarningDetector
+
+
+def _rows(nc_code, date, count=4):
+    return [{'NC Code': nc_code, 'MachineNum of occurrence': 'EM1187', 'Operation number of occurrence': 'OP7200',
+             'Date of detection': pd.Timestamp(date)}] * count
+
+
+def test_cooldown_suppresses_repeated_alerts():
+    detector = EarlyWarningDetector()
+    start = pd.Timestamp('2025-01-01')
+    alerts = []
+    for offset in [0, 3, ALERT_COOLDOWN_DAYS]:
+        for row in _rows('CO2910', start + pd.Timedelta(days=offset)):
+            alerts.extend(detector.update(row))
+    assert [alert['date'] - start for alert in alerts] == [pd.Timedelta(0), pd.Timedelta(days=ALERT_COOLDOWN_DAYS)]
+
+
+def test_alert_memory_only_keeps_the_cooldown_window():
+    detector = EarlyWarningDetector()
+    start = pd.Timestamp('2025-01-01')
+    for day in range(60):
+        for code in range(20):
+            for row in _rows(f'CO{day:02d}{code:02d}', start + pd.Timedelta(days=day)):
+                detector.update(row)
+        # One alert per new key and day, forgotten once the cooldown has passed
+        assert len(detector._last_alert) == 20 * min(day + 1, ALERT_COOLDOWN_DAYS)
+    assert detector.total_alerts == 60 * 20
@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import generate_ncrs
+from src import extraction
+from src.extraction import DERIVE_COLUMNS, clean_dataframe, derive_columns, enrich_dataframe
+from src.schema import apply_schema, read_dtypes
+
+SHARD_ROWS = 10
+
+
+@pytest.fixture(scope='module')
+def synthetic_raw() -> pd.DataFrame:
+    return apply_schema(generate_ncrs(95, seed=3).astype(read_dtypes()))
+
+
+def test_sharded_enrichment_matches_serial(synthetic_raw, monkeypatch):
+    # Small shards so 95 rows are split in 8 shards with uneven boundaries
+    monkeypatch.setattr(extraction, 'MIN_SHARD_ROWS', SHARD_ROWS)
+    serial = enrich_dataframe(synthetic_raw, workers=1)
+    pools = []
+    get_pool = extraction._get_pool
+    monkeypatch.setattr(extraction, '_get_pool', lambda workers: pools.append(workers) or get_pool(workers))
+    sharded = enrich_dataframe(synthetic_raw, workers=2)
+    assert pools == [2]
+    pd.testing.assert_frame_equal(sharded, serial)
+
+
+def test_empty_shard_does_not_change_the_result(synthetic_raw):
+    cleaned = clean_dataframe(synthetic_raw)
+    source = cleaned[[c for c in DERIVE_COLUMNS if c in cleaned.columns]]
+    boundary = 40
+    shards = [source.iloc[:boundary], source.iloc[boundary:boundary], source.iloc[boundary:]]
+    pd.testing.assert_frame_equal(pd.concat([derive_columns(shard) for shard in shards]), derive_columns(source))
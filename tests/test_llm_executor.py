@@ -0,0 +1,90 @@
+import time
+from http import HTTPStatus
+
+import pytest
+
+from src.generation_stub import StubGeneration
+from src.llm_executor import RateLimiter, call_with_retries, load_checkpoint, run_concurrently
+
+
+class StubAPIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _predict(stub):
+    def call(nc_code):
+        prompt = f"NC Code: {nc_code}"
+        response = stub.call(messages=[{'role': 'user', 'content': prompt}])
+        if response.status_code != HTTPStatus.OK:
+            raise StubAPIError(response.status_code)
+        return response.output.choices[0].message.content
+    return call
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_transient_errors_are_retried(status):
+    stub = StubGeneration(failure_rate=1.0, failure_status=status)
+    result = call_with_retries(_predict(stub), 'NC-1', retries=2, backoff_seconds=0)
+    assert not result.ok
+    assert result.transient
+    assert result.attempts == 3
+    assert stub.calls == 3
+
+
+@pytest.mark.parametrize('status', [400, 401, 403])
+def test_permanent_errors_are_not_retried(status):
+    stub = StubGeneration(failure_rate=1.0, failure_status=status)
+    result = call_with_retries(_predict(stub), 'NC-1', retries=2, backoff_seconds=0)
+    assert not result.ok
+    assert not result.transient
+    assert str(status) in result.error
+    assert stub.calls == 1
+
+
+def test_retries_recover_from_intermittent_failures():
+    stub = StubGeneration(failure_rate=0.5, seed=1)
+    items = {str(i): f'NC-{i}' for i in range(20)}
+    results = run_concurrently(items, _predict(stub), max_workers=4, requests_per_second=0, retries=10, backoff_seconds=0)
+    assert all(result.ok for result in results.values())
+    assert results['7'].value == StubGeneration.answer('NC-7')
+    assert stub.failures > 0
+    assert stub.calls == len(items) + stub.failures
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(rate=20, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    # The first call uses the burst; the 5 others wait 1/20 s each
+    assert time.monotonic() - start >= 0.2
+
+
+def test_run_concurrently_applies_the_rate_limit():
+    stub = StubGeneration()
+    items = {str(i): f'NC-{i}' for i in range(6)}
+    start = time.monotonic()
+    run_concurrently(items, _predict(stub), max_workers=1, requests_per_second=20)
+    assert time.monotonic() - start >= 0.2
+    assert stub.calls == 6
+
+
+def test_checkpoint_resumes_only_unfinished_items(tmp_path):
+    checkpoint = str(tmp_path / 'run.ckpt.jsonl')
+    items = {str(i): f'NC-{i}' for i in range(10)}
+    failing = StubGeneration(failure_rate=0.5, failure_status=401, seed=2)
+    first = run_concurrently(items, _predict(failing), max_workers=1, requests_per_second=0, checkpoint_path=checkpoint)
+    failed = {key for key, result in first.items() if not result.ok}
+    assert 0 < len(failed) < len(items)
+    assert set(load_checkpoint(checkpoint)) == set(items) - failed
+
+    healthy = StubGeneration()
+    second = run_concurrently(items, _predict(healthy), max_workers=1, requests_per_second=0, checkpoint_path=checkpoint)
+    assert healthy.calls == len(failed)
+    assert all(result.ok for result in second.values())
+    assert {key for key, result in second.items() if result.resumed} == set(items) - failed
+    assert {key: result.value for key, result in second.items()} == {
+        key: StubGeneration.answer(item) for key, item in items.items()
+    }
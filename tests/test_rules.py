@@ -0,0 +1,119 @@
+"""Golden cases for categorization_rules.json: the categories of the original if/elif chains."""
+
+import pandas as pd
+import pytest
+
+from src.rules import CORRECTIVE_RULES, DEFECT_RULES, DEFECT_SCORER, FQC_RULES, ROOT_CAUSE_RULES
+
+ROOT_CAUSE_CASES = [
+    ('nan', 'Undefined'),
+    ('  ', 'Undefined'),
+    ('Same issue as EL2415, tool wear', 'Related to NC EL2415'),
+    ('1.Marking NC program error', 'Marking Precision'),
+    ('Marking machine precision is low', 'Marking Precision'),
+    ('Machine AAAA-02-11 deviation on X axis', 'Machine AAAA-02-11 Deviation'),
+    ('CP&CPK below 1.33', 'Process Stability (CP/CPK)'),
+    ('AAAA-02-11 not stable after restart', 'Machine AAAA-02-11 Stability'),
+    ('Damaged during transportation', 'Logistics & Transport'),
+    ('Root cause not clear yet', 'Unclear'),
+    ('BBBB-02-05 has deviation on centering', 'Machine BBBB-02-05 Centering'),
+    ('deviation on cerntering', 'Machine BBBB-02-05 Centering'),
+    ('Transportation damage', 'Other'),
+    ('Operator mistake', 'Other'),
+]
+
+CORRECTIVE_CASES = [
+    ('None', 'Action Not Specified (NaN)'),
+    ('', 'Action Not Specified (NaN)'),
+    ('Cancel releasing CLAMPING FORCE', 'Cancel Releasing Clamping Force'),
+    ('Add manual tool calibration step', 'Add Manual Tool Calibration'),
+    ('Cancelled Compensation 0.005 on OP7200', 'Cancelled Compensation 0.005'),
+    ('Lesson&Learn shared with the team', 'Lesson & Learn'),
+    ('Maintenance marking machine', 'Maintenance marking machine'),
+    ('Marking machine maintenance', 'Marking machine maintenance'),
+    ('maintenance marking machine', 'Other'),
+    ('Replace the tool', 'Other'),
+]
+
+FQC_CASES = [
+    ('/', 'Undefined'),
+    ('NONE', 'Undefined'),
+    ('Awaiting QA decision', 'Pending Decision'),
+    ('Verbal approval to continue', 'Decision: Proceed/Accept'),
+    ('See attachment, FCTD result', 'Measurement/Verification'),
+    ('QA confirmed rework', 'QA Replied/Action Taken'),
+    ('Parts moved to stock', 'Other/General'),
+]
+
+DEFECT_CASES = [
+    ('/', 'Undefined'),
+    ('CO2910-R342', 'CO2910-R342 Deviation'),
+    ('OP7200 DA', 'OP7200 DA Operation'),
+    ('Checked under DA2512100009', 'DA2512100009 (Post-Check)'),
+    ('out of tolerance after re-measurement 1', 'Out of Tolerance (Post-Check)'),
+    ('Failed the 1st time', 'Primary Measurement Failure'),
+    ('EL0312-MAX out', 'EL0312-MAX Deviation'),
+    ('dimension out of tolerance', 'General Out of Tolerance'),
+    ('Dimension out of tolerance', 'Other Technical Records'),
+    ('Failed again after rework', 'Post-Rework Failure'),
+    ('CO2910-R342 out of tolerance by 0.02', 'CO2910-R342 Out of Tolerance'),
+    ('Small dent on the flange', 'Flange Surface Dent'),
+    ('scratch on the flange', 'Flange Scratch'),
+    ('Marking not visually clear', 'Marking Visual Clarity'),
+    ('Marking too shallow', 'Marking Depth Issue'),
+]
+
+# First match wins by rule order, not by position in the text
+RULE_ORDER_CASES = [
+    (ROOT_CAUSE_RULES, 'AAAA-02-11 deviation, same as EL2415', 'Related to NC EL2415'),
+    (ROOT_CAUSE_RULES, 'AAAA-02-11 not stable, CP&CPK low', 'Process Stability (CP/CPK)'),
+    (CORRECTIVE_RULES, 'Lesson&Learn: add manual tool calibration', 'Add Manual Tool Calibration'),
+    (FQC_RULES, 'Rework confirmed, waiting for recheck', 'Pending Decision'),
+    (DEFECT_RULES, 'CO2910-R342 out of tolerance after rework', 'Post-Rework Failure'),
+    (DEFECT_RULES, 'scratch and dent', 'Flange Surface Dent'),
+    (DEFECT_RULES, 'EL0312-MAX measured the 1st time', 'Primary Measurement Failure'),
+]
+
+DEFECT_TYPE_CASES = [
+    ('Diameter out of tolerance, measured 0.02 mm over', 'dimensional'),
+    ('Scratch and dent on the surface', 'surface'),
+    ('Marking faint, characters unrecognizable', 'marking'),
+    ('FCTD after re-measurement', 'measurement'),
+    # Tie between surface and process: the first label wins
+    ('dent after deviation', 'surface'),
+    ('No defect keyword here', 'unknown'),
+]
+
+RULE_SETS = [
+    (ROOT_CAUSE_RULES, ROOT_CAUSE_CASES),
+    (CORRECTIVE_RULES, CORRECTIVE_CASES),
+    (FQC_RULES, FQC_CASES),
+    (DEFECT_RULES, DEFECT_CASES),
+]
+
+
+@pytest.mark.parametrize('rules,text,expected', [
+    (rules, text, expected) for rules, cases in RULE_SETS for text, expected in cases
+] + RULE_ORDER_CASES)
+def test_categorize(rules, text, expected):
+    assert rules.categorize(text) == expected
+
+
+@pytest.mark.parametrize('rules,cases', RULE_SETS)
+def test_categorize_column_matches_categorize(rules, cases):
+    texts = pd.Series([text for text, _ in cases] + [None], dtype=object)
+    expected = [rules.categorize(text) for text in texts]
+    assert rules.categorize_column(texts).tolist() == expected
+
+
+def test_missing_values_are_categorized_by_their_str():
+    # As in the original chains: str(None) is 'None', str(nan) is 'nan'
+    texts = pd.Series([None, float('nan')], dtype=object)
+    assert ROOT_CAUSE_RULES.categorize_column(texts).tolist() == ['Other', 'Undefined']
+    assert CORRECTIVE_RULES.categorize_column(texts).tolist() == ['Action Not Specified (NaN)', 'Action Not Specified (NaN)']
+
+
+@pytest.mark.parametrize('text,expected', DEFECT_TYPE_CASES)
+def test_defect_type(text, expected):
+    assert DEFECT_SCORER.classify(text) == expected
+    assert DEFECT_SCORER.classify_column(pd.Series([text])).tolist() == [expected]
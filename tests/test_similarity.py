@@ -0,0 +1,57 @@
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import similarity
+from src.similarity import SimilarityIndex, get_index
+
+TEXTS = ['dent on flange', 'scratch on flange', 'diameter out of tolerance', 'marking too shallow']
+
+
+def _encoder(texts):
+    # Bag of letters: deterministic and close for texts sharing words
+    vectors = np.zeros((len(texts), 26), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for char in text.lower():
+            if 'a' <= char <= 'z':
+                vectors[row, ord(char) - ord('a')] += 1
+    return vectors
+
+
+def _saved_index(directory):
+    df = pd.DataFrame({'Job order': [f'AA1_{i}' for i in range(len(TEXTS))], 'NC description': TEXTS})
+    index = SimilarityIndex.build(df, text_columns=['NC description'], encoder=_encoder)
+    index.save(str(directory))
+    return index
+
+
+def test_saved_graph_without_hnswlib_falls_back_to_exact_search_and_logs_once(tmp_path, monkeypatch, caplog):
+    _saved_index(tmp_path)
+    meta = (tmp_path / 'meta.json')
+    meta.write_text(meta.read_text().replace('"ann": false', '"ann": true'))
+    (tmp_path / 'hnsw.bin').write_bytes(b'')
+    monkeypatch.setitem(sys.modules, 'hnswlib', None)
+    monkeypatch.setattr(similarity, '_ann_fallback_logged', False)
+
+    with caplog.at_level(logging.WARNING, logger='src.similarity'):
+        first = SimilarityIndex.load(str(tmp_path))
+        SimilarityIndex.load(str(tmp_path))
+    assert len([r for r in caplog.records if 'hnswlib' in r.getMessage()]) == 1
+    hits = first.search_text('dent on flange', top_k=2, encoder=_encoder)
+    assert hits['Job order'].iloc[0] == 'AA1_0'
+    assert hits['similarity'].iloc[0] == pytest.approx(1.0)
+
+
+def test_get_index_reloads_after_a_rebuild(tmp_path):
+    _saved_index(tmp_path)
+    index = get_index(str(tmp_path))
+    assert get_index(str(tmp_path)) is index
+    meta = tmp_path / 'meta.json'
+    stat = meta.stat()
+    _saved_index(tmp_path)
+    os.utime(meta, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert get_index(str(tmp_path)) is not index
@@ -0,0 +1,28 @@
+import pandas as pd
+import pytest
+
+from src.storage import ChunkWriter, load_enriched
+
+
+@pytest.mark.parametrize('filename', ['enriched.csv', 'enriched.parquet'])
+def test_chunk_writer_skips_the_header_of_an_empty_first_chunk(prod_enriched, tmp_path, filename):
+    filepath = str(tmp_path / filename)
+    writer = ChunkWriter(filepath)
+    for chunk in [prod_enriched.iloc[:0], prod_enriched.iloc[:40], prod_enriched.iloc[40:]]:
+        writer.write(chunk)
+    writer.close()
+    assert writer.rows == len(prod_enriched)
+    loaded = load_enriched(filepath)
+    assert len(loaded) == len(prod_enriched)
+    assert loaded['Job order'].astype(str).tolist() == prod_enriched['Job order'].astype(str).tolist()
+
+
+def test_chunk_writer_csv_has_one_header(prod_enriched, tmp_path):
+    filepath = str(tmp_path / 'enriched.csv')
+    writer = ChunkWriter(filepath)
+    for chunk in [prod_enriched.iloc[:0], prod_enriched.iloc[:40], prod_enriched.iloc[:0], prod_enriched.iloc[40:]]:
+        writer.write(chunk)
+    writer.close()
+    raw = pd.read_csv(filepath, sep=';', dtype=str)
+    assert len(raw) == len(prod_enriched)
+    assert not (raw['Job order'] == 'Job order').any()